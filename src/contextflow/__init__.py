@@ -1,8 +1,41 @@
-from contextflow.core.compactor import MessageCompactor
+from contextflow.core.boilerplate import (
+    BoilerplateCompactor,
+    BoilerplateLibrary,
+)
+from contextflow.core.compactor import (
+    MessageCompactor,
+    on_partial_summary as partial_summaries,
+)
+from contextflow.core.deadline import Deadline, DeadlineCompactor
+from contextflow.core.density import DensityAnnotator
+from contextflow.core.excerpt import ExcerptPolicy
+from contextflow.core.extractive import ExtractiveCompactor
+from contextflow.core.factsheet import FactSheetCompactor
+from contextflow.core.heuristic import heuristic_scores
+from contextflow.core.index import Prefilter
+from contextflow.core.planner import Planner, trim_oldest
+from contextflow.core.prefetch import CancellableCompactor, Prefetch
 from contextflow.core.scorer import MessageScorer
-from typing import List, Dict
-from contextflow.core.strategies import balanced_strategy
+from contextflow.core.recency import (
+    RecencyModel,
+    WindowRecency,
+    recency_from_config,
+)
+from contextflow.core.spans import SpanSplitter
+from contextflow.core.store import ConversationStore
+from contextflow.core.structure import StructureCompactor
+from contextflow.core.tuning import (
+    TraceRecorder,
+    apply_recency_profile,
+    load_profile,
+    strategy_options,
+)
+from typing import Callable, List, Dict, Optional, Union
+from contextflow.core.strategies import get_strategy
 from contextflow.utils.tokenizer import count_tokens
+from contextflow.utils.usage import track_usage, usage_totals
+import functools
+import threading
 import time
 
 
@@ -11,33 +44,222 @@ class ContextFlow:
         self,
         scoring_model: str = "gemini",
         summarizing_model: str = "gemini",
+        recency: Optional[Union[RecencyModel, Dict]] = None,
+        compaction: str = "llm",
+        structure_compaction: bool = True,
+        planner: Optional[Planner] = None,
+        score_format: str = "json",
+        score_logprobs: bool = False,
+        scoring_excerpt: Optional[ExcerptPolicy] = None,
+        span_splitting: Union[bool, SpanSplitter] = False,
+        prefilter: Optional[Prefilter] = None,
+        annotator: Optional[DensityAnnotator] = None,
+        boilerplate: Optional[BoilerplateLibrary] = None,
+        streaming_summaries: bool = False,
+        profile: Optional[Union[str, Dict]] = None,
+        trace_recorder: Optional[TraceRecorder] = None,
     ):
         """
         Initialize the ContextFlow optimizer.
 
         Args:
             scoring_model: The LLM provider to use for scoring message relevance.
-                          Options: "gemini", "groq". Defaults to "gemini".
+                          Options: "gemini", "groq", a list of providers to
+                          hedge and fail over between (e.g. ["gemini",
+                          "anthropic"]), or an object with the same interface
+                          as LLMClient. Defaults to "gemini".
             summarizing_model: The LLM provider to use for summarizing messages.
-                              Options: "gemini", "groq". Defaults to "gemini".
+                              Same options as scoring_model. Defaults to "gemini".
+            recency: How recent messages are boosted and how many are always
+                     preserved. Either a RecencyModel or a config dictionary
+                     such as {"type": "exponential", "half_life": 4}.
+                     Defaults to a flat +1.0 bonus on the last five messages.
+            compaction: How messages are summarized. "llm" asks summarizing_model
+                        for a summary; "extractive" keeps the most informative
+                        sentences locally, with no network call; "factsheet"
+                        extracts each message's facts once with
+                        summarizing_model and renders the accumulated fact
+                        sheet instead of writing new prose every turn.
+                        Defaults to "llm".
+            structure_compaction: Whether JSON payloads, log dumps and
+                                  tracebacks are compacted before scoring.
+                                  Defaults to True.
+            planner: Chooses between pass-through, recency trim, local scoring
+                     and full LLM optimization for each call. Defaults to a
+                     Planner with default thresholds.
+            score_format: Output format of LLM scores, "json" or "digits".
+                          "digits" asks for one digit per message and needs
+                          far fewer completion tokens. Defaults to "json".
+            score_logprobs: With "digits", weight each digit by its token
+                            probability where the provider supports it.
+                            Defaults to False.
+            scoring_excerpt: How oversized messages are excerpted in scoring
+                             prompts (head/tail windows, goal-term snippets
+                             and a per-message token cap). The full messages
+                             are still what gets kept or summarized.
+                             Defaults to an ExcerptPolicy with a 256-token
+                             cap; ExcerptPolicy(max_tokens=None) disables it.
+            span_splitting: Whether long messages are split into paragraph
+                            or sentence spans that are scored and kept
+                            independently, then put back together inside
+                            their message. True uses a default SpanSplitter;
+                            a SpanSplitter configures it. Defaults to False.
+            prefilter: BM25 prefilter kept up to date across turns. When
+                       given, only the best lexical matches for the goal and
+                       the most recent messages are scored by the LLM.
+                       Defaults to None (every message is scored).
+            annotator: Store of goal-independent message features, filled in
+                       the background by observe(). Local scoring and
+                       heuristic fallbacks combine them with the goal at
+                       optimize time. Defaults to a new DensityAnnotator.
+            boilerplate: Library of boilerplate blocks (system prompts,
+                         policies, tool schemas, canned replies), usually
+                         shared by every ContextFlow in the process. Known
+                         blocks get precomputed scores and are summarized
+                         with precomputed replacements; blocks recurring
+                         across conversations are learned from the traffic
+                         of optimize(). Defaults to None.
+            streaming_summaries: With "llm" compaction, whether summaries
+                                 are streamed and stopped as soon as they
+                                 fill the budget the strategy left for
+                                 them, ending at a sentence end. Defaults
+                                 to False.
+            profile: Tuned settings written by StrategyTuner, or the path
+                     of their JSON file. Its strategy options are used
+                     whenever optimize() runs that strategy by name, and its
+                     preserve tiers are applied to the recency model unless
+                     a RecencyModel instance is given. Defaults to None.
+            trace_recorder: Records the scores and token counts each
+                            strategy run is given, for StrategyTuner to
+                            replay. Defaults to None.
+
+        Raises:
+            ValueError: If an unknown compaction mode or score format is
+                        specified.
+        """
+        if isinstance(profile, str):
+            profile = load_profile(profile)
+        self.strategy_options = strategy_options(profile) if profile else {}
+        if profile and not isinstance(recency, RecencyModel):
+            recency = apply_recency_profile(recency, profile)
+
+        if recency is None:
+            recency = WindowRecency()
+        elif isinstance(recency, dict):
+            recency = recency_from_config(recency)
+
+        self.recency = recency
+        self.annotator = (
+            annotator if annotator is not None else DensityAnnotator()
+        )
+        if compaction == "llm":
+            self.message_compactor = MessageCompactor(
+                model=summarizing_model, streaming=streaming_summaries
+            )
+        elif compaction == "extractive":
+            self.message_compactor = ExtractiveCompactor()
+        elif compaction == "factsheet":
+            self.message_compactor = FactSheetCompactor(model=summarizing_model)
+        else:
+            raise ValueError(f"Unknown compaction mode: {compaction}")
+        self.boilerplate = boilerplate
+        if boilerplate is not None:
+            self.message_compactor = BoilerplateCompactor(
+                self.message_compactor, boilerplate
+            )
+        self.message_scorer = MessageScorer(
+            model=scoring_model,
+            recency=recency,
+            score_format=score_format,
+            use_logprobs=score_logprobs,
+            excerpt=scoring_excerpt,
+            prefilter=prefilter,
+            annotator=self.annotator,
+            boilerplate=boilerplate,
+        )
+        self.structure_compactor = (
+            StructureCompactor() if structure_compaction else None
+        )
+        self.planner = planner if planner is not None else Planner()
+        self.local_compactor = ExtractiveCompactor()
+        self._prefetch: Optional[Prefetch] = None
+        self._prefetch_lock = threading.Lock()
+        if span_splitting is True:
+            span_splitting = SpanSplitter()
+        self.span_splitter = span_splitting or None
+        self.trace_recorder = trace_recorder
+
+    def observe(self, messages: List[Dict[str, str]]):
+        """
+        Start analysing new messages in the background as they arrive.
+
+        The goal-independent features computed here (numbers, IDs, errors,
+        decisions, filler) are reused by later optimize() calls, which then
+        only have to add the goal-specific signal.
+
+        Args:
+            messages: The new messages, or the whole history.
+
+        Returns:
+            Future that completes once the messages are analysed.
+        """
+        return self.annotator.observe(messages)
+
+    def score_goals(
+        self,
+        messages: Union[List[Dict[str, str]], ConversationStore],
+        goals: List[str],
+    ) -> Dict[str, List[float]]:
+        """
+        Score a conversation against several goals in one batched pass.
+
+        The scores are kept by the scorer, so later optimize() calls for any
+        of these goals, or for a goal with the same content words, reuse
+        them instead of running a fresh scoring pass.
+
+        Args:
+            messages: List of message dictionaries or a ConversationStore.
+            goals: The goals to score against.
+
+        Returns:
+            Dictionary mapping each goal to its list of relevance scores.
         """
-        self.message_compactor = MessageCompactor(model=summarizing_model)
-        self.message_scorer = MessageScorer(model=scoring_model)
+        return self.message_scorer.score_goals(messages=messages, goals=goals)
 
     def optimize(
         self,
-        messages: List[Dict[str, str]],
+        messages: Union[List[Dict[str, str]], ConversationStore],
         goal: str,
         max_token_count: int = 500,
+        strategy: Union[str, Callable] = "balanced",
+        deadline_ms: Optional[float] = None,
+        on_partial_summary: Optional[Callable[[str, bool], None]] = None,
     ):
         """
         Optimize a conversation by reducing token count while preserving important information.
 
         Args:
-            messages: List of message dictionaries with "role" and "content" keys.
+            messages: List of message dictionaries with "role" and "content" keys,
+                      or a ConversationStore. Messages kept from a store are
+                      returned as StoredMessage references into its log.
             goal: The goal or purpose of the agent to guide relevance scoring.
             max_token_count: Maximum number of tokens allowed in the optimized output.
                            Defaults to 500.
+            strategy: Name of a registered strategy ("balanced", "aggressive",
+                      "conservative") or a strategy function. "conservative"
+                      never calls the summarization LLM. Defaults to "balanced".
+            deadline_ms: Optional latency budget in milliseconds. Scoring
+                         batches that miss their share of it fall back to
+                         local heuristic scores (or a neutral score when
+                         even those would be late), structure compaction
+                         stops at it, and summaries that cannot finish in
+                         time are replaced by extraction or truncation.
+            on_partial_summary: Called as on_partial_summary(text, final)
+                                with the summary while it is written: with
+                                each longer prefix ending at a sentence end
+                                if streaming_summaries is on, then with the
+                                final summary. Lets the caller start
+                                building its downstream request early.
 
         Returns:
             Dictionary containing:
@@ -47,29 +269,328 @@ class ContextFlow:
                     - "reduction_pct": Percentage reduction in tokens
                     - "tokens_saved": Number of tokens saved
                     - "time_taken_ms": Time taken for optimization in milliseconds
+                    - "tokens_before": Token count of the input
+                    - "degradations": Fallbacks taken to meet deadline_ms
+                    - "plan": The plan the Planner chose ("passthrough",
+                              "recency_trim", "local_scoring" or "full")
+                    - "prefetch": "used" if a matching prefetch() was
+                                  reused, "cancelled" if a pending one was
+                                  cancelled, otherwise None
+                    - "llm_usage": Provider calls made and their input
+                                   tokens (split into cached and uncached
+                                   by the provider's prompt cache) and
+                                   output tokens
         """
         start_time = time.time_ns() // 1_000_000
 
-        scores = self.message_scorer.score_messages(
-            messages=messages, goal=goal
-        )
+        strategy = self._strategy(strategy)
 
-        optimized = balanced_strategy(
-            messages, scores, max_token_count, self.message_compactor
+        deadline = Deadline(deadline_ms) if deadline_ms is not None else None
+        prefetch = self._settle_prefetch(
+            messages, goal, max_token_count, deadline
         )
 
         tokens_before = count_tokens(messages)
+        degradations = []
+
+        with track_usage() as calls, partial_summaries(on_partial_summary):
+            optimized, plan = self._run(
+                messages,
+                tokens_before,
+                goal,
+                max_token_count,
+                strategy,
+                deadline,
+                degradations,
+            )
+
         tokens_after = count_tokens(optimized)
-        reduction_pct = ((tokens_before - tokens_after) / tokens_before) * 100
+        reduction_pct = (
+            ((tokens_before - tokens_after) / tokens_before) * 100
+            if tokens_before
+            else 0.0
+        )
 
         now = time.time_ns() // 1_000_000
 
         return {
             "messages": optimized,
             "analytics": {
+                "tokens_before": tokens_before,
                 "tokens_after": tokens_after,
                 "reduction_pct": reduction_pct,
                 "tokens_saved": tokens_before - tokens_after,
                 "time_taken_ms": now - start_time,
+                "degradations": degradations,
+                "plan": plan["plan"],
+                "prefetch": prefetch,
+                "llm_usage": usage_totals(calls),
             },
         }
+
+    def prefetch(
+        self,
+        messages: Union[List[Dict[str, str]], ConversationStore],
+        goal: str,
+        max_token_count: int = 500,
+        strategy: Union[str, Callable] = "balanced",
+    ) -> Prefetch:
+        """
+        Start optimizing the current history in the background.
+
+        Call this right after sending a turn to the downstream LLM. The
+        scores and summaries it produces are cached, so the next optimize()
+        call, on the same history plus the new messages, only has to score
+        the new messages, and summaries of grown buckets only summarize
+        what was added. If that call has another goal or budget, or its
+        history does not start with this one (messages were edited or
+        removed), the prefetch is cancelled. With a deadline_ms, that call
+        waits for an unfinished prefetch only within the deadline.
+
+        Args:
+            messages: The current history.
+            goal: The goal the next optimize() call will use.
+            max_token_count: Budget the next optimize() call will use.
+            strategy: Strategy the next optimize() call will use.
+
+        Returns:
+            A Prefetch handle, e.g. to wait() for or cancel() it.
+        """
+        strategy = self._strategy(strategy)
+
+        snapshot = list(messages)
+        prefetch = Prefetch(snapshot, goal, max_token_count)
+        prefetch.start(
+            lambda: self._run(
+                snapshot,
+                count_tokens(snapshot),
+                goal,
+                max_token_count,
+                strategy,
+                None,
+                [],
+                cancelled=prefetch.cancelled,
+            )
+        )
+        with self._prefetch_lock:
+            previous, self._prefetch = self._prefetch, prefetch
+        if previous is not None:
+            previous.cancel()
+        return prefetch
+
+    def _strategy(self, strategy: Union[str, Callable]) -> Callable:
+        """
+        Strategy function for a name, with the profile's options for it.
+
+        Raises:
+            ValueError: If no strategy is registered under the name.
+        """
+        if not isinstance(strategy, str):
+            return strategy
+        options = self.strategy_options.get(strategy)
+        if options:
+            return functools.partial(get_strategy(strategy), **options)
+        return get_strategy(strategy)
+
+    def _settle_prefetch(
+        self,
+        messages: List[Dict[str, str]],
+        goal: str,
+        max_token_count: int,
+        deadline: Optional[Deadline],
+    ) -> Optional[str]:
+        """
+        Wait for a pending prefetch that matches the call, or cancel it.
+
+        With a deadline, the wait is bounded by the scoring share of it. A
+        prefetch still running then is cancelled, and the call goes on
+        with whatever it already cached.
+
+        Returns:
+            "used" or "cancelled" if there was a pending prefetch, else None.
+        """
+        with self._prefetch_lock:
+            prefetch, self._prefetch = self._prefetch, None
+        if prefetch is None:
+            return None
+        if prefetch.matches(messages, goal, max_token_count):
+            timeout = None
+            if deadline is not None:
+                share = self._scoring_share(deadline.deadline_ms)
+                timeout = deadline.sub(share).remaining()
+            # It is already doing the calls this optimize would make
+            if prefetch.wait(timeout=timeout):
+                return "used"
+        prefetch.cancel()
+        return "cancelled"
+
+    def _run(
+        self,
+        messages: List[Dict[str, str]],
+        tokens_before: int,
+        goal: str,
+        max_token_count: int,
+        strategy: Callable,
+        deadline: Optional[Deadline],
+        degradations: List[Dict],
+        cancelled: Optional[threading.Event] = None,
+    ):
+        """
+        Structure compaction, planning and the chosen plan.
+
+        Returns:
+            (optimized messages, plan dictionary from the Planner)
+        """
+        compacted = messages
+        if (
+            tokens_before > max_token_count
+            and self.structure_compactor is not None
+        ):
+            compacted = self.structure_compactor.compact(messages, deadline)
+
+        # Prefetches see the same history again in the real call, so only
+        # the real call counts towards learning boilerplate
+        if self.boilerplate is not None and cancelled is None:
+            self.boilerplate.observe(compacted)
+
+        plan = self.planner.plan(
+            compacted,
+            max_token_count,
+            scoring_latency=self.message_scorer.expected_latency,
+            summary_latency=getattr(
+                self.message_compactor, "expected_latency", None
+            ),
+            deadline_ms=(
+                deadline.remaining() * 1000 if deadline is not None else None
+            ),
+        )
+        if plan["reason"] == "predicted to miss deadline":
+            degradations.append(
+                {
+                    "stage": "plan",
+                    "fallback": plan["plan"],
+                    "reason": plan["reason"],
+                }
+            )
+
+        match plan["plan"]:
+            case "passthrough":
+                optimized = list(compacted)
+            case "recency_trim":
+                optimized = trim_oldest(compacted, max_token_count)
+            case "local_scoring":
+                split = self._split(compacted)
+                units = split.units if split else compacted
+                scores = self.recency.apply(
+                    units, heuristic_scores(units, goal, self.annotator)
+                )
+                if self.trace_recorder is not None and cancelled is None:
+                    self.trace_recorder.record(units, scores, max_token_count)
+                compactor = self.local_compactor
+                if deadline is not None:
+                    compactor = DeadlineCompactor(
+                        compactor, deadline, degradations, fallback=compactor
+                    )
+                optimized = strategy(
+                    units,
+                    scores,
+                    max_token_count,
+                    compactor,
+                    recency=self.recency,
+                )
+                if split:
+                    optimized = split.reassemble(optimized)
+            case _:
+                split = self._split(compacted)
+                optimized = self._optimize_full(
+                    split.units if split else compacted,
+                    goal,
+                    max_token_count,
+                    strategy,
+                    deadline,
+                    degradations,
+                    cancelled,
+                )
+                if split and optimized is not None:
+                    optimized = split.reassemble(optimized)
+
+        return optimized, plan
+
+    def _optimize_full(
+        self,
+        messages: List[Dict[str, str]],
+        goal: str,
+        max_token_count: int,
+        strategy: Callable,
+        deadline: Optional[Deadline],
+        degradations: List[Dict],
+        cancelled: Optional[threading.Event] = None,
+    ) -> Optional[List[Dict[str, str]]]:
+        """
+        LLM scoring followed by the strategy, bounded by deadline if given.
+
+        Returns:
+            The optimized list of messages, or None if cancelled was set
+            before the strategy ran.
+        """
+        scoring_deadline = fallback_deadline = None
+        compactor = self.message_compactor
+        if deadline is not None:
+            share = self._scoring_share(deadline.deadline_ms)
+            scoring_deadline = deadline.sub(share)
+            # Heuristic fallbacks get half of what is left after scoring
+            fallback_deadline = deadline.sub(share + (1 - share) / 2)
+            compactor = DeadlineCompactor(compactor, deadline, degradations)
+
+        scores = self.message_scorer.score_messages(
+            messages=messages,
+            goal=goal,
+            deadline=scoring_deadline,
+            degradations=degradations,
+            fallback_deadline=fallback_deadline,
+            cancelled=cancelled,
+        )
+        if cancelled is not None and cancelled.is_set():
+            return None
+        if self.trace_recorder is not None and cancelled is None:
+            self.trace_recorder.record(messages, scores, max_token_count)
+        if cancelled is not None:
+            compactor = CancellableCompactor(compactor, cancelled)
+
+        return strategy(
+            messages,
+            scores,
+            max_token_count,
+            compactor,
+            recency=self.recency,
+        )
+
+    def _split(self, messages: List[Dict[str, str]]):
+        """
+        Split long messages into spans if span splitting is enabled.
+
+        Returns:
+            A SplitConversation, or None if splitting is disabled or no
+            message was long enough to split.
+        """
+        if self.span_splitter is None:
+            return None
+        split = self.span_splitter.split(messages)
+        return split if split.was_split else None
+
+    def _scoring_share(self, deadline_ms: float) -> float:
+        """
+        Fraction of a deadline given to scoring, leaving room for the
+        expected summarization latency.
+
+        Args:
+            deadline_ms: The whole latency budget in milliseconds.
+
+        Returns:
+            Share of the budget for scoring, between 0.2 and 0.9.
+        """
+        expected = getattr(self.message_compactor, "expected_latency", None)
+        if expected is None:
+            return 0.6
+        share = 1 - (expected * 1000) / deadline_ms
+        return max(0.2, min(0.9, share))
@@ -0,0 +1,240 @@
+"""
+Command line entry point: run the optimization service or load-test it
+"""
+
+import asyncio
+import click
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+
+def _model(name: str, latency_ms: float):
+    """Provider name, or a fake provider with the given median latency."""
+    if name != "fake":
+        return name
+
+    from contextflow.utils.providers import fake
+
+    return fake.LLM(latency=fake.lognormal_latency(latency_ms / 1000))
+
+
+@click.group()
+def cli():
+    """ContextFlow optimization service."""
+
+
+@cli.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8000, show_default=True, type=int)
+@click.option("--scoring-model", default="gemini", show_default=True)
+@click.option("--summarizing-model", default="gemini", show_default=True)
+@click.option(
+    "--fake-latency-ms",
+    default=300.0,
+    show_default=True,
+    help="Median latency of the fake provider.",
+)
+@click.option("--max-concurrency", default=32, show_default=True, type=int)
+def serve(
+    host,
+    port,
+    scoring_model,
+    summarizing_model,
+    fake_latency_ms,
+    max_concurrency,
+):
+    """Serve POST /optimize over HTTP."""
+    try:
+        import uvicorn
+    except ImportError:
+        raise click.ClickException(
+            'serve needs uvicorn: pip install "contextflow-ai[server]"'
+        )
+
+    from contextflow import ContextFlow
+    from contextflow.server.app import OptimizationServer
+
+    flow = ContextFlow(
+        scoring_model=_model(scoring_model, fake_latency_ms),
+        summarizing_model=_model(summarizing_model, fake_latency_ms),
+    )
+    app = OptimizationServer(flow, max_concurrency=max_concurrency)
+    uvicorn.run(app, host=host, port=port, log_level="warning")
+
+
+@cli.command()
+@click.option(
+    "--url",
+    default=None,
+    help="Base URL of a running server. Defaults to an in-process server "
+    "with a fake provider.",
+)
+@click.option("--requests", default=200, show_default=True, type=int)
+@click.option("--concurrency", default=20, show_default=True, type=int)
+@click.option("--conversations", default=10, show_default=True, type=int)
+@click.option("--length", default=60, show_default=True, type=int)
+@click.option(
+    "--fake-latency-ms",
+    default=300.0,
+    show_default=True,
+    help="Median latency of the in-process fake provider.",
+)
+def loadtest(
+    url, requests, concurrency, conversations, length, fake_latency_ms
+):
+    """Send optimize requests and report latency and throughput."""
+    from contextflow import ContextFlow
+    from contextflow.server.app import OptimizationServer
+    from contextflow.server.loadgen import run_load
+
+    target = url
+    if target is None:
+        model = _model("fake", fake_latency_ms)
+        target = OptimizationServer(
+            ContextFlow(scoring_model=model, summarizing_model=model)
+        )
+
+    report = asyncio.run(
+        run_load(
+            target,
+            requests=requests,
+            concurrency=concurrency,
+            conversations=conversations,
+            length=length,
+        )
+    )
+
+    table = Table(title="Load test")
+    table.add_column("Metric")
+    table.add_column("Value", justify="right")
+    for name, value in report.items():
+        shown = f"{value:.1f}" if isinstance(value, float) else str(value)
+        table.add_row(name, shown)
+    if not isinstance(target, str):
+        for name, value in target.stats.items():
+            table.add_row(f"server {name}", str(value))
+    console.print(table)
+
+
+@cli.command()
+@click.option("--cases", default=20, show_default=True, type=int)
+@click.option("--length", default=60, show_default=True, type=int)
+@click.option("--needles", default=3, show_default=True, type=int)
+@click.option(
+    "--budget",
+    "budgets",
+    multiple=True,
+    type=int,
+    default=(150, 300),
+    show_default=True,
+    help="max_token_count to evaluate; repeat for several.",
+)
+@click.option(
+    "--fake-latency-ms",
+    default=0.0,
+    show_default=True,
+    help="Latency of each fake provider call.",
+)
+@click.option("--label", default=None, help="Name of the run, e.g. a release.")
+@click.option("--output", default=None, help="Write the report to this JSON.")
+@click.option(
+    "--baseline",
+    default=None,
+    help="Report of an earlier run to compare against.",
+)
+def evaluate(
+    cases, length, needles, budgets, fake_latency_ms, label, output, baseline
+):
+    """Measure fact retention against cost on needle conversations."""
+    from contextflow.evaluation.harness import (
+        EvaluationHarness,
+        build_report,
+        compare_reports,
+        default_scorers,
+        load_report,
+        save_report,
+    )
+    from contextflow.evaluation.needles import make_needle_cases
+    from contextflow.utils.providers import fake
+
+    harness = EvaluationHarness(
+        make_needle_cases(cases, length=length, needles=needles),
+        scorers=default_scorers(fake.fixed_latency(fake_latency_ms / 1000)),
+        budgets=budgets,
+    )
+    report = build_report(harness.run(), label=label)
+
+    table = Table(title="Retention vs cost (* = Pareto frontier)")
+    for column in ["strategy", "scorer", "budget", "retention", "saved"]:
+        table.add_column(column)
+    table.add_column("calls", justify="right")
+    table.add_column("ms", justify="right")
+    for row in report["rows"]:
+        table.add_row(
+            ("* " if row["pareto"] else "  ") + row["strategy"],
+            row["scorer"],
+            str(row["max_token_count"]),
+            f"{row['retention']:.0%}",
+            f"{row['tokens_saved']:.0f}",
+            f"{row['llm_calls']:.1f}",
+            f"{row['latency_ms']:.1f}",
+        )
+    console.print(table)
+
+    if baseline is not None:
+        for change in compare_reports(load_report(baseline), report):
+            if change["retention"] < 0:
+                console.print(
+                    f"[red]{change['strategy']}/{change['scorer']}/"
+                    f"{change['max_token_count']}: retention "
+                    f"{change['retention']:+.0%}[/red]"
+                )
+    if output is not None:
+        save_report(report, output)
+
+
+@cli.command()
+@click.argument("traces")
+@click.option(
+    "--budget",
+    default=None,
+    type=int,
+    help="max_token_count to tune for. Defaults to each trace's own.",
+)
+@click.option("--min-retention", default=0.9, show_default=True, type=float)
+@click.option("--trials", default=300, show_default=True, type=int)
+@click.option("--seed", default=0, show_default=True, type=int)
+@click.option(
+    "--output",
+    default="contextflow-profile.json",
+    show_default=True,
+    help="Where to write the profile for ContextFlow(profile=...).",
+)
+def tune(traces, budget, min_retention, trials, seed, output):
+    """Tune strategy thresholds by replaying recorded TRACES."""
+    from contextflow.core.tuning import StrategyTuner, load_traces, save_profile
+
+    tuner = StrategyTuner(
+        load_traces(traces),
+        max_token_count=budget,
+        min_retention=min_retention,
+        trials=trials,
+        seed=seed,
+    )
+    profile = tuner.tune()
+
+    table = Table(title="Replayed traces")
+    table.add_column("Metric")
+    table.add_column("Defaults", justify="right")
+    table.add_column("Tuned", justify="right")
+    for name, value in profile["metrics"].items():
+        table.add_row(name, f"{profile['baseline'][name]:.2f}", f"{value:.2f}")
+    console.print(table)
+    console.print(profile["strategy_options"], profile["recency"])
+    save_profile(profile, output)
+
+
+if __name__ == "__main__":
+    cli()
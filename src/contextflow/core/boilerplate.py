@@ -0,0 +1,433 @@
+"""
+Shared library of boilerplate blocks recognized across conversations
+"""
+
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Set
+from contextflow.core.compactor import fit_summary
+from contextflow.core.extractive import ExtractiveCompactor
+from contextflow.core.score_cache import message_key
+import hashlib
+import json
+import re
+import threading
+import zlib
+
+_WORD = re.compile(r"\w+")
+_MOD = (1 << 61) - 1
+_BASE = 1_000_003
+
+
+def normalize(text: str) -> str:
+    """
+    Normalized form of a text for exact matching: lowercased words.
+    """
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def fingerprint(text: str, shingle_words: int = 5, sample: int = 4) -> Set[int]:
+    """
+    Sampled word-shingle hashes of a text.
+
+    A polynomial rolling hash runs over the word hashes, so each shingle of
+    shingle_words consecutive words costs O(1). Only hashes divisible by
+    sample are kept, which keeps the index small while near-duplicate texts
+    still share most of their sampled shingles.
+
+    Args:
+        text: The text.
+        shingle_words: Number of words per shingle.
+        sample: Keep one in about this many shingles.
+
+    Returns:
+        Set of shingle hashes. Texts shorter than one shingle give the hash
+        of the whole text.
+    """
+    words = [zlib.crc32(word.encode()) for word in _WORD.findall(text.lower())]
+    if len(words) < shingle_words:
+        return {hash_words(words)} if words else set()
+
+    top = pow(_BASE, shingle_words - 1, _MOD)
+    value = hash_words(words[:shingle_words])
+    hashes = [value]
+    for i in range(shingle_words, len(words)):
+        value = (value - words[i - shingle_words] * top) * _BASE + words[i]
+        value %= _MOD
+        hashes.append(value)
+
+    sampled = {h for h in hashes if h % sample == 0}
+    return sampled or set(hashes[:1])
+
+
+def hash_words(words: List[int]) -> int:
+    value = 0
+    for word in words:
+        value = (value * _BASE + word) % _MOD
+    return value
+
+
+def _digest(normalized: str) -> str:
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+
+class BoilerplateBlock:
+    def __init__(
+        self,
+        block_id: str,
+        tokens: int,
+        score: float,
+        replacement: str,
+        shingles: Set[int],
+        count: int = 0,
+    ):
+        """
+        A known boilerplate text.
+
+        Args:
+            block_id: Digest of the normalized text.
+            tokens: Token count of the text.
+            score: Goal-independent relevance score used instead of scoring
+                   it with the LLM.
+            replacement: Compressed text used instead of summarizing it.
+            shingles: Fingerprint of the text.
+            count: Number of conversations it was seen in before it was
+                   learned (0 for registered blocks).
+        """
+        self.block_id = block_id
+        self.tokens = tokens
+        self.score = score
+        self.replacement = replacement
+        self.shingles = shingles
+        self.count = count
+
+    def to_dict(self) -> Dict:
+        return {
+            "block_id": self.block_id,
+            "tokens": self.tokens,
+            "score": self.score,
+            "replacement": self.replacement,
+            "shingles": sorted(self.shingles),
+            "count": self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BoilerplateBlock":
+        return cls(
+            data["block_id"],
+            data["tokens"],
+            data["score"],
+            data["replacement"],
+            set(data["shingles"]),
+            data.get("count", 0),
+        )
+
+
+class BoilerplateLibrary:
+    def __init__(
+        self,
+        min_count: int = 20,
+        min_tokens: int = 30,
+        threshold: float = 0.8,
+        learned_score: float = 5.0,
+        replacement_ratio: float = 0.2,
+        max_blocks: int = 5000,
+        max_candidates: int = 100_000,
+        shingle_words: int = 5,
+    ):
+        """
+        Initialize the BoilerplateLibrary.
+
+        System prompts, policy texts, tool schemas and canned replies recur
+        across many conversations. A library recognizes them, exactly or
+        nearly (by shingle containment), and supplies a precomputed score,
+        token count and compressed replacement, so they are not scored or
+        summarized again in every conversation. One library can be shared
+        by every ContextFlow in a process, and saved and loaded to share it
+        across processes.
+
+        Blocks are registered explicitly or learned from traffic: a message
+        seen in min_count conversations becomes a block. A learned block
+        gets learned_score and an extractive summary as its replacement.
+
+        Args:
+            min_count: Number of conversations a message has to appear in
+                       before it is learned as a block.
+            min_tokens: Messages shorter than this are never learned.
+            threshold: Share of a message's shingles a block has to contain
+                       for the message to match it.
+            learned_score: Score of learned blocks. The default is in the
+                           balanced strategy's summarize band, so they are
+                           folded into the summary through their replacement
+                           at no LLM cost.
+            replacement_ratio: Length of a learned block's replacement as a
+                               fraction of its tokens.
+            max_blocks: Number of blocks kept before the least recently
+                        matched ones are evicted.
+            max_candidates: Number of not yet learned messages counted.
+            shingle_words: Number of words per shingle.
+        """
+        self.min_count = min_count
+        self.min_tokens = min_tokens
+        self.threshold = threshold
+        self.learned_score = learned_score
+        self.replacement_ratio = replacement_ratio
+        self.max_blocks = max_blocks
+        self.max_candidates = max_candidates
+        self.shingle_words = shingle_words
+
+        self._blocks: "OrderedDict[str, BoilerplateBlock]" = OrderedDict()
+        self._postings: Dict[int, Set[str]] = {}
+        # Messages not learned yet and the distinct messages that followed
+        self._candidates: "OrderedDict[str, Set[str]]" = OrderedDict()
+        self._compactor = ExtractiveCompactor()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def register(
+        self,
+        content: str,
+        score: float,
+        replacement: Optional[str] = None,
+    ) -> BoilerplateBlock:
+        """
+        Add a known block, e.g. a tenant's system prompt.
+
+        Args:
+            content: The block's text.
+            score: Relevance score to use for it.
+            replacement: Compressed text to summarize it with. Defaults to
+                         an extractive summary.
+
+        Returns:
+            The block.
+        """
+        block = self._build(content, score, replacement)
+        with self._lock:
+            self._add(block)
+        return block
+
+    def match(self, message: Dict[str, str]) -> Optional[BoilerplateBlock]:
+        """
+        The block a message is an exact or near copy of.
+
+        Args:
+            message: Message dictionary.
+
+        Returns:
+            The block, or None.
+        """
+        content = message.get("content", "")
+        if not self._blocks:
+            return None
+
+        block_id = _digest(normalize(content))
+        with self._lock:
+            block = self._blocks.get(block_id)
+            if block is not None:
+                self._blocks.move_to_end(block_id)
+                return block
+
+        # Near matches of short messages would mostly be coincidences
+        if len(content) < self.min_tokens * 4:
+            return None
+        shingles = fingerprint(content, self.shingle_words)
+        with self._lock:
+            shared = Counter()
+            for shingle in shingles:
+                for candidate in self._postings.get(shingle, ()):
+                    shared[candidate] += 1
+            if not shared:
+                return None
+
+            block_id, count = shared.most_common(1)[0]
+            block = self._blocks[block_id]
+            # Relative to the larger fingerprint, so a short block inside a
+            # long message is no match either
+            containment = count / max(len(shingles), len(block.shingles))
+            if containment < self.threshold:
+                return None
+            self._blocks.move_to_end(block_id)
+            return block
+
+    def observe(self, messages: List[Dict[str, str]]) -> List[BoilerplateBlock]:
+        """
+        Count the messages of a conversation and learn those seen in
+        min_count conversations.
+
+        A conversation is sent again on every turn, so occurrences are told
+        apart by the message that follows: the same system prompt followed
+        by min_count different messages was seen in that many
+        conversations. The last message is counted once something follows
+        it.
+
+        Args:
+            messages: The messages of a conversation, or the whole history
+                      so far.
+
+        Returns:
+            The blocks learned from these messages.
+        """
+        occurrences = []
+        for message, following in zip(messages, messages[1:]):
+            content = message.get("content", "")
+            if len(content) >= self.min_tokens * 4:
+                occurrences.append(
+                    (
+                        _digest(normalize(content)),
+                        content,
+                        message_key(following),
+                    )
+                )
+
+        ready = []
+        with self._lock:
+            for block_id, content, follower in occurrences:
+                block = self._blocks.get(block_id)
+                if block is not None:
+                    continue
+                followers = self._candidates.pop(block_id, set())
+                followers.add(follower)
+                if len(followers) >= self.min_count:
+                    ready.append((content, len(followers)))
+                    continue
+                self._candidates[block_id] = followers
+            while len(self._candidates) > self.max_candidates:
+                self._candidates.popitem(last=False)
+
+        learned = []
+        for content, count in ready:
+            block = self._build(content, self.learned_score, None)
+            block.count = count
+            with self._lock:
+                self._add(block)
+            learned.append(block)
+        return learned
+
+    def save(self, path: str):
+        """Write the blocks to a JSON file."""
+        with self._lock:
+            blocks = [block.to_dict() for block in self._blocks.values()]
+        with open(path, "w") as f:
+            json.dump({"blocks": blocks}, f)
+
+    @classmethod
+    def load(cls, path: str, **options) -> "BoilerplateLibrary":
+        """
+        Read a library written by save().
+
+        Args:
+            path: The JSON file.
+            **options: BoilerplateLibrary options.
+
+        Returns:
+            The library.
+        """
+        library = cls(**options)
+        with open(path) as f:
+            data = json.load(f)
+        for block in data["blocks"]:
+            library._add(BoilerplateBlock.from_dict(block))
+        return library
+
+    def _build(
+        self, content: str, score: float, replacement: Optional[str]
+    ) -> BoilerplateBlock:
+        tokens = len(content) // 4
+        if replacement is None:
+            replacement = self._compactor.summarize(
+                [{"role": "system", "content": content}],
+                max(1, int(tokens * self.replacement_ratio)),
+            )
+        return BoilerplateBlock(
+            _digest(normalize(content)),
+            tokens,
+            score,
+            replacement,
+            fingerprint(content, self.shingle_words),
+        )
+
+    def _add(self, block: BoilerplateBlock):
+        self._remove(block.block_id)
+        self._blocks[block.block_id] = block
+        for shingle in block.shingles:
+            self._postings.setdefault(shingle, set()).add(block.block_id)
+        while len(self._blocks) > self.max_blocks:
+            self._remove(next(iter(self._blocks)))
+
+    def _remove(self, block_id: str):
+        block = self._blocks.pop(block_id, None)
+        if block is None:
+            return
+        for shingle in block.shingles:
+            posting = self._postings.get(shingle)
+            if posting is not None:
+                posting.discard(block_id)
+                if not posting:
+                    del self._postings[shingle]
+
+
+class BoilerplateCompactor:
+    def __init__(self, compactor, library: BoilerplateLibrary):
+        """
+        Wrap a compactor so known boilerplate is summarized with its
+        precomputed replacement instead of being sent to the LLM.
+
+        Args:
+            compactor: The compactor for everything else.
+            library: The boilerplate library.
+        """
+        self.compactor = compactor
+        self.library = library
+
+    @property
+    def expected_latency(self) -> Optional[float]:
+        return getattr(self.compactor, "expected_latency", None)
+
+    def summarize(
+        self,
+        messages_to_summarize: List[Dict[str, str]],
+        max_token_count: int = 500,
+    ) -> str:
+        """
+        Summarizes a list of messages, using precomputed replacements for
+        known boilerplate.
+
+        Args:
+            messages_to_summarize: The list of messages to compress
+            max_token_count: The target length for the final summary
+
+        Returns:
+            summaries: The replacements followed by the summary of the
+                       other messages.
+        """
+        replacements = {}
+        rest = []
+        for message in messages_to_summarize:
+            block = self.library.match(message)
+            if block is None or not block.replacement:
+                rest.append(message)
+            else:
+                replacements.setdefault(block.block_id, block.replacement)
+
+        if not replacements:
+            return self.compactor.summarize(
+                messages_to_summarize, max_token_count
+            )
+
+        # Every replacement and the summary of the rest get an equal share,
+        # less a token each for the separators
+        count = len(replacements) + (1 if rest else 0)
+        share = (max_token_count - count) // count
+        if share <= 0:
+            return self.compactor.summarize(
+                messages_to_summarize, max_token_count
+            )
+
+        parts = [fit_summary(part, share) for part in replacements.values()]
+        if rest:
+            # Short replacements leave their unused share to the rest
+            used = -(-(len(" ".join(parts)) + 1) // 4)
+            parts.append(self.compactor.summarize(rest, max_token_count - used))
+        return " ".join(part for part in parts if part)
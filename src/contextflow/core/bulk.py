@@ -0,0 +1,671 @@
+"""
+Offline bulk optimization through provider batch endpoints
+"""
+
+from typing import Dict, List, Optional, Tuple
+from contextflow.core.compactor import SummaryCache
+from contextflow.core.excerpt import ExcerptPolicy
+from contextflow.core.extractive import ExtractiveCompactor
+from contextflow.core.heuristic import heuristic_scores
+from contextflow.core.recency import RecencyModel, WindowRecency
+from contextflow.core.strategies import get_strategy
+from contextflow.utils.batch import DONE, FAILED, BatchBackend
+from contextflow.utils.common import format_messages
+from contextflow.utils.providers.base import (
+    decode_digit_scores,
+    digit_scoring_prefix,
+    digit_scoring_suffix,
+    normalize_score_vector,
+    summary_prompt,
+)
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+SCORING = "scoring"
+SUMMARIZING = "summarizing"
+FINALIZING = "finalizing"
+COMPLETE = "done"
+
+# Batch rows are written before their submission and hold a local id until
+# the provider's batch id is known
+_SUBMITTING = "submitting"
+_ABANDONED = "abandoned"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    goal TEXT NOT NULL,
+    max_token_count INTEGER NOT NULL,
+    strategy TEXT NOT NULL,
+    phase TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    job_id TEXT NOT NULL,
+    conv_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    messages TEXT NOT NULL,
+    scores TEXT,
+    result TEXT,
+    PRIMARY KEY (job_id, conv_id)
+);
+CREATE TABLE IF NOT EXISTS requests (
+    job_id TEXT NOT NULL,
+    custom_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    body TEXT NOT NULL,
+    batch_id TEXT,
+    result TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, custom_id)
+);
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    custom_ids TEXT NOT NULL
+);
+"""
+
+
+def _custom_id(*parts) -> str:
+    # Provider custom ids are limited to [a-zA-Z0-9_-]{1,64}
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(parts).encode())
+    return digest.hexdigest()
+
+
+class _RecordingCompactor:
+    """Collects the summaries a strategy asks for without calling an LLM."""
+
+    def __init__(self):
+        self.requests: Dict[tuple, List[Dict[str, str]]] = {}
+
+    def summarize(self, messages_to_summarize, max_token_count=500):
+        if len(messages_to_summarize) <= 1:
+            return _trivial_summary(messages_to_summarize)
+        key = SummaryCache.key(messages_to_summarize, max_token_count)
+        self.requests[key] = list(messages_to_summarize)
+        return ""
+
+
+class _ReplayCompactor:
+    """Answers a strategy's summaries from the collected batch results."""
+
+    def __init__(self, summaries: Dict[tuple, str]):
+        self.summaries = summaries
+        self.fallback = ExtractiveCompactor()
+
+    def summarize(self, messages_to_summarize, max_token_count=500):
+        if len(messages_to_summarize) <= 1:
+            return _trivial_summary(messages_to_summarize)
+        key = SummaryCache.key(messages_to_summarize, max_token_count)
+        summary = self.summaries.get(key)
+        if summary is None:
+            return self.fallback.summarize(
+                messages_to_summarize, max_token_count
+            )
+        return summary
+
+
+def _trivial_summary(messages: List[Dict[str, str]]) -> str:
+    return messages[0]["content"] if messages else ""
+
+
+class BulkJobRunner:
+    def __init__(
+        self,
+        backend: BatchBackend,
+        path: str,
+        batch_size: int = 20,
+        max_batch_requests: int = 1000,
+        max_attempts: int = 3,
+        excerpt: Optional[ExcerptPolicy] = None,
+        recency: Optional[RecencyModel] = None,
+    ):
+        """
+        Initialize the BulkJobRunner.
+
+        A job optimizes many conversations for one goal without interactive
+        latency. Scoring requests from every conversation are gathered into
+        provider batch submissions, then the summaries the strategy needs
+        are gathered the same way. The job's state lives in a SQLite
+        database, so a runner created on the same path after a restart
+        picks up where the previous one stopped, including batches that
+        were submitted but not yet collected.
+
+        Args:
+            backend: The provider's batch endpoint.
+            path: Path of the SQLite database holding job state.
+            batch_size: Number of messages per scoring request.
+            max_batch_requests: Maximum number of requests per submission.
+            max_attempts: Number of times a failed request is submitted
+                          before falling back to heuristic scores or
+                          extractive summaries.
+            excerpt: How oversized messages are shortened before scoring.
+                     Defaults to an ExcerptPolicy.
+            recency: Recency model for the scores and the strategy.
+                     Defaults to WindowRecency().
+        """
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_batch_requests = max_batch_requests
+        self.max_attempts = max_attempts
+        self.excerpt = excerpt if excerpt is not None else ExcerptPolicy()
+        self.recency = recency if recency is not None else WindowRecency()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Close the state database."""
+        self._db.close()
+
+    def __enter__(self) -> "BulkJobRunner":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def create_job(
+        self,
+        conversations: Dict[str, List[Dict[str, str]]],
+        goal: str,
+        max_token_count: int = 500,
+        strategy: str = "balanced",
+    ) -> str:
+        """
+        Create a job and its scoring requests. Nothing is submitted until
+        the job is stepped.
+
+        Args:
+            conversations: Dictionary mapping a conversation id to its
+                           messages.
+            goal: The goal every conversation is optimized for.
+            max_token_count: Token budget of each optimized conversation.
+            strategy: Name of a registered strategy.
+
+        Returns:
+            The job id.
+
+        Raises:
+            ValueError: If the strategy is unknown.
+        """
+        get_strategy(strategy)
+        job_id = uuid.uuid4().hex
+
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?)",
+                (job_id, goal, max_token_count, strategy, SCORING),
+            )
+            for position, (conv_id, messages) in enumerate(
+                conversations.items()
+            ):
+                self._db.execute(
+                    "INSERT INTO conversations (job_id, conv_id, position, "
+                    "messages) VALUES (?, ?, ?, ?)",
+                    (job_id, conv_id, position, json.dumps(messages)),
+                )
+                for start in range(0, len(messages), self.batch_size):
+                    batch = self.excerpt.apply(
+                        messages[start : start + self.batch_size], goal
+                    )
+                    body = {
+                        "system": digit_scoring_prefix(goal),
+                        "prompt": digit_scoring_suffix(batch),
+                        "max_tokens": len(batch) + 8,
+                        "conv_id": conv_id,
+                        "start": start,
+                        "count": len(batch),
+                    }
+                    self._add_request(job_id, ("score", conv_id, start), body)
+        return job_id
+
+    def phase(self, job_id: str) -> str:
+        """
+        Current phase of a job: "scoring", "summarizing", "finalizing" or
+        "done".
+
+        Raises:
+            KeyError: If there is no such job.
+        """
+        row = self._db.execute(
+            "SELECT phase FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(job_id)
+        return row[0]
+
+    def step(self, job_id: str) -> str:
+        """
+        Advance a job as far as it can go without waiting: submit pending
+        requests, collect finished batches and move to the next phase once
+        every request of the current one has a result. Safe to call
+        repeatedly, and from a new runner after a restart.
+
+        Args:
+            job_id: The job id.
+
+        Returns:
+            The job's phase after the step.
+        """
+        with self._lock:
+            phase = self.phase(job_id)
+            if phase in (SCORING, SUMMARIZING):
+                self._collect(job_id)
+                self._submit(job_id)
+                if self._pending(job_id) == 0:
+                    phase = self._advance(job_id, phase)
+            if phase == FINALIZING:
+                self._finalize(job_id)
+                phase = COMPLETE
+            return phase
+
+    def run(
+        self,
+        job_id: str,
+        poll_interval: float = 30.0,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Step a job until it is done.
+
+        Args:
+            job_id: The job id.
+            poll_interval: Seconds to wait between polls of the batches.
+            timeout: Seconds after which to give up, or None to wait as
+                     long as it takes.
+
+        Returns:
+            The optimized conversations, as returned by results().
+
+        Raises:
+            TimeoutError: If the job is not done within the timeout. Its
+                          state is kept and it can be resumed later.
+        """
+        started = time.monotonic()
+        while self.step(job_id) != COMPLETE:
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise TimeoutError(f"Bulk job {job_id} is not done yet")
+            time.sleep(poll_interval)
+        return self.results(job_id)
+
+    def results(self, job_id: str) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Optimized conversations of a finished job.
+
+        Args:
+            job_id: The job id.
+
+        Returns:
+            Dictionary mapping each conversation id to its optimized
+            messages, in the order the conversations were given.
+
+        Raises:
+            ValueError: If the job is not done yet.
+        """
+        if self.phase(job_id) != COMPLETE:
+            raise ValueError(f"Bulk job {job_id} is not done yet")
+        rows = self._db.execute(
+            "SELECT conv_id, result FROM conversations WHERE job_id = ? "
+            "ORDER BY position",
+            (job_id,),
+        )
+        return {conv_id: json.loads(result) for conv_id, result in rows}
+
+    def progress(self, job_id: str) -> Dict:
+        """
+        Summary of a job's state.
+
+        Returns:
+            Dictionary with the phase, the number of requests and batches
+            of each kind, and the errors of the requests that fell back to
+            heuristic scores or extractive summaries.
+        """
+        requests = self._db.execute(
+            "SELECT kind, COUNT(*), COUNT(result) FROM requests "
+            "WHERE job_id = ? GROUP BY kind",
+            (job_id,),
+        ).fetchall()
+        batches = self._db.execute(
+            "SELECT status, COUNT(*) FROM batches WHERE job_id = ? "
+            "GROUP BY status",
+            (job_id,),
+        ).fetchall()
+        results = [
+            (kind, json.loads(result))
+            for kind, result in self._db.execute(
+                "SELECT kind, result FROM requests WHERE job_id = ? "
+                "AND result IS NOT NULL",
+                (job_id,),
+            )
+        ]
+        return {
+            "phase": self.phase(job_id),
+            "errors": [
+                {"kind": kind, "error": result["error"]}
+                for kind, result in results
+                if "error" in result
+            ],
+            "requests": {
+                kind: {"total": total, "done": done}
+                for kind, total, done in requests
+            },
+            "batches": dict(batches),
+        }
+
+    def _add_request(self, job_id: str, parts: tuple, body: Dict):
+        self._db.execute(
+            "INSERT OR IGNORE INTO requests (job_id, custom_id, kind, body) "
+            "VALUES (?, ?, ?, ?)",
+            (job_id, _custom_id(*parts), parts[0], json.dumps(body)),
+        )
+
+    def _pending(self, job_id: str) -> int:
+        return self._db.execute(
+            "SELECT COUNT(*) FROM requests WHERE job_id = ? AND result IS NULL",
+            (job_id,),
+        ).fetchone()[0]
+
+    def _submit(self, job_id: str):
+        rows = self._db.execute(
+            "SELECT custom_id, body FROM requests WHERE job_id = ? "
+            "AND result IS NULL AND batch_id IS NULL ORDER BY rowid",
+            (job_id,),
+        ).fetchall()
+
+        for i in range(0, len(rows), self.max_batch_requests):
+            chunk = rows[i : i + self.max_batch_requests]
+            requests = []
+            for custom_id, body in chunk:
+                body = json.loads(body)
+                requests.append(
+                    {
+                        "custom_id": custom_id,
+                        "system": body.get("system"),
+                        "prompt": body["prompt"],
+                        "max_tokens": body["max_tokens"],
+                    }
+                )
+
+            custom_ids = [custom_id for custom_id, _ in chunk]
+            local_id = f"local-{uuid.uuid4().hex}"
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO batches VALUES (?, ?, ?, ?)",
+                    (local_id, job_id, _SUBMITTING, json.dumps(custom_ids)),
+                )
+                self._db.executemany(
+                    "UPDATE requests SET batch_id = ?, attempts = attempts + 1 "
+                    "WHERE job_id = ? AND custom_id = ?",
+                    [(local_id, job_id, c) for c in custom_ids],
+                )
+
+            try:
+                batch_id = self.backend.submit(requests)
+            except Exception as e:
+                self._release(job_id, local_id, custom_ids, FAILED, str(e))
+                raise
+
+            with self._db:
+                self._db.execute(
+                    "UPDATE batches SET batch_id = ?, status = 'pending' "
+                    "WHERE batch_id = ?",
+                    (batch_id, local_id),
+                )
+                self._db.execute(
+                    "UPDATE requests SET batch_id = ? WHERE batch_id = ?",
+                    (batch_id, local_id),
+                )
+
+    def _release(
+        self,
+        job_id: str,
+        batch_id: str,
+        custom_ids: List[str],
+        status: str,
+        error: str,
+    ):
+        """Give up on a batch; its requests are resubmitted if they can be."""
+        with self._db:
+            for custom_id in custom_ids:
+                self._store_result(job_id, custom_id, {"error": error})
+            self._db.execute(
+                "UPDATE batches SET status = ? WHERE batch_id = ?",
+                (status, batch_id),
+            )
+
+    def _collect(self, job_id: str):
+        # Submissions interrupted by a crash: the provider may or may not
+        # have the batch, but its id was never recorded
+        for batch_id, custom_ids in self._db.execute(
+            "SELECT batch_id, custom_ids FROM batches WHERE job_id = ? "
+            "AND status = ?",
+            (job_id, _SUBMITTING),
+        ).fetchall():
+            self._release(
+                job_id,
+                batch_id,
+                json.loads(custom_ids),
+                _ABANDONED,
+                "submission interrupted",
+            )
+
+        batches = self._db.execute(
+            "SELECT batch_id, custom_ids FROM batches WHERE job_id = ? "
+            "AND status = 'pending'",
+            (job_id,),
+        ).fetchall()
+
+        for batch_id, custom_ids in batches:
+            status = self.backend.status(batch_id)
+            if status not in (DONE, FAILED):
+                continue
+
+            custom_ids = json.loads(custom_ids)
+            results = {}
+            if status == DONE:
+                results = self.backend.results(batch_id, custom_ids)
+
+            with self._db:
+                for custom_id in custom_ids:
+                    self._store_result(
+                        job_id, custom_id, results.get(custom_id)
+                    )
+                self._db.execute(
+                    "UPDATE batches SET status = ? WHERE batch_id = ?",
+                    (status, batch_id),
+                )
+
+    def _store_result(self, job_id: str, custom_id: str, result):
+        if result is not None and "text" in result:
+            self._db.execute(
+                "UPDATE requests SET result = ? WHERE job_id = ? "
+                "AND custom_id = ?",
+                (json.dumps(result), job_id, custom_id),
+            )
+            return
+
+        # Failed or missing: resubmit until out of attempts
+        self._db.execute(
+            "UPDATE requests SET batch_id = NULL, result = CASE "
+            "WHEN attempts >= ? THEN ? ELSE NULL END "
+            "WHERE job_id = ? AND custom_id = ?",
+            (
+                self.max_attempts,
+                json.dumps(result or {"error": "batch failed"}),
+                job_id,
+                custom_id,
+            ),
+        )
+
+    def _advance(self, job_id: str, phase: str) -> str:
+        job = self._job(job_id)
+
+        if phase == SCORING:
+            self._store_scores(job_id, job["goal"])
+            phase = SUMMARIZING
+            if not self._plan_summaries(job_id, job):
+                phase = FINALIZING
+        else:
+            phase = FINALIZING
+
+        with self._db:
+            self._db.execute(
+                "UPDATE jobs SET phase = ? WHERE job_id = ?", (phase, job_id)
+            )
+        if phase == SUMMARIZING:
+            self._submit(job_id)
+        return phase
+
+    def _store_scores(self, job_id: str, goal: str):
+        raw: Dict[str, Dict[int, Tuple[str, int, Dict]]] = {}
+        for custom_id, body, result in self._db.execute(
+            "SELECT custom_id, body, result FROM requests WHERE job_id = ? "
+            "AND kind = 'score'",
+            (job_id,),
+        ):
+            body = json.loads(body)
+            raw.setdefault(body["conv_id"], {})[body["start"]] = (
+                custom_id,
+                body["count"],
+                json.loads(result),
+            )
+
+        with self._db:
+            for conv_id, messages in self._conversations(job_id):
+                scores = []
+                for start in sorted(raw.get(conv_id, {})):
+                    custom_id, count, result = raw[conv_id][start]
+                    batch = messages[start : start + count]
+                    scores.extend(
+                        self._decode(job_id, custom_id, result, batch, goal)
+                    )
+                scores = self.recency.apply(messages, scores)
+                self._db.execute(
+                    "UPDATE conversations SET scores = ? WHERE job_id = ? "
+                    "AND conv_id = ?",
+                    (json.dumps(scores), job_id, conv_id),
+                )
+
+    def _decode(
+        self,
+        job_id: str,
+        custom_id: str,
+        result: Dict,
+        batch: List[Dict[str, str]],
+        goal: str,
+    ) -> List[float]:
+        """
+        Scores of a batch from its result, or heuristic scores if it has
+        none. Unusable output is recorded as the request's error.
+        """
+        if "text" in result:
+            try:
+                return decode_digit_scores(result["text"], len(batch))
+            except ValueError as e:
+                result = {**result, "error": f"unusable output ({e})"}
+                self._db.execute(
+                    "UPDATE requests SET result = ? WHERE job_id = ? "
+                    "AND custom_id = ?",
+                    (json.dumps(result), job_id, custom_id),
+                )
+        return normalize_score_vector(heuristic_scores(batch, goal), len(batch))
+
+    def _plan_summaries(self, job_id: str, job: Dict) -> int:
+        strategy = get_strategy(job["strategy"])
+        requests = {}
+        for conv_id, messages, scores in self._scored(job_id):
+            compactor = _RecordingCompactor()
+            strategy(
+                messages,
+                scores,
+                job["max_token_count"],
+                compactor,
+                recency=self.recency,
+            )
+            requests.update(compactor.requests)
+
+        with self._db:
+            for key, messages in requests.items():
+                keys, max_token_count = key
+                body = {
+                    "prompt": summary_prompt(
+                        format_messages(messages), max_token_count
+                    ),
+                    "max_tokens": max(max_token_count, 1),
+                    "key": [list(keys), max_token_count],
+                }
+                self._add_request(job_id, ("summarize",) + key, body)
+        return len(requests)
+
+    def _finalize(self, job_id: str):
+        job = self._job(job_id)
+        strategy = get_strategy(job["strategy"])
+
+        summaries = {}
+        for body, result in self._db.execute(
+            "SELECT body, result FROM requests WHERE job_id = ? "
+            "AND kind = 'summarize'",
+            (job_id,),
+        ):
+            keys, max_token_count = json.loads(body)["key"]
+            result = json.loads(result)
+            if "text" in result:
+                summaries[(tuple(keys), max_token_count)] = result[
+                    "text"
+                ].strip()
+
+        compactor = _ReplayCompactor(summaries)
+        with self._db:
+            for conv_id, messages, scores in self._scored(job_id):
+                optimized = strategy(
+                    messages,
+                    scores,
+                    job["max_token_count"],
+                    compactor,
+                    recency=self.recency,
+                )
+                self._db.execute(
+                    "UPDATE conversations SET result = ? WHERE job_id = ? "
+                    "AND conv_id = ?",
+                    (json.dumps(optimized), job_id, conv_id),
+                )
+            self._db.execute(
+                "UPDATE jobs SET phase = ? WHERE job_id = ?",
+                (COMPLETE, job_id),
+            )
+
+    def _job(self, job_id: str) -> Dict:
+        goal, max_token_count, strategy = self._db.execute(
+            "SELECT goal, max_token_count, strategy FROM jobs WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+        return {
+            "goal": goal,
+            "max_token_count": max_token_count,
+            "strategy": strategy,
+        }
+
+    def _conversations(self, job_id: str):
+        rows = self._db.execute(
+            "SELECT conv_id, messages FROM conversations WHERE job_id = ? "
+            "ORDER BY position",
+            (job_id,),
+        ).fetchall()
+        return [(conv_id, json.loads(messages)) for conv_id, messages in rows]
+
+    def _scored(self, job_id: str):
+        rows = self._db.execute(
+            "SELECT conv_id, messages, scores FROM conversations "
+            "WHERE job_id = ? ORDER BY position",
+            (job_id,),
+        ).fetchall()
+        return [
+            (conv_id, json.loads(messages), json.loads(scores))
+            for conv_id, messages, scores in rows
+        ]
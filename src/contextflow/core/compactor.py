@@ -2,19 +2,247 @@
 Implements message summarization techniques
 """
 
-from typing import List, Dict
-from contextflow.utils.llm import LLMClient
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+from contextflow.core.score_cache import message_key
+from contextflow.utils.common import format_messages, moving_average
+from contextflow.utils.llm import resolve_client
+import re
+import threading
+import time
+
+_SENTENCE_END = re.compile(r"[.!?](?=\s|$)")
+
+# Receives (summary so far, final) while summaries are written
+_partial_summary: ContextVar[Optional[Callable[[str, bool], None]]] = (
+    ContextVar("contextflow_partial_summary", default=None)
+)
+
+
+@contextmanager
+def on_partial_summary(
+    callback: Optional[Callable[[str, bool], None]],
+) -> Iterator[None]:
+    """
+    Pass the summaries written inside the block to a callback as they grow.
+
+    A streaming MessageCompactor calls it with each longer prefix of the
+    summary that ends at a sentence end, and every MessageCompactor calls
+    it with the final summary, so a caller can start preparing its
+    downstream request before the optimization returns. It is also called
+    from threads started inside the block.
+
+    Args:
+        callback: Called as callback(text, final). None disables it.
+    """
+    token = _partial_summary.set(callback)
+    try:
+        yield
+    finally:
+        _partial_summary.reset(token)
+
+
+class SummaryCache:
+    def __init__(self, max_summaries: int = 256):
+        """
+        Initialize the SummaryCache.
+
+        Summaries are keyed by the set of summarized messages and the target
+        length, so the same messages summarized again (e.g. by a prefetch
+        and then by the real call) cost one LLM call.
+
+        Args:
+            max_summaries: Number of summaries kept before the least
+                           recently used ones are evicted.
+        """
+        self.max_summaries = max_summaries
+        self._summaries: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(messages: List[Dict[str, str]], max_token_count: int) -> tuple:
+        """
+        Cache key of a summarization request.
+
+        Args:
+            messages: The messages to summarize, in any order.
+            max_token_count: The target length of the summary.
+
+        Returns:
+            Hashable key.
+        """
+        keys = tuple(sorted(message_key(m) for m in messages))
+        return keys, max_token_count
+
+    def get(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+            return summary
+
+    def put(self, key: tuple, summary: str):
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.max_summaries:
+                self._summaries.popitem(last=False)
+
+    def largest_subset(self, key: tuple) -> Optional[Tuple[tuple, str]]:
+        """
+        Cached summary covering the most messages that are all part of a
+        request, e.g. the prefetched summary of a bucket that has since
+        grown by a few messages.
+
+        Args:
+            key: Cache key of the request.
+
+        Returns:
+            (message keys the summary covers, summary) or None if no
+            summary of at least two of the messages, and fewer than all of
+            them, is cached.
+        """
+        wanted = set(key[0])
+        best = None
+        with self._lock:
+            for (keys, _), summary in self._summaries.items():
+                if len(keys) < 2 or len(keys) >= len(wanted):
+                    continue
+                if best is not None and len(keys) <= len(best[0]):
+                    continue
+                if wanted.issuperset(keys):
+                    best = (keys, summary)
+        return best
+
+    def __len__(self) -> int:
+        return len(self._summaries)
+
+
+def fit_summary(summary: str, max_token_count: int) -> str:
+    """
+    Cut a summary to a token budget, at the last sentence end that fits,
+    or the last word if no sentence ends early enough.
+
+    Args:
+        summary: The summary.
+        max_token_count: Maximum length in tokens (4 characters each, like
+                         count_tokens).
+
+    Returns:
+        The summary, unchanged if it already fits.
+    """
+    limit = max(0, max_token_count) * 4
+    if len(summary) <= limit:
+        return summary
+
+    head = summary[:limit]
+    ends = [match.end() for match in _SENTENCE_END.finditer(head)]
+    if ends and ends[-1] >= limit // 2:
+        return head[: ends[-1]]
+    return head.rsplit(" ", 1)[0] if " " in head else head
+
+
+class LengthPredictor:
+    def __init__(self, smoothing: float = 0.3, default_ratio: float = 1.0):
+        """
+        Initialize the LengthPredictor.
+
+        Models don't write summaries of exactly the requested length. The
+        predictor keeps, per model, a moving average of the ratio between
+        the length of the summaries and the length that was asked for, and
+        shrinks later requests so the summary is expected to fit its
+        budget without being cut.
+
+        Args:
+            smoothing: Weight of each new observation in the average.
+            default_ratio: Ratio assumed for a model before any call.
+        """
+        self.smoothing = smoothing
+        self.default_ratio = default_ratio
+        self._ratios: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def ratio(self, model: str) -> float:
+        """Expected summary length per requested token for a model."""
+        return self._ratios.get(model, self.default_ratio)
+
+    def request(self, model: str, budget: int) -> int:
+        """
+        Length to ask a model for so its summary is expected to fit.
+
+        Args:
+            model: The model's name.
+            budget: The summary's maximum length in tokens.
+
+        Returns:
+            The length to request, never above the budget.
+        """
+        return max(1, min(budget, int(budget / max(self.ratio(model), 1e-6))))
+
+    def record(self, model: str, requested: int, actual: int):
+        """
+        Fold one call into the model's ratio.
+
+        Args:
+            model: The model's name.
+            requested: The length that was asked for.
+            actual: The length of the summary, before any cutting.
+        """
+        if requested <= 0:
+            return
+        observed = actual / requested
+        with self._lock:
+            ratio = self._ratios.get(model)
+            if ratio is None:
+                self._ratios[model] = observed
+            else:
+                self._ratios[model] = (
+                    1 - self.smoothing
+                ) * ratio + self.smoothing * observed
 
 
 class MessageCompactor:
-    def __init__(self, model: str):
+    def __init__(
+        self,
+        model: str,
+        cache: Optional[SummaryCache] = None,
+        predictor: Optional[LengthPredictor] = None,
+        streaming: bool = False,
+    ):
         """
         Initialize the MessageCompactor.
 
+        max_token_count is a hard limit on the summaries: the provider's
+        output is capped, the requested length is adjusted by the
+        LengthPredictor, and a summary that still runs over is cut at a
+        sentence end.
+
         Args:
-            model: The LLM provider to use for summarization (e.g., "gemini", "groq").
+            model: The LLM provider to use for summarization (e.g., "gemini", "groq"),
+                   a list of providers to hedge between, or an object with the
+                   same interface as LLMClient.
+            cache: Store of earlier summaries. Defaults to a new SummaryCache.
+            predictor: Per-model summary length predictor. Defaults to a new
+                       LengthPredictor.
+            streaming: Whether summaries are streamed. A streamed summary
+                       is stopped as soon as it reaches max_token_count and
+                       cut back to its last sentence end, instead of waiting
+                       for the model to finish, and its prefixes are passed
+                       to on_partial_summary() callbacks as they arrive.
+                       Defaults to False.
         """
-        self.llm = LLMClient(model)
+        self.llm = resolve_client(model)
+        self.cache = cache if cache is not None else SummaryCache()
+        self.predictor = (
+            predictor if predictor is not None else LengthPredictor()
+        )
+        self.streaming = streaming
+        # Key of the model in the predictor
+        self.model_name = getattr(self.llm, "provider", type(self.llm).__name__)
+        # Moving average of summarization call latency, in seconds
+        self.expected_latency: Optional[float] = None
 
     def summarize(
         self,
@@ -32,7 +260,11 @@ class MessageCompactor:
         Returns:
             summaries: A single string containing the dense summary.
         """
-        return self._simple_summarize(messages_to_summarize, max_token_count)
+        summary = self._simple_summarize(messages_to_summarize, max_token_count)
+        callback = _partial_summary.get()
+        if callback is not None and summary:
+            callback(summary, True)
+        return summary
 
     def _simple_summarize(
         self,
@@ -50,43 +282,179 @@ class MessageCompactor:
         Returns:
             summaries: A single string containing the dense summary.
         """
-        if not messages_to_summarize:
+        if not messages_to_summarize or max_token_count <= 0:
             return ""
 
         if len(messages_to_summarize) == 1:
-            return messages_to_summarize[0]["content"]
+            return fit_summary(
+                messages_to_summarize[0]["content"], max_token_count
+            )
+
+        key = self.cache.key(messages_to_summarize, max_token_count)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        covered = self.cache.largest_subset(key)
+        if covered is not None:
+            return self._extend_summary(
+                messages_to_summarize, max_token_count, key, *covered
+            )
 
-        conversation_text = self._format_messages(messages_to_summarize)
+        conversation_text = format_messages(messages_to_summarize)
 
+        if self.streaming:
+            return self._stream_summarize(
+                messages_to_summarize, conversation_text, max_token_count, key
+            )
+
+        requested = self.predictor.request(self.model_name, max_token_count)
         try:
+            started = time.monotonic()
             summary = self.llm.summarize_text(
                 source=conversation_text,
-                max_tokens=max_token_count,
+                max_tokens=requested,
             )
+            self._record_latency(time.monotonic() - started)
 
-            return summary.strip()
+            summary = summary.strip()
+            self.predictor.record(self.model_name, requested, len(summary) // 4)
+            summary = fit_summary(summary, max_token_count)
+            self.cache.put(key, summary)
+            return summary
         except Exception as e:
             # Fallback: return a simple concatenation
             print(f"Warning: Summarization failed ({e}). Using fallback.")
-            return self._fallback_summary(messages_to_summarize)
+            return fit_summary(
+                self._fallback_summary(messages_to_summarize), max_token_count
+            )
 
-    def _format_messages(self, messages: List[Dict[str, str]]) -> str:
+    def _extend_summary(
+        self,
+        messages_to_summarize: List[Dict[str, str]],
+        max_token_count: int,
+        key: tuple,
+        covered_keys: tuple,
+        covered_summary: str,
+    ) -> str:
         """
-        Format messages into a readable conversation string.
+        Summarizes messages of which some already have a cached summary,
+        by summarizing only the others and appending them to it.
 
         Args:
-            messages: List of message dictionaries with "role" and "content" keys.
+            messages_to_summarize: The list of messages to compress
+            max_token_count: The target length for the final summary
+            key: The summary's cache key
+            covered_keys: Keys of the messages the cached summary covers
+            covered_summary: The cached summary
 
         Returns:
-            Formatted string with each message on a new line in "Role: content" format.
+            summaries: A single string containing the dense summary.
+        """
+        covered = set(covered_keys)
+        delta = [
+            m for m in messages_to_summarize if message_key(m) not in covered
+        ]
+        # The cached part keeps at most its share of the budget by message
+        # count, so the new messages get room too
+        share = (
+            max_token_count * len(covered_keys) // len(messages_to_summarize)
+        )
+        head = fit_summary(covered_summary, max(1, share))
+        tail = self._simple_summarize(
+            delta, max_token_count - len(head) // 4 - 1
+        )
+
+        summary = fit_summary(f"{head} {tail}".strip(), max_token_count)
+        self.cache.put(key, summary)
+        return summary
+
+    def _stream_summarize(
+        self,
+        messages_to_summarize: List[Dict[str, str]],
+        conversation_text: str,
+        max_token_count: int,
+        key: tuple,
+    ) -> str:
         """
-        formatted = []
-        for msg in messages:
-            role = msg.get("role", "unknown")
-            content = msg.get("content", "")
-            formatted.append(f"{role.capitalize()}: {content}")
+        Summarizes with a streamed LLM summary, stopped at the budget.
 
-        return "\n".join(formatted)
+        Args:
+            messages_to_summarize: The list of messages to compress
+            conversation_text: The formatted messages
+            max_token_count: The target length for the final summary
+            key: The summary's cache key
+
+        Returns:
+            summaries: A single string containing the dense summary.
+        """
+        try:
+            started = time.monotonic()
+            text, completed = self._read_stream(
+                conversation_text, max_token_count
+            )
+            self._record_latency(time.monotonic() - started)
+        except Exception as e:
+            print(f"Warning: Summarization failed ({e}). Using fallback.")
+            return fit_summary(
+                self._fallback_summary(messages_to_summarize), max_token_count
+            )
+
+        summary = text.strip()
+        # A stopped stream says nothing about where the model would end
+        if completed:
+            self.predictor.record(
+                self.model_name, max_token_count, len(summary) // 4
+            )
+        summary = fit_summary(summary, max_token_count)
+        self.cache.put(key, summary)
+        return summary
+
+    def _read_stream(
+        self, source: str, max_token_count: int
+    ) -> Tuple[str, bool]:
+        """
+        Read a summary stream until it ends or reaches the budget.
+
+        Args:
+            source: The text to summarize.
+            max_token_count: The summary's maximum length in tokens.
+
+        Returns:
+            (text read, whether the stream ended by itself)
+        """
+        callback = _partial_summary.get()
+        limit = max_token_count * 4
+        text = ""
+        sent = 0
+        stream = self.llm.summarize_stream(
+            source=source, max_tokens=max_token_count
+        )
+        try:
+            for chunk in stream:
+                text += chunk
+                if callback is not None:
+                    ends = list(_SENTENCE_END.finditer(text[:limit]))
+                    if ends and ends[-1].end() > sent:
+                        sent = ends[-1].end()
+                        callback(text[:sent].strip(), False)
+                if len(text) >= limit:
+                    return text, False
+            return text, True
+        finally:
+            # Stops the generation if we returned early
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+    def _record_latency(self, seconds: float):
+        """
+        Fold one call's latency into the moving average.
+
+        Args:
+            seconds: Duration of the summarization call.
+        """
+        self.expected_latency = moving_average(self.expected_latency, seconds)
 
     def _fallback_summary(self, messages: List[Dict[str, str]]) -> str:
         """
@@ -0,0 +1,191 @@
+"""
+Deadline tracking and graceful degradation of summarization
+"""
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextvars import copy_context
+from typing import Dict, List, Optional
+from contextflow.core.extractive import ExtractiveCompactor
+import time
+
+
+# Summaries that miss the deadline keep running here and are discarded
+_executor = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="contextflow-summarize"
+)
+# Fallbacks get their own threads, so they never queue behind late summaries
+_fallback_executor = ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix="contextflow-fallback"
+)
+
+# Share of the budget kept for the fallback until its latency is measured
+_FALLBACK_RESERVE = 0.1
+
+
+class Deadline:
+    def __init__(self, deadline_ms: float, start: Optional[float] = None):
+        """
+        A point in time that work has to finish by.
+
+        Args:
+            deadline_ms: Time budget in milliseconds.
+            start: time.monotonic() value the budget counts from. Defaults to now.
+        """
+        self.deadline_ms = deadline_ms
+        self.start = time.monotonic() if start is None else start
+        self.expires_at = self.start + deadline_ms / 1000
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Whether the deadline has passed."""
+        return time.monotonic() >= self.expires_at
+
+    def sub(self, fraction: float) -> "Deadline":
+        """
+        A deadline covering the first `fraction` of this one's budget.
+
+        Args:
+            fraction: Share of the budget, between 0.0 and 1.0.
+
+        Returns:
+            A new Deadline with the same start.
+        """
+        return Deadline(self.deadline_ms * fraction, start=self.start)
+
+
+def truncate_messages(
+    messages: List[Dict[str, str]], max_token_count: int
+) -> str:
+    """
+    Cheapest possible "summary": the messages joined and cut to size.
+
+    Args:
+        messages: The messages to shorten.
+        max_token_count: Maximum length of the result in tokens.
+
+    Returns:
+        The joined contents, truncated to max_token_count * 4 characters.
+    """
+    text = " ... ".join(message.get("content", "") for message in messages)
+    return text[: max(0, max_token_count) * 4]
+
+
+class DeadlineCompactor:
+    def __init__(
+        self,
+        compactor,
+        deadline: Deadline,
+        degradations: List[Dict],
+        fallback=None,
+    ):
+        """
+        Wrap a compactor so summarization never runs past a deadline.
+
+        If the wrapped compactor is not expected to finish in time, or does
+        not finish in time, the summary comes from the fallback compactor
+        instead. Enough of the deadline is kept back for the fallback's
+        measured latency. If even the fallback cannot finish in time, or
+        the deadline has passed, summaries are truncations. Each
+        substitution is appended to `degradations`.
+
+        Args:
+            compactor: The compactor to wrap (e.g. a MessageCompactor).
+            deadline: Deadline summarization has to finish by.
+            degradations: List that degradation records are appended to.
+            fallback: Compactor used when the wrapped one is too slow.
+                      Defaults to an ExtractiveCompactor.
+        """
+        self.compactor = compactor
+        self.deadline = deadline
+        self.degradations = degradations
+        self.fallback = (
+            fallback if fallback is not None else ExtractiveCompactor()
+        )
+
+    def summarize(
+        self,
+        messages_to_summarize: List[Dict[str, str]],
+        max_token_count: int = 500,
+    ) -> str:
+        """
+        Summarizes a list of messages within the deadline.
+
+        Args:
+            messages_to_summarize: The list of messages to compress
+            max_token_count: The target length for the final summary
+
+        Returns:
+            summaries: A single string containing the summary.
+        """
+        remaining = self.deadline.remaining()
+        if remaining <= 0:
+            self._degrade("truncated", "deadline passed")
+            return truncate_messages(messages_to_summarize, max_token_count)
+
+        available = remaining - self._fallback_reserve()
+        expected = getattr(self.compactor, "expected_latency", None)
+        if available <= 0 or (expected is not None and expected > available):
+            return self._fall_back(
+                messages_to_summarize,
+                max_token_count,
+                "predicted to miss deadline",
+            )
+
+        # Run in a copy of the caller's context so usage tracking follows
+        future = _executor.submit(
+            copy_context().run,
+            self.compactor.summarize,
+            messages_to_summarize,
+            max_token_count,
+        )
+        try:
+            return future.result(timeout=available)
+        except TimeoutError:
+            return self._fall_back(
+                messages_to_summarize, max_token_count, "timed out"
+            )
+
+    def _fallback_reserve(self) -> float:
+        """Seconds of the deadline kept back for the fallback."""
+        expected = getattr(self.fallback, "expected_latency", None)
+        if expected is None:
+            return self.deadline.deadline_ms / 1000 * _FALLBACK_RESERVE
+        return expected
+
+    def _fall_back(
+        self,
+        messages_to_summarize: List[Dict[str, str]],
+        max_token_count: int,
+        reason: str,
+    ) -> str:
+        """
+        Summary from the fallback compactor, or a truncation if it cannot
+        finish before the deadline.
+        """
+        remaining = self.deadline.remaining()
+        expected = getattr(self.fallback, "expected_latency", None)
+        if remaining > 0 and (expected is None or expected <= remaining):
+            future = _fallback_executor.submit(
+                copy_context().run,
+                self.fallback.summarize,
+                messages_to_summarize,
+                max_token_count,
+            )
+            try:
+                summary = future.result(timeout=remaining)
+            except TimeoutError:
+                pass
+            else:
+                self._degrade("extractive", reason)
+                return summary
+
+        self._degrade("truncated", reason)
+        return truncate_messages(messages_to_summarize, max_token_count)
+
+    def _degrade(self, fallback: str, reason: str):
+        self.degradations.append(
+            {"stage": "summarization", "fallback": fallback, "reason": reason}
+        )
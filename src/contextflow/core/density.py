@@ -0,0 +1,140 @@
+"""
+Goal-independent message annotation computed as messages arrive
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+from contextflow.core.heuristic import (
+    combine_score,
+    feature_boost,
+    message_features,
+    tokenize,
+)
+from contextflow.core.score_cache import message_key
+import threading
+
+
+class Annotation:
+    def __init__(self, content: str):
+        """
+        Goal-independent features of one message.
+
+        Args:
+            content: The message content.
+        """
+        self.features = message_features(content)
+        self.boost = feature_boost(self.features)
+        self.words: Set[str] = frozenset(tokenize(content))
+        # Score of the message with no goal overlap at all
+        self.density = combine_score(self.boost, self.words, set())
+
+    def score(self, terms: Set[str]) -> float:
+        """
+        Combine the density with a goal's term overlap.
+
+        Args:
+            terms: Terms of the goal, as returned by goal_terms.
+
+        Returns:
+            Relevance score between 0 and 10, the same as heuristic_score
+            would give for the message.
+        """
+        return combine_score(self.boost, self.words, terms)
+
+
+class DensityAnnotator:
+    def __init__(self, max_messages: int = 10_000):
+        """
+        Initialize the DensityAnnotator.
+
+        Annotations are keyed by message_key, so a message is analysed once
+        however many turns it stays in the history. observe() analyses new
+        messages on a background thread; annotation() computes a missing
+        annotation inline, so callers never wait on the background work.
+
+        Args:
+            max_messages: Maximum number of annotations kept. The least
+                          recently used are evicted first.
+        """
+        self.max_messages = max_messages
+        self._annotations: "OrderedDict[str, Annotation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="contextflow-annotate"
+        )
+
+    def __len__(self) -> int:
+        return len(self._annotations)
+
+    def observe(self, messages: List[Dict[str, str]]) -> Future:
+        """
+        Annotate new messages in the background.
+
+        Args:
+            messages: Messages that just arrived (or a whole history; the
+                      ones already annotated are skipped).
+
+        Returns:
+            Future that completes once the messages are annotated.
+        """
+        return self._executor.submit(self.annotate, list(messages))
+
+    def annotate(self, messages: List[Dict[str, str]]):
+        """
+        Annotate the messages that are not annotated yet.
+
+        Args:
+            messages: List of message dictionaries.
+        """
+        for message in messages:
+            self.annotation(message)
+
+    def annotation(self, message: Dict[str, str]) -> Annotation:
+        """
+        Annotation of a message, computed now if it is not stored yet.
+
+        Args:
+            message: Message dictionary with a "content" key.
+
+        Returns:
+            The message's Annotation.
+        """
+        key = message_key(message)
+        with self._lock:
+            annotation = self._annotations.get(key)
+            if annotation is not None:
+                self._annotations.move_to_end(key)
+                return annotation
+
+        annotation = Annotation(message.get("content", ""))
+        with self._lock:
+            self._annotations[key] = annotation
+            while len(self._annotations) > self.max_messages:
+                self._annotations.popitem(last=False)
+        return annotation
+
+    def densities(self, messages: List[Dict[str, str]]) -> List[float]:
+        """
+        Goal-independent density score of each message.
+
+        Args:
+            messages: List of message dictionaries.
+
+        Returns:
+            List of scores between 0 and 10.
+        """
+        return [self.annotation(message).density for message in messages]
+
+    def get(self, message: Dict[str, str]) -> Optional[Annotation]:
+        """
+        Stored annotation of a message, without computing it.
+
+        Args:
+            message: Message dictionary.
+
+        Returns:
+            The Annotation, or None if the message was not annotated yet.
+        """
+        with self._lock:
+            return self._annotations.get(message_key(message))
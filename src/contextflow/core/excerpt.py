@@ -0,0 +1,160 @@
+"""
+Excerpting of oversized messages before they are sent for scoring
+"""
+
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Tuple
+from contextflow.core.heuristic import goal_terms
+from contextflow.utils.tokenizer import content_length
+import re
+
+SEPARATOR = " [...] "
+
+
+class ExcerptPolicy:
+    def __init__(
+        self,
+        max_tokens: Optional[int] = 256,
+        head_tokens: int = 64,
+        tail_tokens: int = 64,
+        snippet_tokens: int = 32,
+        max_snippets: int = 3,
+    ):
+        """
+        Initialize the ExcerptPolicy.
+
+        A message longer than max_tokens is shown to the scoring LLM as its
+        head, its tail and a few snippets centered on goal terms found in
+        between. Only the copy sent for scoring is shortened; keep and
+        summarize decisions still see the full message.
+
+        Args:
+            max_tokens: Largest number of tokens of a message sent for
+                        scoring. None disables excerpting.
+            head_tokens: Tokens kept from the start of the message.
+            tail_tokens: Tokens kept from the end of the message.
+            snippet_tokens: Tokens in each snippet around a goal term.
+            max_snippets: Maximum number of goal-term snippets.
+        """
+        self.max_tokens = max_tokens
+        self.head_tokens = head_tokens
+        self.tail_tokens = tail_tokens
+        self.snippet_tokens = snippet_tokens
+        self.max_snippets = max_snippets
+
+    def apply(
+        self, messages: List[Dict[str, str]], goal: str
+    ) -> List[Dict[str, str]]:
+        """
+        Excerpt every message that is over the token cap.
+
+        Args:
+            messages: List of message dictionaries.
+            goal: The goal the messages will be scored against.
+
+        Returns:
+            List with the same messages, where oversized ones are replaced
+            by copies with excerpted content.
+        """
+        if self.max_tokens is None:
+            return list(messages)
+
+        limit = self.max_tokens * 4
+        terms = None
+        excerpted = []
+        for message in messages:
+            if content_length(message) <= limit:
+                excerpted.append(message)
+                continue
+            if terms is None:
+                terms = goal_terms(goal)
+            copy = dict(message)
+            copy["content"] = self.excerpt(message["content"], terms)
+            excerpted.append(copy)
+        return excerpted
+
+    def excerpt(self, content: str, terms: Set[str]) -> str:
+        """
+        Shorten one message's content to at most max_tokens.
+
+        Args:
+            content: The message content.
+            terms: Goal terms to center snippets on.
+
+        Returns:
+            The content itself if it fits, otherwise the head, goal-term
+            snippets and tail joined by " [...] ".
+        """
+        if self.max_tokens is None or len(content) <= self.max_tokens * 4:
+            return content
+
+        budget = self.max_tokens * 4 - len(SEPARATOR)
+        head = min(self.head_tokens * 4, budget // 2)
+        tail = min(self.tail_tokens * 4, budget - head)
+        budget -= head + tail
+
+        # Snippets come from between the head and the tail
+        start, end = head, len(content) - tail
+        spans = self._snippets(content, start, end, terms, budget)
+
+        parts = [content[:head].rstrip()]
+        parts.extend(content[a:b].strip() for a, b in spans)
+        parts.append(content[end:].lstrip())
+        return SEPARATOR.join(part for part in parts if part)
+
+    def _snippets(
+        self,
+        content: str,
+        start: int,
+        end: int,
+        terms: Set[str],
+        budget: int,
+    ) -> List[Tuple[int, int]]:
+        """
+        Pick non-overlapping windows around goal-term occurrences.
+
+        Windows covering more distinct goal terms are picked first.
+
+        Returns:
+            (start, end) character spans in the order they appear.
+        """
+        if not terms or end <= start:
+            return []
+
+        width = self.snippet_tokens * 4
+        pattern = re.compile(
+            r"\b(?:" + "|".join(re.escape(t) for t in sorted(terms)) + r")\b",
+            re.IGNORECASE,
+        )
+        matches = list(pattern.finditer(content, start, end))
+        starts = [m.start() for m in matches]
+
+        candidates = []
+        for match in matches:
+            center = (match.start() + match.end()) // 2
+            a = max(start, center - width // 2)
+            b = min(end, a + width)
+            covered = {
+                m.group().lower()
+                for m in matches[
+                    bisect_left(starts, a) : bisect_left(starts, b)
+                ]
+                if m.end() <= b
+            }
+            candidates.append((len(covered), -a, a, b))
+        candidates.sort(reverse=True)
+
+        spans = []
+        used = 0
+        for _, _, a, b in candidates:
+            if len(spans) >= self.max_snippets:
+                break
+            cost = (b - a) + len(SEPARATOR)
+            if used + cost > budget:
+                continue
+            if any(a < y and x < b for x, y in spans):
+                continue
+            spans.append((a, b))
+            used += cost
+
+        return sorted(spans)
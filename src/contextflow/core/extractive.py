@@ -0,0 +1,206 @@
+"""
+Extractive summarization without an LLM call
+"""
+
+from typing import Dict, List, Optional, Tuple
+from contextflow.core.heuristic import information_boost
+from contextflow.utils.common import moving_average
+import re
+import time
+import numpy as np
+
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD = re.compile(r"[A-Za-z0-9_#@.\-]+")
+
+
+class ExtractiveCompactor:
+    def __init__(
+        self,
+        damping: float = 0.85,
+        iterations: int = 30,
+        max_sentences: int = 400,
+    ):
+        """
+        Initialize the ExtractiveCompactor.
+
+        Summaries are built from the original sentences of the messages,
+        ranked with TextRank over TF-IDF sentence vectors and boosted when
+        they carry numbers, IDs, entities or errors. No LLM is called.
+
+        Filler sentences are never chosen, so they are left out of the
+        ranking, and only the max_sentences most informative of the rest
+        are ranked. The similarity graph is never built: TextRank runs on
+        the sparse TF-IDF vectors, so a summary costs time linear in the
+        number of ranked words.
+
+        Args:
+            damping: TextRank damping factor.
+            iterations: Number of TextRank power iterations.
+            max_sentences: Maximum number of sentences ranked per summary.
+        """
+        self.damping = damping
+        self.iterations = iterations
+        self.max_sentences = max_sentences
+        # Moving average of a summary's latency, in seconds
+        self.expected_latency: Optional[float] = None
+
+    def summarize(
+        self,
+        messages_to_summarize: List[Dict[str, str]],
+        max_token_count: int = 500,
+    ) -> str:
+        """
+        Summarizes a list of messages by extracting their most informative
+        sentences.
+
+        Args:
+            messages_to_summarize: The list of messages to compress
+            max_token_count: The target length for the final summary
+
+        Returns:
+            summaries: A single string containing the extracted sentences in
+                       their original order.
+        """
+        if not messages_to_summarize or max_token_count <= 0:
+            return ""
+
+        started = time.monotonic()
+        summary = self._extract(messages_to_summarize, max_token_count)
+        self.expected_latency = moving_average(
+            self.expected_latency, time.monotonic() - started
+        )
+        return summary
+
+    def _extract(
+        self, messages: List[Dict[str, str]], max_token_count: int
+    ) -> str:
+        """
+        The best sentences of the messages that fit max_token_count, in
+        their original order.
+        """
+        sentences = self._split(messages)
+        boosts = np.array([information_boost(text) for _, _, text in sentences])
+        candidates = np.flatnonzero(boosts > 0)
+        if len(candidates) > self.max_sentences:
+            best = np.argsort(-boosts[candidates], kind="stable")
+            candidates = np.sort(candidates[best[: self.max_sentences]])
+        if len(candidates) == 0:
+            return ""
+
+        ranks = self._rank(
+            [sentences[i][2] for i in candidates], boosts[candidates]
+        )
+
+        # Greedily take the best sentences until the character budget
+        # (4 characters per token, like count_tokens) is used up.
+        budget = max_token_count * 4
+        chosen = []
+        prefixed = set()
+        for i in candidates[np.argsort(-ranks, kind="stable")]:
+            message_index, role, sentence = sentences[i]
+            length = len(sentence) + 1
+            if message_index not in prefixed:
+                length += len(role) + 2
+            if length <= budget:
+                chosen.append(i)
+                prefixed.add(message_index)
+                budget -= length
+
+        return self._render([sentences[i] for i in sorted(chosen)])
+
+    def _split(
+        self, messages: List[Dict[str, str]]
+    ) -> List[Tuple[int, str, str]]:
+        """
+        Split messages into sentences.
+
+        Returns:
+            List of (message_index, role, sentence) tuples.
+        """
+        sentences = []
+        for i, message in enumerate(messages):
+            role = message.get("role", "unknown")
+            for sentence in _SENTENCE_SPLIT.split(message.get("content", "")):
+                sentence = sentence.strip()
+                if sentence:
+                    sentences.append((i, role, sentence))
+        return sentences
+
+    def _rank(self, sentences: List[str], boosts: np.ndarray) -> np.ndarray:
+        """
+        Rank sentences by their information boost, weighted by TextRank
+        centrality.
+
+        Args:
+            sentences: The sentences to rank.
+            boosts: Their information boosts.
+
+        Returns:
+            Array of scores, one per sentence.
+        """
+        vocabulary: Dict[str, int] = {}
+        rows, columns = [], []
+        for row, sentence in enumerate(sentences):
+            for word in _WORD.findall(sentence):
+                word = word.lower().strip(".-")
+                rows.append(row)
+                columns.append(vocabulary.setdefault(word, len(vocabulary)))
+
+        n = len(sentences)
+        if not rows:
+            return boosts.astype(float)
+
+        # Sparse term counts: one entry per distinct (sentence, word)
+        pairs, tf = np.unique(
+            np.array(rows) * len(vocabulary) + np.array(columns),
+            return_counts=True,
+        )
+        rows, columns = np.divmod(pairs, len(vocabulary))
+        document_frequency = np.bincount(columns, minlength=len(vocabulary))
+        idf = np.log((1 + n) / (1 + document_frequency)) + 1
+        weights = tf * idf[columns]
+        norms = np.sqrt(np.bincount(rows, weights=weights**2, minlength=n))
+        weights = weights / np.where(norms == 0, 1, norms)[rows]
+
+        self_similarity = np.bincount(rows, weights=weights**2, minlength=n)
+
+        def similarity_times(x: np.ndarray) -> np.ndarray:
+            # (T T^T - diag) x, with T the normalized TF-IDF matrix
+            projected = np.bincount(
+                columns, weights=weights * x[rows], minlength=len(vocabulary)
+            )
+            return (
+                np.bincount(
+                    rows, weights=weights * projected[columns], minlength=n
+                )
+                - self_similarity * x
+            )
+
+        row_sums = similarity_times(np.ones(n))
+        scale = 1 / np.where(row_sums <= 1e-12, 1, row_sums)
+        rank = np.full(n, 1.0 / n)
+        for _ in range(self.iterations):
+            # The similarity is symmetric, so transition.T @ rank is
+            # similarity @ (rank / row_sums)
+            rank = (1 - self.damping) / n + self.damping * similarity_times(
+                rank * scale
+            )
+
+        # Centrality alone favours repeated content, so it only modulates
+        # the information boost (rank * n averages 1.0).
+        return (1 + rank * n) * boosts
+
+    def _render(self, sentences: List[Tuple[int, str, str]]) -> str:
+        """
+        Join the chosen sentences, prefixing each source message's role.
+        """
+        parts = []
+        last_message = None
+        for message_index, role, sentence in sentences:
+            if message_index != last_message:
+                parts.append(f"{role.capitalize()}: {sentence}")
+                last_message = message_index
+            else:
+                parts[-1] += f" {sentence}"
+        return "\n".join(parts)
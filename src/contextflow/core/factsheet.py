@@ -0,0 +1,303 @@
+"""
+Structured fact sheets maintained incrementally in place of prose summaries
+"""
+
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+from contextflow.core.compactor import fit_summary
+from contextflow.core.extractive import ExtractiveCompactor
+from contextflow.core.heuristic import tokenize
+from contextflow.core.score_cache import message_key
+from contextflow.utils.common import format_messages, moving_average
+from contextflow.utils.llm import resolve_client
+import threading
+import time
+
+# Categories in the order they are kept when the budget is tight
+CATEGORY_TITLES = {
+    "decision": "Decisions",
+    "issue": "Open issues",
+    "id": "IDs",
+    "entity": "Entities",
+}
+
+
+class FactSheet:
+    def __init__(self, max_facts: int = 2000, max_messages: int = 10_000):
+        """
+        Initialize the FactSheet.
+
+        Facts are deduplicated by category and key: a fact extracted again,
+        e.g. a later status of the same order, replaces the earlier value
+        instead of being added next to it. Each fact remembers the messages
+        it came from, so a rendering can be limited to what a given set of
+        messages said.
+
+        Args:
+            max_facts: Number of facts kept before the least recently
+                       updated ones are evicted.
+            max_messages: Number of extracted message keys remembered.
+        """
+        self.max_facts = max_facts
+        self.max_messages = max_messages
+        self._facts: "OrderedDict[tuple, Dict]" = OrderedDict()
+        # Whether each extracted message yielded any fact
+        self._seen: "OrderedDict[str, bool]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._facts)
+
+    def seen(self, key: str) -> bool:
+        """Whether facts were already extracted from the message key."""
+        with self._lock:
+            return key in self._seen
+
+    def yielded_facts(self, key: str) -> bool:
+        """Whether extraction found any fact in the message key."""
+        with self._lock:
+            return self._seen.get(key, False)
+
+    def merge(self, facts: List[Dict], sources: Iterable[str]):
+        """
+        Merge extracted facts into the sheet and mark their messages seen.
+
+        Args:
+            facts: {"category", "key", "value"} dictionaries, optionally
+                   with the "sources" (message keys) each one came from.
+                   Facts without them are attributed to all sources.
+            sources: Keys of the messages the facts were extracted from.
+        """
+        sources = set(sources)
+        productive = set()
+        with self._lock:
+            for fact in facts:
+                fact_sources = set(fact.get("sources", sources)) & sources
+                productive |= fact_sources
+                key = (fact["category"], " ".join(fact["key"].lower().split()))
+                entry = self._facts.get(key)
+                if entry is None:
+                    entry = {"category": fact["category"], "sources": set()}
+                    self._facts[key] = entry
+                entry["key"] = fact["key"]
+                entry["value"] = fact["value"]
+                entry["sources"] |= fact_sources
+                self._facts.move_to_end(key)
+
+            while len(self._facts) > self.max_facts:
+                self._facts.popitem(last=False)
+
+            for source in sources:
+                self._seen[source] = (
+                    self._seen.get(source, False) or source in productive
+                )
+                self._seen.move_to_end(source)
+            while len(self._seen) > self.max_messages:
+                self._seen.popitem(last=False)
+
+    def facts(self, sources: Optional[Set[str]] = None) -> List[Dict]:
+        """
+        Facts of the sheet, least recently updated first.
+
+        Args:
+            sources: If given, only facts from these message keys.
+
+        Returns:
+            List of {"category", "key", "value"} dictionaries.
+        """
+        with self._lock:
+            return [
+                {
+                    "category": entry["category"],
+                    "key": entry["key"],
+                    "value": entry["value"],
+                }
+                for entry in self._facts.values()
+                if sources is None or entry["sources"] & sources
+            ]
+
+    def render(
+        self, max_tokens: int, sources: Optional[Set[str]] = None
+    ) -> str:
+        """
+        Render facts as text within a token budget.
+
+        When not everything fits, decisions are kept first, then open
+        issues, IDs and entities, and within a category the most recently
+        updated facts first.
+
+        Args:
+            max_tokens: Maximum length of the text in tokens.
+            sources: If given, only facts from these message keys.
+
+        Returns:
+            One "Title: key: value; key: value" line per category, or "".
+        """
+        by_category: Dict[str, List[Dict]] = {}
+        for fact in self.facts(sources):
+            by_category.setdefault(fact["category"], []).append(fact)
+
+        budget = max(0, max_tokens) * 4
+        used = 0
+        lines = []
+        for category, title in CATEGORY_TITLES.items():
+            items = []
+            header = len(title) + 3
+            for fact in reversed(by_category.get(category, [])):
+                item = f"{fact['key']}: {fact['value']}"
+                cost = len(item) + 2 + (0 if items else header)
+                if used + cost > budget:
+                    continue
+                items.append(item)
+                used += cost
+            if items:
+                lines.append(f"{title}: " + "; ".join(reversed(items)))
+        return "\n".join(lines)
+
+
+class FactSheetCompactor:
+    def __init__(
+        self,
+        model,
+        sheet: Optional[FactSheet] = None,
+        batch_size: int = 10,
+        extract_tokens: int = 512,
+    ):
+        """
+        Initialize the FactSheetCompactor.
+
+        Instead of writing a new prose summary every turn, each message is
+        sent once, in small batches, to extract its facts, which are merged
+        into a FactSheet kept across calls. A summary is the sheet rendered
+        for the messages to summarize, so the LLM cost of summarizing grows
+        with the new messages only, and facts read the same from turn to
+        turn.
+
+        Args:
+            model: The LLM provider to extract facts with (e.g. "gemini"),
+                   a list of providers to hedge between, or an object with
+                   the same interface as LLMClient.
+            sheet: The fact store. Defaults to a new FactSheet.
+            batch_size: Number of new messages per extraction call.
+            extract_tokens: Maximum tokens of an extraction reply.
+        """
+        self.llm = resolve_client(model)
+        self.sheet = sheet if sheet is not None else FactSheet()
+        self.batch_size = batch_size
+        self.extract_tokens = extract_tokens
+        self.fallback = ExtractiveCompactor()
+        # Moving average of extraction call latency, in seconds
+        self.expected_latency: Optional[float] = None
+
+    def summarize(
+        self,
+        messages_to_summarize: List[Dict[str, str]],
+        max_token_count: int = 500,
+    ) -> str:
+        """
+        Summarizes a list of messages as a fact sheet.
+
+        Args:
+            messages_to_summarize: The list of messages to compress
+            max_token_count: The target length for the final summary
+
+        Returns:
+            summaries: The rendered facts of the messages. Messages whose
+                       extraction failed, or that yielded no facts, are
+                       summarized extractively instead, in their share of
+                       max_token_count.
+        """
+        if not messages_to_summarize or max_token_count <= 0:
+            return ""
+
+        if len(messages_to_summarize) == 1:
+            return fit_summary(
+                messages_to_summarize[0]["content"], max_token_count
+            )
+
+        unique = OrderedDict()
+        for message in messages_to_summarize:
+            unique.setdefault(message_key(message), message)
+        new = [m for key, m in unique.items() if not self.sheet.seen(key)]
+        self.extract(new)
+
+        # Failed extractions are not marked seen
+        leftover = [
+            m for key, m in unique.items() if not self.sheet.yielded_facts(key)
+        ]
+        share = max_token_count
+        if leftover:
+            share = (
+                max_token_count * (len(unique) - len(leftover)) // len(unique)
+            )
+        summary = self.sheet.render(share, set(unique))
+        if leftover or not summary:
+            remaining = max_token_count - len(summary) // 4 - 1
+            extra = self.fallback.summarize(
+                leftover or messages_to_summarize, remaining
+            )
+            summary = "\n".join(part for part in (summary, extra) if part)
+        return summary
+
+    def extract(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Extract the facts of messages into the sheet, batch_size messages
+        per call.
+
+        Args:
+            messages: Messages not extracted yet.
+
+        Returns:
+            The messages whose extraction call failed. They are not marked
+            seen, so a later call retries them.
+        """
+        failed = []
+        for i in range(0, len(messages), self.batch_size):
+            batch = messages[i : i + self.batch_size]
+            try:
+                started = time.monotonic()
+                facts = self.llm.extract_facts(
+                    source=format_messages(batch),
+                    max_tokens=self.extract_tokens,
+                )
+                self._record_latency(time.monotonic() - started)
+            except Exception as e:
+                print(f"Warning: Fact extraction failed ({e}). Using fallback.")
+                failed.extend(batch)
+                continue
+            keys = [message_key(m) for m in batch]
+            self.sheet.merge(
+                [
+                    {**fact, "sources": _attribute(fact, batch, keys)}
+                    for fact in facts
+                ],
+                keys,
+            )
+        return failed
+
+    def _record_latency(self, seconds: float):
+        self.expected_latency = moving_average(self.expected_latency, seconds)
+
+
+def _attribute(
+    fact: Dict[str, str], batch: List[Dict[str, str]], keys: List[str]
+) -> List[str]:
+    """
+    Keys of the messages of an extraction batch a fact came from.
+
+    The messages mentioning the fact's key, or else those sharing the
+    most words with it. A fact that matches no message is attributed to
+    the whole batch.
+    """
+    name = " ".join(fact["key"].lower().split())
+    contents = [" ".join(m.get("content", "").lower().split()) for m in batch]
+    mentioned = [k for k, c in zip(keys, contents) if name and name in c]
+    if mentioned:
+        return mentioned
+
+    words = set(tokenize(f"{fact['key']} {fact['value']}"))
+    overlaps = [len(words & set(tokenize(c))) for c in contents]
+    best = max(overlaps, default=0)
+    if best == 0:
+        return keys
+    return [k for k, overlap in zip(keys, overlaps) if overlap == best]
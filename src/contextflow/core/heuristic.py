@@ -0,0 +1,196 @@
+"""
+Local relevance heuristics used when the LLM scorer is unavailable or too slow
+"""
+
+from typing import Dict, List, Set
+import re
+
+
+# Spans that usually carry the facts worth keeping
+NUMBER = re.compile(r"\d")
+IDENTIFIER = re.compile(
+    r"#\w+|\b[A-Z]{2,}[-_]?\d+\b|\b\w*\d\w*[-_]\w+\b|\S+@\S+\.\w+"
+)
+ERROR = re.compile(
+    r"error|exception|traceback|failed|failure|timeout|denied|invalid",
+    re.IGNORECASE,
+)
+DECISION = re.compile(
+    r"\b(?:decided|decision|agreed|confirmed|approved|resolved|settled on"
+    r"|going with)\b",
+    re.IGNORECASE,
+)
+ENTITY = re.compile(r"(?<![.!?]\s)(?<!^)\b[A-Z][a-z]+")
+FILLER = re.compile(
+    r"(?:(?:ok(?:ay)?|thanks?(?: you)?|great|sure|got it|you're welcome"
+    r"|(?:hello|hi|hey)(?: there)?|bye|goodbye|perfect)\b[\s!.,]*)+",
+    re.IGNORECASE,
+)
+
+_TERM = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "are", "was",
+    "you", "your", "our", "can", "will", "have", "has", "not", "but",
+}  # fmt: skip
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Content words of a text, lowercased, in order.
+
+    Args:
+        text: Any text.
+
+    Returns:
+        Terms longer than two characters, without stopwords.
+    """
+    return [
+        term
+        for term in _TERM.findall(text.lower())
+        if len(term) > 2 and term not in _STOPWORDS
+    ]
+
+
+def goal_terms(goal: str) -> Set[str]:
+    """
+    Content words of a goal, lowercased.
+
+    Args:
+        goal: The goal of the agent.
+
+    Returns:
+        Set of terms longer than two characters, without stopwords.
+    """
+    return set(tokenize(goal))
+
+
+def message_features(text: str) -> Dict[str, int]:
+    """
+    Goal-independent features of a piece of text.
+
+    Args:
+        text: A sentence or message content.
+
+    Returns:
+        Dictionary with "filler", "numbers", "identifiers", "errors" and
+        "decisions" flags (0 or 1) and the number of named "entities".
+    """
+    if FILLER.fullmatch(text.strip()):
+        return {
+            "filler": 1,
+            "numbers": 0,
+            "identifiers": 0,
+            "errors": 0,
+            "decisions": 0,
+            "entities": 0,
+        }
+    return {
+        "filler": 0,
+        "numbers": int(bool(NUMBER.search(text))),
+        "identifiers": int(bool(IDENTIFIER.search(text))),
+        "errors": int(bool(ERROR.search(text))),
+        "decisions": int(bool(DECISION.search(text))),
+        "entities": len(ENTITY.findall(text)),
+    }
+
+
+def feature_boost(features: Dict[str, int]) -> float:
+    """
+    Information multiplier of a set of features from message_features.
+
+    Args:
+        features: Features of a text.
+
+    Returns:
+        0.0 for pure filler, otherwise 1.0 plus bonuses for numbers, IDs,
+        errors, decisions and named entities.
+    """
+    if features["filler"]:
+        return 0.0
+
+    return (
+        1.0
+        + 0.5 * features["numbers"]
+        + 1.0 * features["identifiers"]
+        + 1.0 * features["errors"]
+        + 0.5 * features["decisions"]
+        + 0.25 * min(features["entities"], 4)
+    )
+
+
+def information_boost(text: str) -> float:
+    """
+    Multiplier for how much hard information a piece of text carries.
+
+    Args:
+        text: A sentence or message content.
+
+    Returns:
+        0.0 for pure filler, otherwise 1.0 plus bonuses for numbers, IDs,
+        errors, decisions and named entities.
+    """
+    return feature_boost(message_features(text))
+
+
+def combine_score(boost: float, words: Set[str], terms: Set[str]) -> float:
+    """
+    Relevance score from a goal-independent information boost and the
+    goal-specific term overlap.
+
+    Args:
+        boost: Information boost of the message.
+        words: Terms of the message, as returned by tokenize.
+        terms: Terms of the goal, as returned by goal_terms.
+
+    Returns:
+        Relevance score between 0 and 10.
+    """
+    if boost == 0.0:
+        return 1.0
+
+    score = 1.0 + 1.5 * boost
+    if terms:
+        score += 3.0 * len(terms & words) / len(terms)
+    return max(0.0, min(10.0, score))
+
+
+def heuristic_score(content: str, terms: Set[str]) -> float:
+    """
+    Score one message from its information content and goal-term overlap.
+
+    Args:
+        content: The message content.
+        terms: Terms of the goal, as returned by goal_terms.
+
+    Returns:
+        Relevance score between 0 and 10.
+    """
+    return combine_score(
+        information_boost(content), set(tokenize(content)), terms
+    )
+
+
+def heuristic_scores(
+    messages: List[Dict[str, str]], goal: str, annotator=None
+) -> List[float]:
+    """
+    Score messages locally, without an LLM.
+
+    Args:
+        messages: List of message dictionaries with "role" and "content" keys.
+        goal: The goal of the agent.
+        annotator: Optional DensityAnnotator holding precomputed features of
+                   the messages, so only the goal overlap is computed here.
+
+    Returns:
+        List of relevance scores (0-10) corresponding to each message.
+    """
+    terms = goal_terms(goal)
+    if annotator is not None:
+        return [
+            annotator.annotation(message).score(terms) for message in messages
+        ]
+    return [
+        heuristic_score(message.get("content", ""), terms)
+        for message in messages
+    ]
@@ -0,0 +1,244 @@
+"""
+Incremental BM25 index used to prefilter messages before LLM scoring
+"""
+
+from collections import Counter, OrderedDict
+from typing import Dict, List, Set, Tuple
+from contextflow.core.heuristic import tokenize
+from contextflow.core.score_cache import message_key
+import hashlib
+import math
+import threading
+
+
+class MessageIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Initialize the MessageIndex.
+
+        An inverted index over message contents, keyed by message_key so a
+        message seen again on a later turn is not indexed twice. Adding a
+        message only touches the postings of its own terms.
+
+        Args:
+            k1: BM25 term frequency saturation.
+            b: BM25 length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._lengths
+
+    def add(self, message: Dict[str, str]) -> str:
+        """
+        Index one message if it is not indexed yet.
+
+        Args:
+            message: Message dictionary with a "content" key.
+
+        Returns:
+            The message's key.
+        """
+        key = message_key(message)
+        if key in self._lengths:
+            return key
+
+        terms = tokenize(message.get("content", ""))
+        for term, count in Counter(terms).items():
+            self._postings.setdefault(term, {})[key] = count
+        self._lengths[key] = len(terms)
+        self._total_length += len(terms)
+        return key
+
+    def extend(self, messages: List[Dict[str, str]]) -> List[str]:
+        """
+        Index every message that is not indexed yet.
+
+        Args:
+            messages: List of message dictionaries.
+
+        Returns:
+            The key of each message, in order.
+        """
+        return [self.add(message) for message in messages]
+
+    def clear(self):
+        """Remove every message from the index."""
+        self._postings.clear()
+        self._lengths.clear()
+        self._total_length = 0
+
+    def search(self, query: str) -> Dict[str, float]:
+        """
+        BM25 scores of the indexed messages for a query.
+
+        Args:
+            query: The query, e.g. the agent's goal.
+
+        Returns:
+            Dictionary mapping the key of every message sharing a term with
+            the query to its score. Other messages score 0 and are left out.
+        """
+        count = len(self._lengths)
+        if count == 0:
+            return {}
+        average_length = self._total_length / count or 1.0
+
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            for key, tf in postings.items():
+                norm = 1 - self.b + self.b * self._lengths[key] / average_length
+                weight = idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+                scores[key] = scores.get(key, 0.0) + weight
+        return scores
+
+
+def prefix_digests(keys: List[str]) -> List[str]:
+    """
+    Rolling digests of every prefix of a conversation.
+
+    Args:
+        keys: The message_key of each message, in order.
+
+    Returns:
+        The digest of keys[:i + 1] at position i, each one computed from the
+        previous digest and the next key.
+    """
+    digests = []
+    previous = b""
+    for key in keys:
+        digest = hashlib.blake2b(previous + key.encode(), digest_size=16)
+        previous = digest.digest()
+        digests.append(digest.hexdigest())
+    return digests
+
+
+class Prefilter:
+    def __init__(
+        self,
+        top_k: int = 40,
+        recent: int = 10,
+        default_score: float = 3.0,
+        max_conversations: int = 1000,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        """
+        Initialize the Prefilter.
+
+        Shortlists the messages worth sending to the LLM scorer: the top_k
+        best BM25 matches for the goal plus the most recent messages. The
+        rest get default_score without an LLM call.
+
+        Each conversation has its own index, so BM25 statistics are never
+        mixed across conversations. An index is keyed by the rolling digest
+        of the whole prefix it covers, so a call continues the index whose
+        prefix its messages start with, and only the messages appended
+        since are indexed. Conversations that share their first messages,
+        or whose history was edited anywhere, get an index of their own.
+
+        Args:
+            top_k: Number of best matching messages to shortlist.
+            recent: Number of most recent messages always shortlisted.
+            default_score: Score of messages left off the shortlist when the
+                           scorer has no DensityAnnotator. The default is
+                           below the balanced strategy's summarize
+                           threshold, so they are dropped.
+            max_conversations: Number of conversation indices kept; the
+                               least recently used is evicted beyond it.
+            k1: BM25 term frequency saturation.
+            b: BM25 length normalization.
+        """
+        self.top_k = top_k
+        self.recent = recent
+        self.default_score = default_score
+        self.max_conversations = max_conversations
+        self.k1 = k1
+        self.b = b
+        self._conversations: "OrderedDict[str, MessageIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of conversations indexed."""
+        return len(self._conversations)
+
+    def index(self, messages: List[Dict[str, str]]) -> MessageIndex:
+        """
+        The up-to-date index of a conversation.
+
+        Args:
+            messages: List of message dictionaries.
+
+        Returns:
+            The conversation's MessageIndex.
+        """
+        with self._lock:
+            return self._update(messages)[0]
+
+    def shortlist(self, messages: List[Dict[str, str]], goal: str) -> Set[int]:
+        """
+        Indices of the messages that should be scored by the LLM.
+
+        New messages are added to the conversation's index first.
+
+        Args:
+            messages: List of message dictionaries.
+            goal: The goal of the agent.
+
+        Returns:
+            Set of indices into messages.
+        """
+        with self._lock:
+            index, keys = self._update(messages)
+            if len(messages) <= self.top_k + self.recent:
+                return set(range(len(messages)))
+            matches = index.search(goal)
+
+        ranked = sorted(
+            (i for i, key in enumerate(keys) if key in matches),
+            key=lambda i: matches[keys[i]],
+            reverse=True,
+        )
+        selected = set(ranked[: self.top_k])
+        selected.update(
+            range(max(0, len(messages) - self.recent), len(messages))
+        )
+        return selected
+
+    def _update(
+        self, messages: List[Dict[str, str]]
+    ) -> Tuple[MessageIndex, List[str]]:
+        """Index a conversation's new messages; call with the lock held."""
+        keys = [message_key(message) for message in messages]
+        digests = prefix_digests(keys)
+        indexed = next(
+            (
+                i + 1
+                for i in range(len(digests) - 1, -1, -1)
+                if digests[i] in self._conversations
+            ),
+            0,
+        )
+        if indexed:
+            index = self._conversations.pop(digests[indexed - 1])
+        else:
+            index = MessageIndex(k1=self.k1, b=self.b)
+
+        index.extend(messages[indexed:])
+        if digests:
+            self._conversations[digests[-1]] = index
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        return index, keys
@@ -0,0 +1,185 @@
+"""
+Cost-based planning of how much work an optimization needs
+"""
+
+from typing import Dict, List, Optional
+from contextflow.utils.tokenizer import content_length, count_tokens
+import math
+
+PASSTHROUGH = "passthrough"
+RECENCY_TRIM = "recency_trim"
+LOCAL_SCORING = "local_scoring"
+FULL = "full"
+
+
+def trim_oldest(
+    messages: List[Dict[str, str]], max_token_count: int
+) -> List[Dict[str, str]]:
+    """
+    Drop the oldest messages until the rest fit, always keeping the newest.
+
+    Leading system messages (the system prompt) are pinned: they are kept
+    ahead of the trailing messages as long as they fit together with the
+    newest message.
+
+    Args:
+        messages: List of message dictionaries.
+        max_token_count: Maximum number of tokens allowed.
+
+    Returns:
+        The pinned system messages and the trailing messages that fit
+        within max_token_count.
+    """
+    pinned = 0
+    while pinned < len(messages) and messages[pinned].get("role") == "system":
+        pinned += 1
+    length = sum(content_length(m) for m in messages[:pinned])
+    if (
+        pinned == len(messages)
+        or (length + content_length(messages[-1])) // 4 > max_token_count
+    ):
+        pinned = length = 0
+
+    kept = []
+    for message in reversed(messages[pinned:]):
+        message_length = content_length(message)
+        # Same arithmetic as count_tokens on the kept messages
+        if kept and (length + message_length) // 4 > max_token_count:
+            break
+        kept.append(message)
+        length += message_length
+    kept.reverse()
+    return list(messages[:pinned]) + kept
+
+
+class Planner:
+    def __init__(
+        self,
+        trim_ratio: float = 0.1,
+        local_max_messages: int = 0,
+        local_max_tokens: Optional[int] = None,
+        batch_size: int = 20,
+        scoring_latency_ms: float = 1000.0,
+        summary_latency_ms: float = 2000.0,
+    ):
+        """
+        Initialize the Planner.
+
+        Estimates the LLM calls and latency of each of four plans and picks
+        the cheapest one that meets the token budget and the deadline:
+            - "passthrough": the input already fits, return it as-is
+            - "recency_trim": dropping a few of the oldest messages is enough
+            - "local_scoring": score with local heuristics, summarize locally
+            - "full": LLM scoring plus the configured strategy and compactor
+
+        "local_scoring" bypasses the configured scorer and compactor, so it
+        is only chosen when it was asked for (local_max_messages) or when
+        the full plan, going by observed latencies, is estimated to miss
+        the deadline, in which case its LLM calls would fall back to the
+        same heuristics anyway.
+
+        Args:
+            trim_ratio: Largest share of the input tokens that a recency trim
+                        may drop before a smarter plan is used.
+            local_max_messages: Conversations with at most this many messages
+                                are scored locally instead of by the LLM.
+                                Defaults to 0 (never by size).
+            local_max_tokens: If given, conversations are only scored
+                              locally by size if they also have at most this
+                              many tokens.
+            batch_size: Messages per LLM scoring batch.
+            scoring_latency_ms: Assumed latency of a scoring round when none
+                                has been observed yet.
+            summary_latency_ms: Assumed latency of a summarization call when
+                                none has been observed yet.
+        """
+        self.trim_ratio = trim_ratio
+        self.local_max_messages = local_max_messages
+        self.local_max_tokens = local_max_tokens
+        self.batch_size = batch_size
+        self.scoring_latency_ms = scoring_latency_ms
+        self.summary_latency_ms = summary_latency_ms
+
+    def plan(
+        self,
+        messages: List[Dict[str, str]],
+        max_token_count: int,
+        scoring_latency: Optional[float] = None,
+        summary_latency: Optional[float] = None,
+        deadline_ms: Optional[float] = None,
+    ) -> Dict:
+        """
+        Estimate the work an optimization needs and choose a plan.
+
+        Args:
+            messages: The messages to optimize.
+            max_token_count: Maximum number of tokens allowed.
+            scoring_latency: Observed scoring latency in seconds, if any.
+            summary_latency: Observed summarization latency in seconds, if any.
+            deadline_ms: Latency budget of the optimization, if any.
+
+        Returns:
+            Dictionary with the chosen "plan", the "reason" it was chosen,
+            "tokens_before", and its "estimated_llm_calls" and
+            "estimated_ms".
+        """
+        tokens_before = count_tokens(messages)
+        plan = {
+            "plan": PASSTHROUGH,
+            "reason": "fits the budget",
+            "tokens_before": tokens_before,
+            "estimated_llm_calls": 0,
+            "estimated_ms": 0.0,
+        }
+
+        # Plans without LLM calls first, cheapest first
+        if tokens_before <= max_token_count:
+            return plan
+
+        trimmed_tokens = count_tokens(trim_oldest(messages, max_token_count))
+        if (
+            trimmed_tokens <= max_token_count
+            and tokens_before - trimmed_tokens
+            <= self.trim_ratio * tokens_before
+        ):
+            plan["plan"] = RECENCY_TRIM
+            plan["reason"] = "small overflow"
+            return plan
+
+        if len(messages) <= self.local_max_messages and (
+            self.local_max_tokens is None
+            or tokens_before <= self.local_max_tokens
+        ):
+            plan["plan"] = LOCAL_SCORING
+            plan["reason"] = "small conversation"
+            return plan
+
+        scoring_ms = (
+            scoring_latency * 1000
+            if scoring_latency is not None
+            else self.scoring_latency_ms
+        )
+        summary_ms = (
+            summary_latency * 1000
+            if summary_latency is not None
+            else self.summary_latency_ms
+        )
+        estimated_calls = math.ceil(len(messages) / self.batch_size) + 1
+        estimated_ms = scoring_ms + summary_ms
+
+        # Only once scoring latency was observed: the assumed defaults
+        # would otherwise keep the LLM from ever being tried
+        if (
+            deadline_ms is not None
+            and scoring_latency is not None
+            and estimated_ms > deadline_ms
+        ):
+            plan["plan"] = LOCAL_SCORING
+            plan["reason"] = "predicted to miss deadline"
+            return plan
+
+        plan["plan"] = FULL
+        plan["reason"] = "needs LLM scoring"
+        plan["estimated_llm_calls"] = estimated_calls
+        plan["estimated_ms"] = estimated_ms
+        return plan
@@ -0,0 +1,142 @@
+"""
+Background prefetch of the work for the next optimize() call
+"""
+
+from concurrent.futures import (
+    CancelledError,
+    Future,
+    ThreadPoolExecutor,
+    TimeoutError,
+)
+from typing import Callable, Dict, List, Optional
+from contextflow.core.score_cache import message_key
+import threading
+
+
+# Prefetches run here so they never hold up the agent's own thread
+_executor = ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix="contextflow-prefetch"
+)
+
+
+class Prefetch:
+    def __init__(
+        self,
+        messages: List[Dict[str, str]],
+        goal: str,
+        max_token_count: int,
+    ):
+        """
+        Handle on a background run that warms the score and summary caches
+        for a snapshot of the history.
+
+        Args:
+            messages: The history the prefetch works on.
+            goal: The goal it scores the history for.
+            max_token_count: The budget it optimizes for.
+        """
+        self.keys = [message_key(message) for message in messages]
+        self.goal = goal
+        self.max_token_count = max_token_count
+        self.cancelled = threading.Event()
+        self.future: Optional[Future] = None
+
+    def start(self, work: Callable[[], object]):
+        """
+        Run work on the prefetch executor.
+
+        Args:
+            work: Function doing the prefetch. It should check
+                  self.cancelled between its expensive steps.
+        """
+        self.future = _executor.submit(work)
+
+    def matches(
+        self, messages: List[Dict[str, str]], goal: str, max_token_count: int
+    ) -> bool:
+        """
+        Whether an optimize() call can use the prefetch: same goal and
+        budget, and a history that continues the prefetched one, i.e.
+        starts with the same messages. Appending new messages keeps the
+        prefetch useful; editing or removing earlier ones does not.
+
+        Args:
+            messages: The history of the optimize() call.
+            goal: Its goal.
+            max_token_count: Its budget.
+
+        Returns:
+            True if the prefetch does work that call would do.
+        """
+        if goal != self.goal or max_token_count != self.max_token_count:
+            return False
+        if len(messages) < len(self.keys):
+            return False
+        return all(
+            message_key(message) == key
+            for message, key in zip(messages, self.keys)
+        )
+
+    def cancel(self):
+        """
+        Stop the prefetch at its next checkpoint. Anything it already
+        cached stays valid, since the caches are keyed by content.
+        """
+        self.cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def done(self) -> bool:
+        """Whether the prefetch has finished."""
+        return self.future is not None and self.future.done()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the prefetch to finish.
+
+        Args:
+            timeout: Maximum number of seconds to wait.
+
+        Returns:
+            True if it finished successfully, False if it failed, was
+            cancelled or is still running.
+        """
+        if self.future is None:
+            return False
+        try:
+            self.future.result(timeout=timeout)
+        except (CancelledError, TimeoutError):
+            return False
+        except Exception as e:
+            print(f"Warning: Prefetch failed ({e}).")
+            return False
+        return not self.cancelled.is_set()
+
+
+class CancellableCompactor:
+    def __init__(self, compactor, cancelled: threading.Event):
+        """
+        Wrap the compactor of a prefetch so it stops summarizing, without
+        an LLM call, once the prefetch is cancelled.
+
+        Args:
+            compactor: The compactor to wrap.
+            cancelled: The prefetch's cancellation flag.
+        """
+        self.compactor = compactor
+        self.cancelled = cancelled
+
+    def summarize(
+        self,
+        messages_to_summarize: List[Dict[str, str]],
+        max_token_count: int = 500,
+    ) -> str:
+        """
+        Summarizes a list of messages unless the prefetch was cancelled.
+
+        Returns:
+            The wrapped compactor's summary, or "" once cancelled.
+        """
+        if self.cancelled.is_set():
+            return ""
+        return self.compactor.summarize(messages_to_summarize, max_token_count)
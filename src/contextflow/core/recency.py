@@ -0,0 +1,188 @@
+"""
+Recency models that boost recent messages and decide how many to preserve
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+
+class RecencyModel:
+    def __init__(
+        self,
+        role_weights: Optional[Dict[str, float]] = None,
+        preserve_tiers: Sequence[Tuple[float, int]] = ((7.0, 5), (4.0, 3)),
+        min_preserve: int = 2,
+        preserve_window: int = 10,
+    ):
+        """
+        Initialize the recency model.
+
+        Args:
+            role_weights: Multiplier applied to the recency bonus per role,
+                          e.g. {"tool": 0.5}. Roles not listed use 1.0.
+            preserve_tiers: (min_average_score, count) pairs, checked in
+                            order. The first tier whose threshold the average
+                            recent score reaches decides how many recent
+                            messages are always preserved.
+            min_preserve: Number of recent messages preserved when no tier
+                          matches.
+            preserve_window: Number of trailing scores averaged to pick a
+                             preserve tier.
+        """
+        self.role_weights = role_weights or {}
+        self.preserve_tiers = [tuple(tier) for tier in preserve_tiers]
+        self.min_preserve = min_preserve
+        self.preserve_window = preserve_window
+
+    def bonus(self, messages: List[Dict[str, str]]) -> np.ndarray:
+        """
+        Recency bonus per message, before role weighting. The base model
+        adds none and only decides how many recent messages to preserve.
+
+        Args:
+            messages: The messages of the conversation.
+
+        Returns:
+            Array such that bonus[i] is added to the score of message i.
+        """
+        return np.zeros(len(messages))
+
+    def apply(
+        self, messages: List[Dict[str, str]], scores: List[float]
+    ) -> List[float]:
+        """
+        Add the recency bonus to raw scores in one vectorized pass.
+
+        Args:
+            messages: The scored messages.
+            scores: Raw relevance scores, scores[i] belonging to messages[i].
+
+        Returns:
+            A new list of scores with the weighted bonus applied.
+        """
+        bonus = self.bonus(messages)
+        if self.role_weights:
+            weights = np.array(
+                [
+                    self.role_weights.get(message.get("role"), 1.0)
+                    for message in messages
+                ]
+            )
+            bonus = bonus * weights
+        return (np.asarray(scores, dtype=float) + bonus).tolist()
+
+    def preserve_count(self, scores: List[float]) -> int:
+        """
+        Number of recent messages to always keep, based on how useful the
+        recent messages are.
+
+        Args:
+            scores: Scores of the whole conversation.
+
+        Returns:
+            Number of trailing messages to preserve.
+        """
+        recent_scores = scores[-self.preserve_window :]
+        if not recent_scores:
+            return self.min_preserve
+
+        avg_recent_score = sum(recent_scores) / len(recent_scores)
+        for threshold, count in self.preserve_tiers:
+            if avg_recent_score >= threshold:
+                return count
+        return self.min_preserve
+
+
+class WindowRecency(RecencyModel):
+    def __init__(self, window: int = 5, amount: float = 1.0, **kwargs):
+        """
+        Flat bonus for the last `window` messages.
+
+        Args:
+            window: Number of trailing messages that get the bonus.
+            amount: Bonus added to each of them.
+            **kwargs: Passed to RecencyModel.
+        """
+        super().__init__(**kwargs)
+        self.window = window
+        self.amount = amount
+
+    def bonus(self, messages: List[Dict[str, str]]) -> np.ndarray:
+        bonus = np.zeros(len(messages))
+        if self.window > 0:
+            bonus[-self.window :] = self.amount
+        return bonus
+
+
+class ExponentialRecency(RecencyModel):
+    def __init__(self, half_life: float = 3.0, amount: float = 1.0, **kwargs):
+        """
+        Bonus that halves every `half_life` messages back from the newest.
+
+        Args:
+            half_life: Age (in messages) at which the bonus is halved.
+            amount: Bonus of the newest message.
+            **kwargs: Passed to RecencyModel.
+        """
+        super().__init__(**kwargs)
+        self.half_life = half_life
+        self.amount = amount
+
+    def bonus(self, messages: List[Dict[str, str]]) -> np.ndarray:
+        ages = np.arange(len(messages) - 1, -1, -1, dtype=float)
+        return self.amount * np.power(0.5, ages / self.half_life)
+
+
+class TurnRecency(RecencyModel):
+    def __init__(self, turns: int = 2, amount: float = 1.0, **kwargs):
+        """
+        Flat bonus for every message in the last `turns` turns. A turn starts
+        at a user message and includes the replies and tool calls after it.
+
+        Args:
+            turns: Number of trailing turns that get the bonus.
+            amount: Bonus added to each of their messages.
+            **kwargs: Passed to RecencyModel.
+        """
+        super().__init__(**kwargs)
+        self.turns = turns
+        self.amount = amount
+
+    def bonus(self, messages: List[Dict[str, str]]) -> np.ndarray:
+        is_user = np.array(
+            [message.get("role") == "user" for message in messages], dtype=int
+        )
+        # Turn number of each message, counted back from the newest turn
+        turn_from_end = is_user[::-1].cumsum()[::-1] - is_user
+        bonus = np.zeros(len(messages))
+        bonus[turn_from_end < self.turns] = self.amount
+        return bonus
+
+
+RECENCY_MODELS = {
+    "window": WindowRecency,
+    "exponential": ExponentialRecency,
+    "turn": TurnRecency,
+}
+
+
+def recency_from_config(config: Dict) -> RecencyModel:
+    """
+    Build a recency model from a configuration dictionary.
+
+    Args:
+        config: Dictionary with a "type" key (one of RECENCY_MODELS) and the
+                keyword arguments of that model, e.g.
+                {"type": "exponential", "half_life": 4, "role_weights": {"tool": 0.5}}.
+
+    Returns:
+        The configured RecencyModel.
+
+    Raises:
+        ValueError: If the type is unknown.
+    """
+    config = dict(config)
+    kind = config.pop("type", "window")
+    if kind not in RECENCY_MODELS:
+        raise ValueError(f"Unknown recency model: {kind}")
+    return RECENCY_MODELS[kind](**config)
@@ -0,0 +1,185 @@
+"""
+Goal-conditioned score storage and reuse
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+from contextflow.core.heuristic import goal_terms
+import hashlib
+import math
+import threading
+
+
+def message_key(message: Dict[str, str]) -> str:
+    """
+    Stable key for a message based on its role and content.
+
+    Args:
+        message: Message dictionary with "role" and "content" keys.
+
+    Returns:
+        Hex digest identifying the message.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(message.get("role", "").encode())
+    digest.update(b"\0")
+    digest.update(message.get("content", "").encode())
+    return digest.hexdigest()
+
+
+def goal_similarity(a: Set[str], b: Set[str]) -> float:
+    """
+    Cosine similarity between the content terms of two goals.
+
+    Args:
+        a: Content terms of the first goal (see heuristic.goal_terms).
+        b: Content terms of the second goal.
+
+    Returns:
+        Similarity between 0.0 and 1.0; exactly 1.0 for the same terms.
+    """
+    shared = len(a & b)
+    if shared == 0:
+        return 0.0
+    return shared / math.sqrt(len(a) * len(b))
+
+
+class ScoreCache:
+    def __init__(
+        self,
+        max_messages: int = 10_000,
+        reuse_threshold: float = 1.0,
+        interpolate_threshold: Optional[float] = None,
+        max_goals: int = 1000,
+    ):
+        """
+        Initialize the ScoreCache.
+
+        Raw relevance scores are stored per message and per goal. Goals are
+        compared by their content terms, without stopwords. By default a
+        lookup only reuses the scores of a goal with the same content terms
+        (e.g. one differing in case, punctuation or stopwords): goals that
+        differ in a single word, such as "billing issue" and "shipping
+        issue", can call for opposite scores. Lowering reuse_threshold or
+        setting interpolate_threshold opts in to reusing the closest goal's
+        scores, or interpolating between several close goals.
+
+        Args:
+            max_messages: Number of messages to keep scores for before the
+                          least recently used ones are evicted.
+            reuse_threshold: Goal similarity at which a cached score is
+                             reused as-is.
+            interpolate_threshold: Minimum goal similarity for a cached
+                                   score to contribute to an interpolated
+                                   one. None disables interpolation.
+            max_goals: Number of goals whose terms are kept for similarity
+                       lookups before the least recently used ones are
+                       evicted. Scores of an evicted goal are still found
+                       by exact goal.
+        """
+        self.max_messages = max_messages
+        self.reuse_threshold = reuse_threshold
+        self.interpolate_threshold = interpolate_threshold
+        self.max_goals = max_goals
+
+        self._entries: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._goal_terms: "OrderedDict[str, Set[str]]" = OrderedDict()
+        # Background prefetches write while optimize() reads
+        self._lock = threading.Lock()
+
+    def put(
+        self,
+        goal: str,
+        messages: List[Dict[str, str]],
+        scores: List[float],
+    ):
+        """
+        Store the scores of messages for a goal.
+
+        Args:
+            goal: The goal the messages were scored against.
+            messages: The scored messages.
+            scores: scores[i] is the raw relevance score of messages[i].
+        """
+        keys = [message_key(message) for message in messages]
+        terms = goal_terms(goal)
+
+        with self._lock:
+            self._goal_terms[goal] = terms
+            self._goal_terms.move_to_end(goal)
+            while len(self._goal_terms) > self.max_goals:
+                self._goal_terms.popitem(last=False)
+
+            for key, score in zip(keys, scores):
+                entry = self._entries.setdefault(key, {})
+                entry[goal] = score
+                self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_messages:
+                self._entries.popitem(last=False)
+
+    def get(
+        self, goal: str, messages: List[Dict[str, str]]
+    ) -> List[Optional[float]]:
+        """
+        Look up cached scores for a goal.
+
+        Args:
+            goal: The goal to score against.
+            messages: The messages to look up.
+
+        Returns:
+            A list such that result[i] is the exact, reused or interpolated
+            score of messages[i], or None if no close enough goal was scored.
+        """
+        terms = goal_terms(goal)
+        keys = [message_key(message) for message in messages]
+
+        with self._lock:
+            similarities = {
+                cached: goal_similarity(terms, cached_terms)
+                for cached, cached_terms in self._goal_terms.items()
+            }
+
+            results = []
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    results.append(None)
+                    continue
+                self._entries.move_to_end(key)
+                results.append(self._resolve(goal, entry, similarities))
+
+        return results
+
+    def _resolve(
+        self,
+        goal: str,
+        entry: Dict[str, float],
+        similarities: Dict[str, float],
+    ) -> Optional[float]:
+        """
+        Pick the exact, reused or interpolated score from one message entry.
+        """
+        if goal in entry:
+            return entry[goal]
+
+        best_goal = max(entry, key=lambda g: similarities.get(g, 0.0))
+        if similarities.get(best_goal, 0.0) >= self.reuse_threshold:
+            return entry[best_goal]
+        if self.interpolate_threshold is None:
+            return None
+
+        weighted = [
+            (similarities[g], score)
+            for g, score in entry.items()
+            if similarities.get(g, 0.0) >= self.interpolate_threshold
+        ]
+        if not weighted:
+            return None
+
+        total_weight = sum(weight for weight, _ in weighted)
+        return sum(weight * score for weight, score in weighted) / total_weight
+
+    def __len__(self) -> int:
+        return len(self._entries)
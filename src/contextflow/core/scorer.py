@@ -2,20 +2,100 @@
 Message relevance and utility scoring
 """
 
-from typing import List, Dict
-from contextflow.utils.llm import LLMClient
+from typing import List, Dict, Optional
+from contextflow.core.boilerplate import BoilerplateLibrary
+from contextflow.core.deadline import Deadline
+from contextflow.core.density import DensityAnnotator
+from contextflow.core.excerpt import ExcerptPolicy
+from contextflow.core.heuristic import heuristic_scores
+from contextflow.core.index import Prefilter
+from contextflow.core.recency import RecencyModel, WindowRecency
+from contextflow.core.score_cache import ScoreCache
+from contextflow.utils.common import moving_average
+from contextflow.utils.llm import resolve_client
+from contextflow.utils.loop import run_sync
+from contextflow.utils.providers.base import normalize_score_vector
 import asyncio
+import threading
+import time
+
+SCORE_FORMATS = ("json", "digits")
+
+# Score of messages left without an LLM or heuristic score: between the
+# balanced strategy's summarize and keep thresholds
+NEUTRAL_SCORE = 5.0
+
+# Seconds between checks of a cancellation flag while batches run
+_CANCEL_POLL = 0.01
 
 
 class MessageScorer:
-    def __init__(self, model: str):
+    def __init__(
+        self,
+        model,
+        cache: Optional[ScoreCache] = None,
+        recency: Optional[RecencyModel] = None,
+        score_format: str = "json",
+        use_logprobs: bool = False,
+        excerpt: Optional[ExcerptPolicy] = None,
+        prefilter: Optional[Prefilter] = None,
+        annotator: Optional[DensityAnnotator] = None,
+        boilerplate: Optional[BoilerplateLibrary] = None,
+    ):
         """
         Initialize the MessageScorer.
 
         Args:
-            model: The LLM provider to use for scoring (e.g., "gemini", "groq").
+            model: The LLM provider to use for scoring (e.g., "gemini", "groq"),
+                   a list of providers to hedge between, or an object with the
+                   same interface as LLMClient.
+            cache: Store for raw scores, shared across goals. Scores for a goal
+                   close to one already scored are reused instead of asking the
+                   LLM again. Defaults to a new ScoreCache.
+            recency: Model of the bonus added to recent messages. Defaults to
+                     a flat +1.0 on the last five messages.
+            score_format: Output format the LLM scores in. "json" is the
+                          verbose JSON format; "digits" asks for one 0-9 digit
+                          per message, which cuts completion tokens and
+                          latency. Defaults to "json".
+            use_logprobs: With "digits", use the probability-weighted expected
+                          digit where the provider exposes logprobs (Gemini).
+            excerpt: How oversized messages are shortened before they are
+                     sent for scoring, which bounds the cost of scoring any
+                     one message. Defaults to an ExcerptPolicy capping each
+                     message at 256 tokens.
+            prefilter: If given, only the messages it shortlists for a goal
+                       are sent to the LLM; the others get its default
+                       score. Defaults to None (every message is scored).
+            annotator: Precomputed goal-independent message features. When
+                       given, messages scored without the LLM (off the
+                       prefilter shortlist, or past the deadline) get their
+                       density combined with the goal overlap instead of a
+                       flat or freshly computed heuristic score.
+            boilerplate: Library of known boilerplate blocks. Messages it
+                         recognizes get the block's precomputed score
+                         without an LLM call.
+
+        Raises:
+            ValueError: If an unknown score format is specified.
         """
-        self.llm = LLMClient(model)
+        if score_format not in SCORE_FORMATS:
+            raise ValueError(
+                f"Unknown score format: {score_format}. "
+                f"Options: {', '.join(SCORE_FORMATS)}"
+            )
+
+        self.llm = resolve_client(model)
+        self.cache = cache if cache is not None else ScoreCache()
+        self.recency = recency if recency is not None else WindowRecency()
+        self.score_format = score_format
+        self.use_logprobs = use_logprobs
+        self.excerpt = excerpt if excerpt is not None else ExcerptPolicy()
+        self.prefilter = prefilter
+        self.annotator = annotator
+        self.boilerplate = boilerplate
+        # Moving average of a scoring round's latency, in seconds
+        self.expected_latency: Optional[float] = None
 
     def _create_batches(
         self, messages: List[Dict[str, str]], batch_size: int = 20
@@ -39,7 +119,13 @@ class MessageScorer:
         ]
 
     def score_messages(
-        self, messages: List[Dict[str, str]], goal: str
+        self,
+        messages: List[Dict[str, str]],
+        goal: str,
+        deadline: Optional[Deadline] = None,
+        degradations: Optional[List[Dict]] = None,
+        fallback_deadline: Optional[Deadline] = None,
+        cancelled: Optional[threading.Event] = None,
     ) -> List[float]:
         """
         Score messages synchronously based on relevance to the agent's goal.
@@ -47,40 +133,277 @@ class MessageScorer:
         Args:
             messages: List of message dictionaries with "role" and "content" keys.
             goal: The goal of the agent to guide relevance scoring.
+            deadline: If given, batches still running at the deadline are
+                      abandoned and scored with local heuristics instead.
+            degradations: List that a record is appended to for every batch
+                          that fell back to heuristic scores.
+            fallback_deadline: If given, late batches reached after it get
+                               the neutral score without computing
+                               heuristics, which are costly on long
+                               messages that were never annotated.
+            cancelled: If given and set while batches are running, they are
+                       abandoned and their messages get the neutral score,
+                       e.g. to stop a prefetch that is no longer needed.
 
         Returns:
             List of relevance scores (0-10) corresponding to each message.
         """
-        return asyncio.run(self.score_all(messages, goal))
+        return run_sync(
+            self.score_all(
+                messages,
+                goal,
+                deadline,
+                degradations,
+                fallback_deadline,
+                cancelled,
+            )
+        )
 
     async def score_all(
-        self, messages: List[Dict[str, str]], goal: str
+        self,
+        messages: List[Dict[str, str]],
+        goal: str,
+        deadline: Optional[Deadline] = None,
+        degradations: Optional[List[Dict]] = None,
+        fallback_deadline: Optional[Deadline] = None,
+        cancelled: Optional[threading.Event] = None,
     ) -> List[float]:
         """Scores messages based on how relevant they are to the agent's goal.
 
         Args:
             messages: A list of messages
             goal: The goal of the agent
+            deadline: Optional deadline for the LLM scoring batches
+            degradations: Optional list to record heuristic fallbacks in
+            fallback_deadline: Optional deadline for the heuristic fallbacks
+            cancelled: Optional event that abandons the running batches
         Returns:
             A list scores such that scores[i] is the relevancy score of messages[i]
         """
 
-        scores = []
+        scores = self.cache.get(goal, messages)
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        if missing and self.boilerplate is not None:
+            for i in missing:
+                block = self.boilerplate.match(messages[i])
+                if block is not None:
+                    scores[i] = block.score
+            missing = [i for i in missing if scores[i] is None]
+
+        if missing and self.prefilter is not None:
+            shortlist = self.prefilter.shortlist(messages, goal)
+            skipped = [i for i in missing if i not in shortlist]
+            if self.annotator is not None:
+                local = heuristic_scores(
+                    [messages[i] for i in skipped], goal, self.annotator
+                )
+            else:
+                local = [self.prefilter.default_score] * len(skipped)
+            for i, score in zip(skipped, local):
+                scores[i] = score
+            missing = [i for i in missing if i in shortlist]
+
+        if missing:
+            to_score = [messages[i] for i in missing]
+            batches = self._create_batches(to_score, 20)
+            started = time.monotonic()
+
+            # Only non-default formats are passed, so clients written
+            # against the older interface keep working
+            format_options = {}
+            if self.score_format != "json" or self.use_logprobs:
+                format_options = {
+                    "output_format": self.score_format,
+                    "use_logprobs": self.use_logprobs,
+                }
+
+            tasks = [
+                asyncio.ensure_future(
+                    self.llm.score_batch_async(
+                        goal=goal,
+                        batch=self.excerpt.apply(batch, goal),
+                        max_tokens=400,
+                        **format_options,
+                    )
+                )
+                for batch in batches
+            ]
+
+            if cancelled is not None:
+                results, llm_scored = await self._gather_unless(
+                    tasks, batches, cancelled
+                )
+            elif deadline is None:
+                results = await asyncio.gather(*tasks)
+                llm_scored = [True] * len(batches)
+            else:
+                results, llm_scored = await self._gather_within(
+                    tasks,
+                    batches,
+                    goal,
+                    deadline,
+                    degradations,
+                    fallback_deadline,
+                )
+
+            if all(llm_scored):
+                self._record_latency(time.monotonic() - started)
+
+            fresh = []
+            for batch, x, from_llm in zip(batches, results, llm_scored):
+                x = normalize_score_vector(x, len(batch))
+                if from_llm:
+                    self.cache.put(goal, batch, x)
+                fresh.extend(x)
+
+            for i, score in zip(missing, fresh):
+                scores[i] = score
+
+        return self.recency.apply(messages, scores)
+
+    def _record_latency(self, seconds: float):
+        """
+        Fold one scoring round's latency into the moving average.
+
+        Args:
+            seconds: Duration of the round.
+        """
+        self.expected_latency = moving_average(self.expected_latency, seconds)
+
+    async def _gather_within(
+        self,
+        tasks: List[asyncio.Future],
+        batches: List[List[Dict[str, str]]],
+        goal: str,
+        deadline: Deadline,
+        degradations: Optional[List[Dict]],
+        fallback_deadline: Optional[Deadline] = None,
+    ):
+        """
+        Wait for scoring batches until the deadline, falling back to
+        heuristic scores for batches that are late or failed, or to the
+        neutral score once fallback_deadline has passed.
+
+        Returns:
+            (results, llm_scored) where results[i] are the scores of
+            batches[i] and llm_scored[i] says whether they came from the LLM.
+        """
+        done, pending = await asyncio.wait(tasks, timeout=deadline.remaining())
+        for task in pending:
+            task.cancel()
+
+        results = []
+        llm_scored = []
+        for task, batch in zip(tasks, batches):
+            if task in done and task.exception() is None:
+                results.append(task.result())
+                llm_scored.append(True)
+                continue
+
+            fallback = "heuristic"
+            if fallback_deadline is not None and fallback_deadline.expired():
+                fallback = "neutral"
+                results.append([NEUTRAL_SCORE] * len(batch))
+            else:
+                results.append(heuristic_scores(batch, goal, self.annotator))
+            llm_scored.append(False)
+            if degradations is not None:
+                degradations.append(
+                    {
+                        "stage": "scoring",
+                        "fallback": fallback,
+                        "reason": "timed out" if task in pending else "failed",
+                        "messages": len(batch),
+                    }
+                )
+
+        return results, llm_scored
+
+    async def _gather_unless(
+        self,
+        tasks: List[asyncio.Future],
+        batches: List[List[Dict[str, str]]],
+        cancelled: threading.Event,
+    ):
+        """
+        Wait for scoring batches, abandoning those still running once
+        cancelled is set. Abandoned batches get the neutral score.
+
+        Returns:
+            (results, llm_scored) as for _gather_within.
+        """
+        pending = set(tasks)
+        while pending and not cancelled.is_set():
+            _, pending = await asyncio.wait(pending, timeout=_CANCEL_POLL)
+        if not pending:
+            return await asyncio.gather(*tasks), [True] * len(tasks)
+
+        for task in pending:
+            task.cancel()
+        results = []
+        llm_scored = []
+        for task, batch in zip(tasks, batches):
+            if task in pending or task.exception() is not None:
+                results.append([NEUTRAL_SCORE] * len(batch))
+                llm_scored.append(False)
+            else:
+                results.append(task.result())
+                llm_scored.append(True)
+        return results, llm_scored
+
+    def score_goals(
+        self, messages: List[Dict[str, str]], goals: List[str]
+    ) -> Dict[str, List[float]]:
+        """
+        Score messages synchronously against several goals at once.
+
+        Args:
+            messages: List of message dictionaries with "role" and "content" keys.
+            goals: The goals to score against.
+
+        Returns:
+            Dictionary mapping each goal to its list of relevance scores.
+        """
+        return run_sync(self.score_all_goals(messages, goals))
+
+    async def score_all_goals(
+        self, messages: List[Dict[str, str]], goals: List[str]
+    ) -> Dict[str, List[float]]:
+        """Scores messages against several goals with one request per batch.
+
+        The model returns a score vector per message, and every goal's scores
+        are stored so later calls for these (or close) goals skip the LLM.
+
+        Args:
+            messages: A list of messages
+            goals: The goals to score against
+        Returns:
+            A dictionary mapping each goal to a list of scores such that
+            scores[i] is the relevancy score of messages[i]
+        """
 
         batches = self._create_batches(messages, 20)
 
         tasks = [
-            self.llm.score_batch_async(goal=goal, batch=batch, max_tokens=400)
+            self.llm.score_batch_multi_async(
+                goals=goals,
+                batch=self.excerpt.apply(batch, " ".join(goals)),
+                max_tokens=400 * len(goals),
+            )
             for batch in batches
         ]
 
         results = await asyncio.gather(*tasks)
 
+        vectors = []
         for x in results:
-            scores.extend(x)
+            vectors.extend(x)
 
-        for i in range(len(scores) - 1, max(-1, len(scores) - 6), -1):
-            recency_bonus = 1.0
-            scores[i] += recency_bonus
+        scores = {}
+        for j, goal in enumerate(goals):
+            goal_scores = [vector[j] for vector in vectors]
+            self.cache.put(goal, messages, goal_scores)
+            scores[goal] = self.recency.apply(messages, goal_scores)
 
         return scores
@@ -0,0 +1,203 @@
+"""
+Splitting long messages into spans that can be kept independently
+"""
+
+from typing import Dict, List, Tuple
+import re
+
+SEPARATOR = " [...] "
+
+_PARAGRAPH = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n")
+
+
+class SpanSplitter:
+    def __init__(
+        self, min_message_tokens: int = 200, max_span_tokens: int = 80
+    ):
+        """
+        Initialize the SpanSplitter.
+
+        Messages longer than min_message_tokens are split into spans of
+        whole paragraphs, or whole sentences when a paragraph is too long,
+        of at most about max_span_tokens each. The spans are scored and
+        kept, summarized or dropped like separate messages, then put back
+        together in order inside their original message.
+
+        Args:
+            min_message_tokens: Messages at or below this many tokens are
+                                left whole.
+            max_span_tokens: Target maximum length of a span in tokens.
+        """
+        self.min_message_tokens = min_message_tokens
+        self.max_span_tokens = max_span_tokens
+
+    def split(self, messages: List[Dict[str, str]]) -> "SplitConversation":
+        """
+        Split the long messages of a conversation into spans.
+
+        Args:
+            messages: List of message dictionaries.
+
+        Returns:
+            A SplitConversation whose .units are the messages to score and
+            select, with long messages replaced by their spans.
+        """
+        units = []
+        origins: Dict[int, Tuple[int, int, int]] = {}
+        for index, message in enumerate(messages):
+            content = message.get("content", "")
+            if len(content) <= self.min_message_tokens * 4:
+                units.append(message)
+                continue
+
+            for start, end in self.boundaries(content):
+                span = dict(message)
+                span["content"] = content[start:end]
+                origins[id(span)] = (index, start, end)
+                units.append(span)
+
+        return SplitConversation(messages, units, origins)
+
+    def boundaries(self, content: str) -> List[Tuple[int, int]]:
+        """
+        Character spans of a content, grouped up to max_span_tokens.
+
+        Args:
+            content: The message content.
+
+        Returns:
+            (start, end) pairs covering the non-blank text, in order.
+        """
+        limit = self.max_span_tokens * 4
+
+        pieces = []
+        for start, end in _segments(content, _PARAGRAPH, 0, len(content)):
+            if end - start <= limit:
+                pieces.append((start, end))
+            else:
+                pieces.extend(_segments(content, _SENTENCE_END, start, end))
+
+        # Merge neighbouring pieces while they stay under the limit
+        spans = []
+        for start, end in pieces:
+            if spans and end - spans[-1][0] <= limit:
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+        return spans
+
+
+class SplitConversation:
+    def __init__(
+        self,
+        messages: List[Dict[str, str]],
+        units: List[Dict[str, str]],
+        origins: Dict[int, Tuple[int, int, int]],
+    ):
+        """
+        A conversation whose long messages were split into spans.
+
+        Args:
+            messages: The original messages.
+            units: Messages and spans, in conversation order.
+            origins: Maps id() of each span to (message index, start, end).
+        """
+        self.messages = messages
+        self.units = units
+        self._origins = origins
+
+    @property
+    def was_split(self) -> bool:
+        """Whether any message was split."""
+        return bool(self._origins)
+
+    def reassemble(
+        self, selected: List[Dict[str, str]]
+    ) -> List[Dict[str, str]]:
+        """
+        Put the selected spans back inside their original messages.
+
+        Spans of one message are merged into a single message at the
+        position of the first of them, in their original order. Adjacent
+        spans are joined with the original text between them and gaps are
+        marked with " [...] ". A message whose spans were all kept is
+        returned as the original object.
+
+        Args:
+            selected: Output of a strategy run on .units.
+
+        Returns:
+            The optimized list of messages.
+        """
+        kept: Dict[int, List[Tuple[int, int]]] = {}
+        for unit in selected:
+            origin = self._origins.get(id(unit))
+            if origin is not None:
+                kept.setdefault(origin[0], []).append(origin[1:])
+
+        result = []
+        placed = set()
+        for unit in selected:
+            origin = self._origins.get(id(unit))
+            if origin is None:
+                result.append(unit)
+                continue
+
+            index = origin[0]
+            if index in placed:
+                continue
+            placed.add(index)
+            result.append(self._merge(index, sorted(kept[index])))
+
+        return result
+
+    def _merge(
+        self, index: int, spans: List[Tuple[int, int]]
+    ) -> Dict[str, str]:
+        message = self.messages[index]
+        content = message.get("content", "")
+
+        runs = []
+        for start, end in spans:
+            # Only whitespace between two spans means they were neighbours
+            if runs and not content[runs[-1][1] : start].strip():
+                runs[-1] = (runs[-1][0], end)
+            else:
+                runs.append((start, end))
+
+        if (
+            len(runs) == 1
+            and not content[: runs[0][0]].strip()
+            and not content[runs[0][1] :].strip()
+        ):
+            return message
+
+        merged = dict(message)
+        merged["content"] = SEPARATOR.join(content[a:b] for a, b in runs)
+        return merged
+
+
+def _segments(
+    content: str, pattern: re.Pattern, start: int, end: int
+) -> List[Tuple[int, int]]:
+    """
+    Non-blank pieces of content[start:end] between matches of pattern,
+    trimmed of surrounding whitespace.
+    """
+    segments = []
+    position = start
+    for match in pattern.finditer(content, start, end):
+        segments.append((position, match.start()))
+        position = match.end()
+    segments.append((position, end))
+
+    trimmed = []
+    for a, b in segments:
+        text = content[a:b]
+        stripped = text.strip()
+        if not stripped:
+            continue
+        a += len(text) - len(text.lstrip())
+        trimmed.append((a, a + len(stripped)))
+    return trimmed
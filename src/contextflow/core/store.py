@@ -0,0 +1,258 @@
+"""
+Memory-mapped, append-only conversation storage
+"""
+
+from collections.abc import Mapping, Sequence
+from typing import Dict, Iterator, List, Tuple
+import json
+import mmap
+import os
+import struct
+
+# The index starts with a magic number and its format version
+_INDEX_MAGIC = b"CFIX"
+_INDEX_VERSION = 2
+_INDEX_HEADER = struct.Struct("<4sI")
+
+# Each index record is (offset, header_length, content_bytes,
+# content_chars): the content's length in the log and as a str
+_INDEX_RECORD = struct.Struct("<QIII")
+
+# Version 1 indices had no header and no content_chars
+_V1_INDEX_RECORD = struct.Struct("<QII")
+
+
+def _unpack(
+    raw: bytes, start: int, record: struct.Struct
+) -> List[Tuple[int, ...]]:
+    """The complete records of an index after its header."""
+    usable = len(raw) - (len(raw) - start) % record.size
+    return [
+        record.unpack_from(raw, i) for i in range(start, usable, record.size)
+    ]
+
+
+class StoredMessage(Mapping):
+    """A read-only message whose content lives in a ConversationStore.
+
+    Behaves like a message dict ({"role": ..., "content": ...}), but the
+    content is only read from disk when it is accessed. Returning a
+    StoredMessage from an optimization references its span in the log
+    instead of copying it.
+    """
+
+    __slots__ = ("_store", "_index", "_header")
+
+    def __init__(self, store: "ConversationStore", index: int):
+        self._store = store
+        self._index = index
+        self._header = None
+
+    @property
+    def span(self) -> Tuple[int, int]:
+        """(offset, length) of the content bytes in the log file."""
+        offset, header_length, content_bytes, _ = self._store._records[
+            self._index
+        ]
+        return offset + header_length, content_bytes
+
+    @property
+    def content_length(self) -> int:
+        """
+        Length of the content in characters, like len(content), without
+        reading it.
+        """
+        return self._store._records[self._index][3]
+
+    def _fields(self) -> Dict[str, str]:
+        if self._header is None:
+            offset, header_length = self._store._records[self._index][:2]
+            raw = self._store._read(offset, header_length)
+            self._header = json.loads(raw)
+        return self._header
+
+    def __getitem__(self, key: str):
+        if key == "content":
+            offset, length = self.span
+            return self._store._read(offset, length).decode("utf-8")
+        return self._fields()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._fields()
+        yield "content"
+
+    def __len__(self) -> int:
+        return len(self._fields()) + 1
+
+    def __repr__(self) -> str:
+        return f"StoredMessage(index={self._index}, span={self.span})"
+
+
+class ConversationStore(Sequence):
+    def __init__(self, path: str):
+        """
+        Open (or create) an on-disk conversation store.
+
+        Messages are appended to "<path>.log" and located through a
+        fixed-width offset index in "<path>.idx". Reads go through a
+        memory map of the log, so only the messages that are actually
+        accessed are paged in.
+
+        Args:
+            path: Base path of the store files.
+
+        Raises:
+            ValueError: If the index was written in an unsupported format.
+        """
+        self.path = path
+        self._log_path = f"{path}.log"
+        self._idx_path = f"{path}.idx"
+
+        self._log = open(self._log_path, "ab+")
+        self._idx = open(self._idx_path, "ab+")
+        self._map = None
+        try:
+            self._records = self._load_index()
+        except ValueError:
+            self.close()
+            raise
+
+    def _load_index(self) -> List[Tuple[int, int, int, int]]:
+        """
+        Load the offset index, ignoring a partially written last record.
+
+        A new index gets a header. A version 1 index, which had none, is
+        migrated in place.
+
+        Returns:
+            List of (offset, header_length, content_bytes, content_chars)
+            tuples.
+
+        Raises:
+            ValueError: If the index has another format version.
+        """
+        header = _INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION)
+        self._idx.seek(0)
+        raw = self._idx.read()
+        if header.startswith(raw):
+            # New, or only part of the header was written
+            self._idx.truncate(0)
+            self._idx.write(header)
+            self._idx.flush()
+            return []
+        if not raw.startswith(_INDEX_MAGIC):
+            return self._migrate_v1(raw)
+
+        _, version = _INDEX_HEADER.unpack_from(raw)
+        if version != _INDEX_VERSION:
+            raise ValueError(
+                f"Unsupported index version {version} in {self._idx_path}, "
+                f"expected {_INDEX_VERSION}"
+            )
+        return _unpack(raw, _INDEX_HEADER.size, _INDEX_RECORD)
+
+    def _migrate_v1(self, raw: bytes) -> List[Tuple[int, int, int, int]]:
+        """
+        Rewrite a version 1 index with a header and content_chars, read
+        from the log.
+        """
+        records = []
+        for offset, header_length, content_bytes in _unpack(
+            raw, 0, _V1_INDEX_RECORD
+        ):
+            self._log.seek(offset + header_length)
+            content = self._log.read(content_bytes).decode("utf-8")
+            records.append((offset, header_length, content_bytes, len(content)))
+
+        migrated = f"{self._idx_path}.tmp"
+        with open(migrated, "wb") as f:
+            f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION))
+            for record in records:
+                f.write(_INDEX_RECORD.pack(*record))
+        self._idx.close()
+        os.replace(migrated, self._idx_path)
+        self._idx = open(self._idx_path, "ab+")
+        return records
+
+    def append(self, message: Dict[str, str]) -> StoredMessage:
+        """
+        Append a message to the log.
+
+        Args:
+            message: Message dictionary with "role" and "content" keys. Any
+                     other keys are stored alongside the role.
+
+        Returns:
+            A StoredMessage referencing the appended message.
+        """
+        header = {k: v for k, v in message.items() if k != "content"}
+        header_bytes = json.dumps(header, separators=(",", ":")).encode()
+        content = message.get("content", "")
+        content_bytes = content.encode("utf-8")
+
+        self._log.seek(0, os.SEEK_END)
+        offset = self._log.tell()
+        self._log.write(header_bytes)
+        self._log.write(content_bytes)
+        self._log.flush()
+
+        record = (offset, len(header_bytes), len(content_bytes), len(content))
+        self._idx.write(_INDEX_RECORD.pack(*record))
+        self._idx.flush()
+        self._records.append(record)
+
+        return StoredMessage(self, len(self._records) - 1)
+
+    def extend(self, messages: List[Dict[str, str]]):
+        """
+        Append several messages to the log.
+
+        Args:
+            messages: List of message dictionaries.
+        """
+        for message in messages:
+            self.append(message)
+
+    def _read(self, offset: int, length: int) -> bytes:
+        """
+        Read a span of the log through the memory map, remapping if the log
+        has grown past the current mapping.
+        """
+        if length == 0:
+            return b""
+        if self._map is None or offset + length > len(self._map):
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(
+                self._log.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        return self._map[offset : offset + length]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [
+                StoredMessage(self, i)
+                for i in range(*index.indices(len(self._records)))
+            ]
+        if index < 0:
+            index += len(self._records)
+        if not 0 <= index < len(self._records):
+            raise IndexError("ConversationStore index out of range")
+        return StoredMessage(self, index)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def close(self):
+        """Close the memory map and the underlying files."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._log.close()
+        self._idx.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,22 +1,141 @@
-from typing import List
+from typing import Callable, Dict, List, Optional
 from contextflow.utils.tokenizer import count_tokens  # You'll need this
 from contextflow.core.compactor import MessageCompactor
+from contextflow.core.recency import RecencyModel, WindowRecency
+import numpy as np
 
 
-def conservative_strategy():
+STRATEGIES: Dict[str, Callable] = {}
+
+SUMMARY_PREFIX = "Summary of earlier context: "
+# Summaries shorter than this carry too little to be worth an LLM call
+MIN_SUMMARY_TOKENS = 16
+
+
+def register_strategy(name: str):
+    """
+    Register an optimization strategy under a name usable in
+    ContextFlow.optimize(strategy=...).
+
+    A strategy is called as strategy(messages, scores, max_token_count,
+    compactor, recency=...) and returns the optimized list of messages.
+
+    Args:
+        name: Name of the strategy.
+
+    Returns:
+        Decorator that registers the function and returns it unchanged.
     """
-    Conservative optimization strategy (not yet implemented).
 
-    This strategy would prioritize preserving more messages with lower summarization.
+    def decorator(func: Callable) -> Callable:
+        STRATEGIES[name] = func
+        return func
+
+    return decorator
+
+
+def get_strategy(name: str) -> Callable:
+    """
+    Look up a registered strategy.
+
+    Args:
+        name: Name the strategy was registered under.
+
+    Returns:
+        The strategy function.
+
+    Raises:
+        ValueError: If no strategy is registered under that name.
+    """
+    if name not in STRATEGIES:
+        raise ValueError(
+            f"Unknown strategy: {name}. "
+            f"Options: {', '.join(sorted(STRATEGIES))}"
+        )
+    return STRATEGIES[name]
+
+
+def summary_budget(desired: int, available: int) -> int:
+    """
+    Token budget of a summary, reserved before it is generated.
+
+    Args:
+        desired: Length the strategy would like the summary to have.
+        available: Tokens left in the budget for the summary message.
+
+    Returns:
+        The summary's maximum length, leaving room for SUMMARY_PREFIX, or
+        0 if no summary of at least MIN_SUMMARY_TOKENS would fit.
+    """
+    budget = min(desired, available - len(SUMMARY_PREFIX) // 4 - 1)
+    return budget if budget >= MIN_SUMMARY_TOKENS else 0
+
+
+def _fit_recent(recent_messages: List, max_token_count: int) -> List:
+    """
+    Drop the oldest of the recent messages until they fit the budget,
+    always keeping the newest one.
+    """
+    fitted = list(recent_messages)
+    while count_tokens(fitted) > max_token_count and len(fitted) > 1:
+        fitted.pop(0)
+    return fitted
+
+
+@register_strategy("conservative")
+def conservative_strategy(
+    messages: List[str],
+    scores: List[float],
+    max_token_count: int,
+    compactor: Optional[MessageCompactor] = None,
+    recency: Optional[RecencyModel] = None,
+):
+    """Optimizes a conversation by dropping messages only (no summarization)
+
+    Recent messages are preserved, then older messages are added back from
+    highest to lowest score while they fit. Nothing is sent to the LLM, so
+    this strategy adds no summarization latency.
+
+    Args:
+        messages: List of messages
+        scores: List of scores for each message
+        max_token_count: Maximum number of tokens allowed
+        compactor: Unused, accepted so all strategies share a signature
+        recency: Decides how many recent messages are always preserved
+    Returns:
+        Optimized list of messages, in their original order, that is less
+        than max_token_count
     """
-    pass
 
+    if recency is None:
+        recency = WindowRecency()
 
+    preserve_recent = recency.preserve_count(scores)
+    split = max(0, len(messages) - preserve_recent)
+
+    recent_messages = _fit_recent(messages[split:], max_token_count)
+    current_tokens = count_tokens(recent_messages)
+
+    kept = []
+    for i in sorted(range(split), key=lambda i: scores[i], reverse=True):
+        message_tokens = count_tokens([messages[i]])
+        if current_tokens + message_tokens <= max_token_count:
+            kept.append(i)
+            current_tokens += message_tokens
+
+    return [messages[i] for i in sorted(kept)] + recent_messages
+
+
+@register_strategy("balanced")
 def balanced_strategy(
     messages: List[str],
     scores: List[float],
     max_token_count: int,
     compactor: MessageCompactor,
+    recency: Optional[RecencyModel] = None,
+    keep_threshold: float = 7.0,
+    summarize_threshold: float = 4.0,
+    summary_ratio: float = 0.3,
 ):
     """Optimizes a conversation (i.e. a list of messages) using a balanced strategy (keep high-scoring, summarize mid, drop low)
 
@@ -25,27 +144,24 @@ def balanced_strategy(
         scores: List of scores for each message
         max_token_count: Maximum number of tokens allowed
         compactor: Tool for summarizing messages
+        recency: Decides how many recent messages are always preserved
+        keep_threshold: Older messages scoring above this are kept verbatim while they fit
+        summarize_threshold: Older messages scoring above this (and not kept) are summarized; the rest are dropped
+        summary_ratio: Target summary length as a fraction of the summarized tokens
     Returns:
         Optimized list of messages that is less than max_token_count
     """
 
-    preserve_recent = 5
-
-    recent_scores = scores[-10:] if len(scores) >= 10 else scores
+    if recency is None:
+        recency = WindowRecency()
 
     # If the recent messages are high-utility, keep more
-    avg_recent_score = sum(recent_scores) / len(recent_scores)
-
-    if avg_recent_score >= 7:
-        preserve_recent = 5  # Keep 5 if they're useful
-    elif avg_recent_score >= 4:
-        preserve_recent = 3  # Keep 3 if they're medium
-    else:
-        preserve_recent = 2  # Keep only 2 if they're low-utility pleasantries
+    preserve_recent = recency.preserve_count(scores)
 
-    recent_messages = messages[-preserve_recent:]
-    older_messages = messages[:-preserve_recent]
-    older_scores = scores[:-preserve_recent]
+    split = max(0, len(messages) - preserve_recent)
+    recent_messages = messages[split:]
+    older_messages = messages[:split]
+    older_scores = scores[:split]
 
     sorted_pairs = sorted(
         zip(older_messages, older_scores),
@@ -70,11 +186,11 @@ def balanced_strategy(
     summarize_bucket = []
 
     for message, score in sorted_pairs:
-        if score > 7.0:
+        if score > keep_threshold:
             keep_bucket.append(message)
-        elif score > 4.0:
+        elif score > summarize_threshold:
             summarize_bucket.append(message)
-        # score <= 4.0: drop entirely
+        # score <= summarize_threshold: drop entirely
 
     # Try to add high-scoring messages one by one
     for message in keep_bucket:
@@ -88,16 +204,22 @@ def balanced_strategy(
             summarize_bucket.append(message)
 
     # print(summarize_bucket)
+    budget = 0
     if summarize_bucket:
-        summary_tokens = count_tokens(summarize_bucket)
-        # print(f"Tokens needed to summarize: {summary_tokens}")
+        # Reserve what is left of the budget up front; the compactor treats
+        # it as a hard cap, and no call is made if nothing useful fits
+        budget = summary_budget(
+            int(count_tokens(summarize_bucket) * summary_ratio),
+            max_token_count - current_tokens,
+        )
+    if budget:
         summary = compactor.summarize(
             messages_to_summarize=summarize_bucket,
-            max_token_count=3 * summary_tokens // 10,
+            max_token_count=budget,
         )
         summary_message = {
             "role": "system",
-            "content": f"Summary of earlier context: {summary}",
+            "content": f"{SUMMARY_PREFIX}{summary}",
         }
         # print(f"Tokens summary: {count_tokens([summary_message])}")
 
@@ -116,10 +238,86 @@ def balanced_strategy(
     return optimized
 
 
-def aggressive_strategy():
-    """
-    Aggressive optimization strategy (not yet implemented).
+@register_strategy("aggressive")
+def aggressive_strategy(
+    messages: List[str],
+    scores: List[float],
+    max_token_count: int,
+    compactor: MessageCompactor,
+    recency: Optional[RecencyModel] = None,
+    drop_percentile: float = 40.0,
+    keep_percentile: float = 90.0,
+    summary_ratio: float = 0.2,
+):
+    """Optimizes a conversation for maximum reduction (keep only the very top, summarize the rest, drop the bottom)
+
+    Only the minimum number of recent messages is preserved. Older messages
+    scoring below the drop_percentile of older scores are dropped, those at
+    or above keep_percentile are kept while they fit, and everything else is
+    folded into a single summary.
 
-    This strategy would prioritize maximum token reduction with more aggressive summarization.
+    Args:
+        messages: List of messages
+        scores: List of scores for each message
+        max_token_count: Maximum number of tokens allowed
+        compactor: Tool for summarizing messages
+        recency: Decides the minimum number of recent messages preserved
+        drop_percentile: Percentile of older scores below which messages are dropped
+        keep_percentile: Percentile of older scores from which messages are kept verbatim
+        summary_ratio: Target summary length as a fraction of the summarized tokens
+    Returns:
+        Optimized list of messages that is less than max_token_count
     """
-    pass
+
+    if recency is None:
+        recency = WindowRecency()
+
+    split = max(0, len(messages) - recency.min_preserve)
+    recent_messages = _fit_recent(messages[split:], max_token_count)
+    current_tokens = count_tokens(recent_messages)
+
+    if split == 0 or current_tokens >= max_token_count:
+        return recent_messages
+
+    older_scores = np.asarray(scores[:split], dtype=float)
+    drop_cut = np.percentile(older_scores, drop_percentile)
+    keep_cut = np.percentile(older_scores, keep_percentile)
+
+    kept = []
+    summarize_bucket = []
+    for i in np.argsort(-older_scores, kind="stable"):
+        if older_scores[i] < drop_cut:
+            continue
+        message_tokens = count_tokens([messages[i]])
+        if (
+            older_scores[i] >= keep_cut
+            and current_tokens + message_tokens <= max_token_count
+        ):
+            kept.append(i)
+            current_tokens += message_tokens
+        else:
+            summarize_bucket.append(i)
+
+    optimized = [messages[i] for i in sorted(kept)] + recent_messages
+
+    to_summarize = [messages[i] for i in sorted(summarize_bucket)]
+    budget = 0
+    if to_summarize:
+        budget = summary_budget(
+            int(count_tokens(to_summarize) * summary_ratio),
+            max_token_count - current_tokens,
+        )
+    if budget:
+        summary = compactor.summarize(
+            messages_to_summarize=to_summarize,
+            max_token_count=budget,
+        )
+        summary_message = {
+            "role": "system",
+            "content": f"{SUMMARY_PREFIX}{summary}",
+        }
+
+        if current_tokens + count_tokens([summary_message]) <= max_token_count:
+            optimized.insert(0, summary_message)
+
+    return optimized
@@ -0,0 +1,235 @@
+"""
+Structure-aware compaction of tool outputs, JSON payloads, logs and tracebacks
+"""
+
+from typing import Any, Dict, List, Optional
+from contextflow.core.deadline import Deadline
+import json
+import re
+
+
+# Leading timestamps are ignored when deciding whether two log lines repeat
+_LOG_PREFIX = re.compile(
+    r"^\s*\[?\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?"
+    r"(?:Z|[+-]\d{2}:?\d{2})?\]?\s*|^\s*\[?\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\]?\s*"
+)
+_PY_FRAME = re.compile(r'^\s+File "')
+_JAVA_FRAME = re.compile(r"^\s+at \S")
+
+
+class StructureCompactor:
+    def __init__(
+        self,
+        traceback_head: int = 2,
+        traceback_tail: int = 3,
+        min_log_repeat: int = 3,
+        min_hoist_items: int = 3,
+    ):
+        """
+        Initialize the StructureCompactor.
+
+        Rewrites the content of structured messages before they are scored:
+        JSON is pruned and minified, runs of repeated log lines are collapsed
+        with a count, and long tracebacks keep only their outer and inner
+        frames. Prose is left as it is. Only "content" is rewritten and no
+        message is ever dropped, so tool-call ids and tool-call/tool-result
+        pairs stay intact.
+
+        Args:
+            traceback_head: Outermost frames kept in a traceback.
+            traceback_tail: Innermost frames kept in a traceback.
+            min_log_repeat: Minimum run length of repeated log lines to collapse.
+            min_hoist_items: Minimum number of objects in a JSON array before
+                             fields shared by all of them are hoisted out.
+        """
+        self.traceback_head = traceback_head
+        self.traceback_tail = traceback_tail
+        self.min_log_repeat = min_log_repeat
+        self.min_hoist_items = min_hoist_items
+
+    def compact(
+        self,
+        messages: List[Dict[str, str]],
+        deadline: Optional[Deadline] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Compact the content of every structured message.
+
+        Args:
+            messages: List of message dictionaries with "role" and "content" keys.
+            deadline: If given, messages reached after it has passed are
+                      left as they are.
+
+        Returns:
+            List of messages. Unchanged messages are the original objects;
+            changed ones are copies with all other keys preserved.
+        """
+        compacted = []
+        for i, message in enumerate(messages):
+            if deadline is not None and deadline.expired():
+                compacted.extend(messages[i:])
+                break
+            content = message.get("content", "")
+            new_content = self.compact_content(content)
+            if new_content == content:
+                compacted.append(message)
+            else:
+                compacted.append({**message, "content": new_content})
+        return compacted
+
+    def compact_content(self, content: str) -> str:
+        """
+        Compact a single message content.
+
+        Args:
+            content: The message content.
+
+        Returns:
+            The compacted content, or the original if it has no structure to
+            compact.
+        """
+        stripped = content.strip()
+        if stripped[:1] in ("{", "["):
+            try:
+                payload = json.loads(stripped)
+            except ValueError:
+                pass
+            else:
+                minified = json.dumps(
+                    self._prune(payload),
+                    separators=(",", ":"),
+                    ensure_ascii=False,
+                )
+                return minified if len(minified) < len(content) else content
+
+        # Stack frames are never prose; repeated lines only collapse in logs
+        lines = self._trim_tracebacks(content.split("\n"))
+        if self._is_log(lines):
+            lines = self._collapse_repeats(lines)
+        return "\n".join(lines)
+
+    def _is_log(self, lines: List[str]) -> bool:
+        """
+        Whether lines are a log rather than prose: most of them start with a
+        timestamp.
+        """
+        lines = [line for line in lines if line.strip()]
+        stamped = sum(1 for line in lines if _LOG_PREFIX.match(line))
+        return stamped >= 2 and stamped * 2 >= len(lines)
+
+    def _prune(self, value: Any) -> Any:
+        """
+        Drop null and empty fields of objects and hoist fields shared by
+        every object of an array into a "_common" object. Array items are
+        all kept, nulls included, so positions don't shift.
+        """
+        if isinstance(value, dict):
+            pruned = {}
+            for key, item in value.items():
+                item = self._prune(item)
+                if item is None or item == {} or item == []:
+                    continue
+                pruned[key] = item
+            return pruned
+
+        if isinstance(value, list):
+            return self._hoist([self._prune(item) for item in value])
+
+        return value
+
+    def _hoist(self, items: List[Any]) -> Any:
+        if len(items) < self.min_hoist_items or not all(
+            isinstance(item, dict) for item in items
+        ):
+            return items
+
+        common = {
+            key: value
+            for key, value in items[0].items()
+            if all(key in item and item[key] == value for item in items[1:])
+        }
+        if not common:
+            return items
+
+        return {
+            "_common": common,
+            "_items": [
+                {k: v for k, v in item.items() if k not in common}
+                for item in items
+            ],
+        }
+
+    def _collapse_repeats(self, lines: List[str]) -> List[str]:
+        """
+        Collapse runs of lines that only differ by their leading timestamp.
+        """
+        collapsed = []
+        i = 0
+        while i < len(lines):
+            key = _LOG_PREFIX.sub("", lines[i])
+            j = i + 1
+            while j < len(lines) and _LOG_PREFIX.sub("", lines[j]) == key:
+                j += 1
+            run = j - i
+            if run >= self.min_log_repeat and key.strip():
+                collapsed.append(f"{lines[i]} [repeated {run}x]")
+            else:
+                collapsed.extend(lines[i:j])
+            i = j
+        return collapsed
+
+    def _trim_tracebacks(self, lines: List[str]) -> List[str]:
+        """
+        Keep only the outer and inner frames of Python and Java tracebacks.
+        """
+        trimmed = []
+        i = 0
+        while i < len(lines):
+            frames = self._frames_at(lines, i)
+            if not frames:
+                trimmed.append(lines[i])
+                i += 1
+                continue
+
+            consumed = sum(len(frame) for frame in frames)
+            keep = self.traceback_head + self.traceback_tail
+            if len(frames) > keep:
+                omitted = len(frames) - keep
+                kept = frames[: self.traceback_head] + [
+                    [f"  ... {omitted} frames omitted ..."]
+                ]
+                if self.traceback_tail:
+                    kept += frames[-self.traceback_tail :]
+                frames = kept
+            for frame in frames:
+                trimmed.extend(frame)
+            i += consumed
+        return trimmed
+
+    def _frames_at(self, lines: List[str], start: int) -> List[List[str]]:
+        """
+        Group the stack frames that start at lines[start], if any.
+
+        Python frames are a 'File "..."' line plus the indented source lines
+        under it; Java frames are single "at ..." lines.
+        """
+        frames = []
+        i = start
+        while i < len(lines):
+            if _PY_FRAME.match(lines[i]):
+                frame = [lines[i]]
+                i += 1
+                while (
+                    i < len(lines)
+                    and lines[i].startswith("    ")
+                    and not _PY_FRAME.match(lines[i])
+                ):
+                    frame.append(lines[i])
+                    i += 1
+                frames.append(frame)
+            elif _JAVA_FRAME.match(lines[i]):
+                frames.append([lines[i]])
+                i += 1
+            else:
+                break
+        return frames
@@ -0,0 +1,364 @@
+"""
+Offline tuning of strategy thresholds from recorded score traces
+"""
+
+from typing import Dict, List, Optional
+from contextflow.core.recency import RecencyModel
+from contextflow.core.strategies import SUMMARY_PREFIX, balanced_strategy
+from contextflow.utils.tokenizer import count_tokens
+import json
+import random
+import threading
+
+# The hand-set parameters of balanced_strategy and the recency tiers
+DEFAULT_PARAMS = {
+    "keep_threshold": 7.0,
+    "summarize_threshold": 4.0,
+    "summary_ratio": 0.3,
+    "preserve_tiers": [[7.0, 5], [4.0, 3]],
+    "min_preserve": 2,
+}
+
+_KEEP_THRESHOLDS = [5.0, 5.5, 6.0, 6.5, 7.0, 7.5, 8.0, 8.5, 9.0, 9.5]
+_SUMMARIZE_THRESHOLDS = [1.0, 2.0, 3.0, 3.5, 4.0, 4.5, 5.0, 5.5, 6.0, 7.0]
+_SUMMARY_RATIOS = [0.1, 0.15, 0.2, 0.25, 0.3, 0.4, 0.5]
+_TIER_THRESHOLDS = [2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0]
+
+
+class TraceRecorder:
+    def __init__(
+        self, path: str, sample_rate: float = 1.0, seed: Optional[int] = None
+    ):
+        """
+        Initialize the TraceRecorder.
+
+        Appends, for each optimization, what the strategy was given: the
+        token count, role and score of every message and the budget. No
+        message content is written. The traces are what StrategyTuner
+        replays.
+
+        Args:
+            path: JSON lines file the traces are appended to.
+            sample_rate: Share of optimizations recorded.
+            seed: Seed for the sampling.
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        messages: List[Dict[str, str]],
+        scores: List[float],
+        max_token_count: int,
+        important: Optional[List[int]] = None,
+    ):
+        """
+        Append one trace, if it is sampled.
+
+        Args:
+            messages: The messages handed to the strategy.
+            scores: Their scores, as handed to the strategy.
+            max_token_count: The budget.
+            important: Indices of messages known to be needed downstream,
+                       if such labels exist (e.g. from an evaluation).
+        """
+        with self._lock:
+            if self._rng.random() >= self.sample_rate:
+                return
+            trace = {
+                "tokens": [count_tokens([m]) for m in messages],
+                "roles": [m.get("role", "unknown") for m in messages],
+                "scores": [float(score) for score in scores],
+                "max_token_count": max_token_count,
+            }
+            if important is not None:
+                trace["important"] = list(important)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(trace) + "\n")
+
+
+def load_traces(path: str) -> List[Dict]:
+    """Read the traces written by a TraceRecorder."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class _BudgetCompactor:
+    """Stands in for the summarizer: a summary as long as its budget."""
+
+    def __init__(self):
+        self.calls = []
+
+    def summarize(self, messages_to_summarize, max_token_count=500):
+        self.calls.append((messages_to_summarize, max_token_count))
+        return "x" * (max_token_count * 4)
+
+
+class StrategyTuner:
+    def __init__(
+        self,
+        traces: List[Dict],
+        max_token_count: Optional[int] = None,
+        min_retention: float = 0.9,
+        important_score: float = 7.0,
+        summary_credit: float = 0.5,
+        call_latency_ms: float = 500.0,
+        token_latency_ms: float = 20.0,
+        trials: int = 300,
+        seed: int = 0,
+    ):
+        """
+        Initialize the StrategyTuner.
+
+        Replays recorded traces through balanced_strategy for many settings
+        of its keep/summarize cutoffs, its summary ratio and the recency
+        preserve tiers, and picks the setting with the fewest summarization
+        calls, then the lowest latency, whose retention meets
+        min_retention. Replays need no LLM: a summary is assumed to fill
+        its budget.
+
+        Retention is the share of important messages that survive a
+        replay: kept verbatim counts fully, summarized counts
+        summary_credit. Important messages are those labelled in the trace,
+        or else those scoring at least important_score.
+
+        Args:
+            traces: Traces as written by TraceRecorder.
+            max_token_count: Budget to tune for. Defaults to each trace's
+                             own budget.
+            min_retention: Lowest acceptable mean retention.
+            important_score: Score from which an unlabelled message counts
+                             as important.
+            summary_credit: Retention credit of a summarized message.
+            call_latency_ms: Modelled fixed latency of a summarization call.
+            token_latency_ms: Modelled latency per summary token.
+            trials: Number of random settings tried besides the defaults.
+            seed: Seed of the search.
+        """
+        self.traces = traces
+        self.max_token_count = max_token_count
+        self.min_retention = min_retention
+        self.important_score = important_score
+        self.summary_credit = summary_credit
+        self.call_latency_ms = call_latency_ms
+        self.token_latency_ms = token_latency_ms
+        self.trials = trials
+        self.seed = seed
+        # Placeholder messages of the right length, built once
+        self._messages = [
+            [
+                {"role": role, "content": "x" * (tokens * 4)}
+                for tokens, role in zip(trace["tokens"], trace["roles"])
+            ]
+            for trace in traces
+        ]
+
+    def replay(self, params: Dict) -> Dict:
+        """
+        Replay every trace with one setting.
+
+        Args:
+            params: Setting with the keys of DEFAULT_PARAMS.
+
+        Returns:
+            Means per trace of "retention", "llm_calls", "latency_ms" and
+            "tokens_after", and "over_budget", the share of traces whose
+            output exceeded the budget.
+        """
+        recency = RecencyModel(
+            preserve_tiers=params["preserve_tiers"],
+            min_preserve=params["min_preserve"],
+        )
+        totals = {"retention": 0.0, "llm_calls": 0, "latency_ms": 0.0}
+        tokens_after = over_budget = scored = 0
+        for trace, messages in zip(self.traces, self._messages):
+            budget = self.max_token_count or trace["max_token_count"]
+            compactor = _BudgetCompactor()
+            optimized = balanced_strategy(
+                messages,
+                trace["scores"],
+                budget,
+                compactor,
+                recency=recency,
+                keep_threshold=params["keep_threshold"],
+                summarize_threshold=params["summarize_threshold"],
+                summary_ratio=params["summary_ratio"],
+            )
+
+            tokens = count_tokens(optimized)
+            tokens_after += tokens
+            over_budget += tokens > budget
+            for _, summary_tokens in compactor.calls:
+                totals["llm_calls"] += 1
+                totals["latency_ms"] += (
+                    self.call_latency_ms
+                    + self.token_latency_ms * summary_tokens
+                )
+
+            retention = self._retention(trace, messages, optimized, compactor)
+            if retention is not None:
+                totals["retention"] += retention
+                scored += 1
+
+        count = max(len(self.traces), 1)
+        return {
+            "retention": totals["retention"] / scored if scored else 1.0,
+            "llm_calls": totals["llm_calls"] / count,
+            "latency_ms": totals["latency_ms"] / count,
+            "tokens_after": tokens_after / count,
+            "over_budget": over_budget / count,
+        }
+
+    def tune(self) -> Dict:
+        """
+        Search the settings and build a profile.
+
+        Returns:
+            A profile (see save_profile) with the best setting, its
+            replayed "metrics" and the "baseline" metrics of the defaults.
+            If no setting meets min_retention, the most retentive one is
+            used.
+        """
+        baseline = self.replay(DEFAULT_PARAMS)
+        rng = random.Random(self.seed)
+        candidates = [DEFAULT_PARAMS] + [
+            self._sample(rng) for _ in range(self.trials)
+        ]
+
+        best = best_metrics = None
+        best_key = fallback = fallback_metrics = None
+        for params in candidates:
+            metrics = self.replay(params)
+            if metrics["over_budget"] > baseline["over_budget"]:
+                continue
+            if (
+                fallback_metrics is None
+                or metrics["retention"] > fallback_metrics["retention"]
+            ):
+                fallback, fallback_metrics = params, metrics
+            if metrics["retention"] < self.min_retention:
+                continue
+            key = (
+                metrics["llm_calls"],
+                metrics["latency_ms"],
+                -metrics["retention"],
+            )
+            if best_key is None or key < best_key:
+                best, best_metrics, best_key = params, metrics, key
+
+        if best is None:
+            print(
+                f"Warning: No setting reaches retention {self.min_retention}."
+                " Using the most retentive one."
+            )
+            best, best_metrics = fallback, fallback_metrics
+
+        return {
+            "strategy": "balanced",
+            "strategy_options": {
+                "keep_threshold": best["keep_threshold"],
+                "summarize_threshold": best["summarize_threshold"],
+                "summary_ratio": best["summary_ratio"],
+            },
+            "recency": {
+                "preserve_tiers": [list(t) for t in best["preserve_tiers"]],
+                "min_preserve": best["min_preserve"],
+            },
+            "constraints": {
+                "max_token_count": self.max_token_count,
+                "min_retention": self.min_retention,
+            },
+            "metrics": best_metrics,
+            "baseline": baseline,
+        }
+
+    def _retention(
+        self,
+        trace: Dict,
+        messages: List[Dict[str, str]],
+        optimized: List[Dict[str, str]],
+        compactor: _BudgetCompactor,
+    ) -> Optional[float]:
+        """Retention of one replay, or None if nothing was important."""
+        important = trace.get("important")
+        if important is None:
+            important = [
+                i
+                for i, score in enumerate(trace["scores"])
+                if score >= self.important_score
+            ]
+        if not important:
+            return None
+
+        kept = {id(m) for m in optimized}
+        summarized = set()
+        # The summary can still be dropped if it doesn't fit
+        if any(m["content"].startswith(SUMMARY_PREFIX) for m in optimized):
+            for batch, _ in compactor.calls:
+                summarized.update(id(m) for m in batch)
+
+        credit = 0.0
+        for i in important:
+            if id(messages[i]) in kept:
+                credit += 1.0
+            elif id(messages[i]) in summarized:
+                credit += self.summary_credit
+        return credit / len(important)
+
+    def _sample(self, rng: random.Random) -> Dict:
+        keep = rng.choice(_KEEP_THRESHOLDS)
+        high = rng.choice(_TIER_THRESHOLDS)
+        low = rng.choice([t for t in _TIER_THRESHOLDS if t <= high])
+        high_count = rng.randint(2, 8)
+        low_count = rng.randint(1, high_count)
+        return {
+            "keep_threshold": keep,
+            "summarize_threshold": rng.choice(
+                [t for t in _SUMMARIZE_THRESHOLDS if t <= keep]
+            ),
+            "summary_ratio": rng.choice(_SUMMARY_RATIOS),
+            "preserve_tiers": [[high, high_count], [low, low_count]],
+            "min_preserve": rng.randint(1, low_count),
+        }
+
+
+def save_profile(profile: Dict, path: str):
+    """
+    Write a tuned profile to a JSON file.
+
+    A profile has the "strategy" it tunes, the "strategy_options" passed
+    to it, the "recency" preserve tiers, and for reference the
+    "constraints" and replayed "metrics" it was tuned with.
+    """
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+
+
+def load_profile(path: str) -> Dict:
+    """Read a profile written by save_profile()."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def apply_recency_profile(config: Optional[Dict], profile: Dict) -> Dict:
+    """
+    Recency configuration with a profile's preserve tiers.
+
+    Args:
+        config: Recency configuration dictionary, or None for the default
+                window model.
+        profile: The profile.
+
+    Returns:
+        The configuration with the profile's "recency" values applied.
+    """
+    merged = dict(config or {"type": "window"})
+    merged.update(profile.get("recency", {}))
+    return merged
+
+
+def strategy_options(profile: Dict) -> Dict[str, Dict]:
+    """Strategy keyword arguments of a profile, by strategy name."""
+    return {profile["strategy"]: dict(profile.get("strategy_options", {}))}
@@ -0,0 +1,325 @@
+"""
+Offline harness measuring what optimize() keeps against what it costs
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional
+from contextflow import ContextFlow
+from contextflow.core.heuristic import goal_terms, heuristic_score
+from contextflow.core.planner import Planner
+from contextflow.utils.providers import fake
+from contextflow.utils.tokenizer import count_tokens
+import json
+import time
+
+# Judges whether optimized messages still answer a question:
+# judge(question, answer, messages) -> bool
+Judge = Callable[[str, str, List[Dict[str, str]]], bool]
+
+# Objectives of the Pareto frontier
+MAXIMIZE = ("retention", "tokens_saved")
+MINIMIZE = ("llm_calls", "latency_ms")
+
+
+def contains_answer(
+    question: str, answer: str, messages: List[Dict[str, str]]
+) -> bool:
+    """
+    Default judge: the answer appears verbatim (ignoring case) in the
+    optimized messages.
+
+    Args:
+        question: The question on the planted fact.
+        answer: Its expected answer.
+        messages: The optimized messages.
+
+    Returns:
+        Whether the fact was retained.
+    """
+    answer = answer.lower()
+    return any(answer in m.get("content", "").lower() for m in messages)
+
+
+def default_scorers(
+    latency: Optional[Callable[[], float]] = None,
+) -> Dict[str, Callable[[Dict], Dict]]:
+    """
+    Scorer configurations built on local fake providers.
+
+        - "heuristic": local heuristic scoring and extractive summaries,
+          no LLM calls
+        - "fake-llm": the full LLM path, with a fake provider scoring
+          messages like the heuristics and summarizing by truncation
+        - "oracle": the full LLM path with a fake provider that knows the
+          planted facts, which isolates what the strategy and summarizer
+          lose from what scoring loses
+
+    Args:
+        latency: Latency sampler of the fake providers. Defaults to none.
+
+    Returns:
+        Dictionary mapping scorer names to functions that take a case and
+        return ContextFlow options for it.
+    """
+
+    def options(score, planner: Planner) -> Dict:
+        llm = fake.LLM(latency=latency, score=score, seed=0)
+        return {
+            "scoring_model": llm,
+            "summarizing_model": llm,
+            "planner": planner,
+        }
+
+    def heuristic(case: Dict) -> Dict:
+        planner = Planner(
+            local_max_messages=len(case["messages"]), trim_ratio=0.0
+        )
+        return options(None, planner)
+
+    def fake_llm(case: Dict) -> Dict:
+        terms = goal_terms(case["goal"])
+        return options(
+            lambda m: heuristic_score(m.get("content", ""), terms),
+            Planner(local_max_messages=0, trim_ratio=0.0),
+        )
+
+    def oracle(case: Dict) -> Dict:
+        planted = {
+            case["messages"][fact["index"]]["content"] for fact in case["facts"]
+        }
+        return options(
+            lambda m: 9.0 if m.get("content") in planted else 2.0,
+            Planner(local_max_messages=0, trim_ratio=0.0),
+        )
+
+    return {"heuristic": heuristic, "fake-llm": fake_llm, "oracle": oracle}
+
+
+class EvaluationHarness:
+    def __init__(
+        self,
+        cases: List[Dict],
+        strategies: Iterable[str] = ("balanced", "aggressive", "conservative"),
+        scorers: Optional[Dict[str, Callable[[Dict], Dict]]] = None,
+        budgets: Iterable[int] = (200,),
+        tokenizers: Optional[Dict[str, Callable]] = None,
+        judge: Optional[Judge] = None,
+        flow_options: Optional[Dict] = None,
+    ):
+        """
+        Initialize the EvaluationHarness.
+
+        Every combination of strategy, scorer and budget optimizes every
+        case with a fresh ContextFlow, so no cache carries over between
+        configurations. Each run is then measured with every tokenizer.
+
+        Args:
+            cases: Cases with "messages", "goal" and "facts" (see
+                   make_needle_case).
+            strategies: Names of the strategies to evaluate.
+            scorers: Scorer configurations, mapping a name to a function
+                     that takes a case and returns ContextFlow options.
+                     Defaults to default_scorers().
+            budgets: max_token_count values to evaluate.
+            tokenizers: Token counters, mapping a name to a function taking
+                        a list of messages. Defaults to the heuristic
+                        count_tokens.
+            judge: Decides whether a fact was retained. Defaults to
+                   contains_answer; an LLM-backed judge can be plugged in
+                   for paraphrasing summarizers.
+            flow_options: Extra ContextFlow options for every run (e.g.
+                          {"compaction": "extractive"}).
+        """
+        self.cases = cases
+        self.strategies = list(strategies)
+        self.scorers = scorers if scorers is not None else default_scorers()
+        self.budgets = list(budgets)
+        self.tokenizers = tokenizers or {"heuristic": count_tokens}
+        self.judge = judge or contains_answer
+        self.flow_options = flow_options or {}
+
+    def run(self) -> List[Dict]:
+        """
+        Evaluate every configuration.
+
+        Returns:
+            One row per strategy, scorer, budget and tokenizer, as returned
+            by evaluate().
+        """
+        rows = []
+        for strategy in self.strategies:
+            for scorer in self.scorers:
+                for budget in self.budgets:
+                    rows.extend(self.evaluate(strategy, scorer, budget))
+        return rows
+
+    def evaluate(self, strategy: str, scorer: str, budget: int) -> List[Dict]:
+        """
+        Evaluate one configuration on every case.
+
+        Args:
+            strategy: Name of the strategy.
+            scorer: Name of the scorer configuration.
+            budget: The max_token_count.
+
+        Returns:
+            One row per tokenizer with the configuration ("strategy",
+            "scorer", "max_token_count", "tokenizer") and its means per
+            case: "retention" (share of facts retained), "tokens_before",
+            "tokens_after", "tokens_saved", "llm_calls" and "latency_ms".
+        """
+        retained = facts = calls = 0
+        latency_ms = 0.0
+        tokens = {name: [0, 0] for name in self.tokenizers}
+        for case in self.cases:
+            flow = ContextFlow(
+                **{**self.flow_options, **self.scorers[scorer](case)}
+            )
+            started = time.perf_counter()
+            result = flow.optimize(
+                case["messages"], case["goal"], budget, strategy=strategy
+            )
+            latency_ms += (time.perf_counter() - started) * 1000
+            calls += result["analytics"]["llm_usage"]["calls"]
+
+            optimized = result["messages"]
+            for fact in case["facts"]:
+                facts += 1
+                if self.judge(fact["question"], fact["answer"], optimized):
+                    retained += 1
+            for name, tokenizer in self.tokenizers.items():
+                tokens[name][0] += tokenizer(case["messages"])
+                tokens[name][1] += tokenizer(optimized)
+
+        count = max(len(self.cases), 1)
+        rows = []
+        for name, (before, after) in tokens.items():
+            rows.append(
+                {
+                    "strategy": strategy,
+                    "scorer": scorer,
+                    "max_token_count": budget,
+                    "tokenizer": name,
+                    "retention": retained / facts if facts else 1.0,
+                    "tokens_before": before / count,
+                    "tokens_after": after / count,
+                    "tokens_saved": (before - after) / count,
+                    "llm_calls": calls / count,
+                    "latency_ms": latency_ms / count,
+                }
+            )
+        return rows
+
+
+def dominates(a: Dict, b: Dict, latency_tolerance_ms: float = 1.0) -> bool:
+    """
+    Whether row a is at least as good as row b on every objective and
+    better on one.
+
+    Args:
+        a: A row.
+        b: Another row.
+        latency_tolerance_ms: Latencies closer than this count as equal,
+                              so timing noise doesn't decide the frontier.
+
+    Returns:
+        Whether a dominates b.
+    """
+    pairs = [(a[key], b[key]) for key in MAXIMIZE]
+    pairs += [(-a[key], -b[key]) for key in MINIMIZE if key != "latency_ms"]
+    if abs(a["latency_ms"] - b["latency_ms"]) > latency_tolerance_ms:
+        pairs.append((-a["latency_ms"], -b["latency_ms"]))
+    return all(x >= y for x, y in pairs) and any(x > y for x, y in pairs)
+
+
+def pareto_frontier(
+    rows: List[Dict], latency_tolerance_ms: float = 1.0
+) -> List[Dict]:
+    """
+    Rows no other row dominates, comparing only rows measured with the
+    same tokenizer.
+
+    Args:
+        rows: Rows returned by EvaluationHarness.run().
+        latency_tolerance_ms: Latencies closer than this count as equal.
+
+    Returns:
+        The frontier rows, in their original order.
+    """
+    return [
+        row
+        for row in rows
+        if not any(
+            other["tokenizer"] == row["tokenizer"]
+            and dominates(other, row, latency_tolerance_ms)
+            for other in rows
+        )
+    ]
+
+
+def build_report(
+    rows: List[Dict],
+    label: Optional[str] = None,
+    latency_tolerance_ms: float = 1.0,
+) -> Dict:
+    """
+    Pareto-frontier report of an evaluation, to be saved and compared
+    across releases.
+
+    Args:
+        rows: Rows returned by EvaluationHarness.run().
+        label: Name of the run, e.g. the release.
+        latency_tolerance_ms: Latencies closer than this count as equal.
+
+    Returns:
+        Dictionary with the "label", the "objectives", every row with a
+        "pareto" flag, sorted by tokenizer and descending retention, and
+        the "frontier" rows.
+    """
+    frontier = {id(row) for row in pareto_frontier(rows, latency_tolerance_ms)}
+    marked = [{**row, "pareto": id(row) in frontier} for row in rows]
+    marked.sort(key=lambda row: (row["tokenizer"], -row["retention"]))
+    return {
+        "label": label,
+        "objectives": {"maximize": list(MAXIMIZE), "minimize": list(MINIMIZE)},
+        "rows": marked,
+        "frontier": [row for row in marked if row["pareto"]],
+    }
+
+
+def save_report(report: Dict, path: str):
+    """Write a report to a JSON file."""
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def load_report(path: str) -> Dict:
+    """Read a report written by save_report()."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_reports(baseline: Dict, current: Dict) -> List[Dict]:
+    """
+    Change of every configuration between two reports.
+
+    Args:
+        baseline: The earlier report, e.g. of the last release.
+        current: The new report.
+
+    Returns:
+        One dictionary per configuration present in both reports, with its
+        "strategy", "scorer", "max_token_count" and "tokenizer" and the
+        change of each objective (current minus baseline).
+    """
+    config = ("strategy", "scorer", "max_token_count", "tokenizer")
+    earlier = {tuple(row[k] for k in config): row for row in baseline["rows"]}
+    changes = []
+    for row in current["rows"]:
+        old = earlier.get(tuple(row[k] for k in config))
+        if old is None:
+            continue
+        change = {k: row[k] for k in config}
+        for key in MAXIMIZE + MINIMIZE:
+            change[key] = row[key] - old[key]
+        changes.append(change)
+    return changes
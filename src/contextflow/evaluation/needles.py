@@ -0,0 +1,112 @@
+"""
+Synthetic conversations with planted facts ("needles") and questions on them
+"""
+
+from typing import Dict, List, Optional
+import random
+
+# (attribute, subject template, value template) of the planted facts
+_NEEDLES = [
+    ("refund code", "order #{n}", "RX-{code}"),
+    ("gate code", "warehouse {letter}", "{code}"),
+    ("account manager", "account #{n}", "{name}"),
+    ("replacement serial", "ticket #{n}", "SN{code}{letter}"),
+    ("pickup slot", "shipment #{n}", "{hour}:30 on day {day}"),
+]
+_NAMES = ["Priya Raman", "Tomas Berg", "Ada Okafor", "Lena Fischer"]
+_TOPICS = ["order", "refund", "invoice", "shipment", "login", "deploy"]
+_STATUSES = ["pending", "failed", "approved", "delayed"]
+_FILLER = [
+    "Thanks!",
+    "Ok.",
+    "Got it.",
+    "Sure, one moment.",
+    "Let me check that for you.",
+    "Is there anything else I can help with?",
+]
+
+
+def make_needle_case(
+    length: int = 60, needles: int = 3, seed: Optional[int] = None
+) -> Dict:
+    """
+    Synthetic support conversation with facts planted at random positions.
+
+    The rest of the conversation is filler and distractors that look like
+    the facts (other order numbers and statuses), so keeping the facts
+    takes more than keeping every message with a number in it.
+
+    Args:
+        length: Number of messages.
+        needles: Number of planted facts, at most one per message.
+        seed: Seed for reproducible cases.
+
+    Returns:
+        Dictionary with "messages", a "goal" naming the questions, and
+        "facts": one {"question", "answer", "index"} dictionary per planted
+        fact, index being the position of the message that states it.
+    """
+    rng = random.Random(seed)
+    messages = []
+    for i in range(length):
+        role = "user" if i % 2 == 0 else "assistant"
+        if rng.random() < 0.4:
+            content = rng.choice(_FILLER)
+        else:
+            content = (
+                f"The {rng.choice(_TOPICS)} #{rng.randint(1000, 9999)} is "
+                f"{rng.choice(_STATUSES)} since {rng.randint(1, 28)} March."
+            )
+        messages.append({"role": role, "content": content})
+
+    positions = sorted(rng.sample(range(length), min(needles, length)))
+    facts = []
+    for index in positions:
+        attribute, subject, value = rng.choice(_NEEDLES)
+        fields = {
+            "n": rng.randint(10000, 99999),
+            "code": rng.randint(1000, 9999),
+            "letter": rng.choice("ABCDEFGH"),
+            "name": rng.choice(_NAMES),
+            "hour": rng.randint(8, 17),
+            "day": rng.randint(1, 28),
+        }
+        subject = subject.format(**fields)
+        answer = value.format(**fields)
+        messages[index] = {
+            "role": "assistant",
+            "content": f"For the record, the {attribute} for {subject} is "
+            f"{answer}.",
+        }
+        facts.append(
+            {
+                "question": f"What is the {attribute} for {subject}?",
+                "answer": answer,
+                "index": index,
+            }
+        )
+
+    goal = "Answer the customer's questions. " + " ".join(
+        fact["question"] for fact in facts
+    )
+    return {"messages": messages, "goal": goal, "facts": facts}
+
+
+def make_needle_cases(
+    count: int, length: int = 60, needles: int = 3, seed: int = 0
+) -> List[Dict]:
+    """
+    A reproducible suite of needle cases.
+
+    Args:
+        count: Number of cases.
+        length: Messages per case.
+        needles: Planted facts per case.
+        seed: Seed of the first case; case i uses seed + i.
+
+    Returns:
+        List of cases as returned by make_needle_case.
+    """
+    return [
+        make_needle_case(length, needles, seed=seed + i) for i in range(count)
+    ]
@@ -0,0 +1,380 @@
+"""
+ASGI app serving ContextFlow.optimize over HTTP
+"""
+
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from contextflow import ContextFlow
+from contextflow.core.strategies import get_strategy
+import asyncio
+import hashlib
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional body format
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+
+def dumps(value, content_type: str = JSON) -> bytes:
+    """
+    Encode a response body.
+
+    Args:
+        value: The value to encode.
+        content_type: JSON or MSGPACK.
+
+    Returns:
+        The encoded bytes.
+    """
+    if content_type == MSGPACK:
+        return msgpack.packb(value, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def loads(body: bytes, content_type: str = JSON):
+    """
+    Decode a request body.
+
+    Args:
+        body: The raw body.
+        content_type: JSON or MSGPACK.
+
+    Returns:
+        The decoded value.
+    """
+    if content_type == MSGPACK:
+        return msgpack.unpackb(body, raw=False)
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+class BadRequest(ValueError):
+    """A request body that cannot be optimized; answered with 400."""
+
+
+def validate_payload(payload) -> Dict:
+    """
+    Check a decoded optimize request before any work is done on it.
+
+    Args:
+        payload: The decoded request body.
+
+    Returns:
+        The payload.
+
+    Raises:
+        BadRequest: If the payload is not a valid optimize request.
+    """
+    if not isinstance(payload, dict):
+        raise BadRequest("body must be an object")
+    messages = payload.get("messages")
+    if not isinstance(messages, list):
+        raise BadRequest("messages must be a list")
+    if not isinstance(payload.get("goal"), str):
+        raise BadRequest("goal must be a string")
+    for i, message in enumerate(messages):
+        if not isinstance(message, dict):
+            raise BadRequest(f"messages[{i}] must be an object")
+        for field in ("role", "content"):
+            if not isinstance(message.get(field), str):
+                raise BadRequest(f"messages[{i}].{field} must be a string")
+
+    max_token_count = payload.get("max_token_count", 500)
+    if (
+        not isinstance(max_token_count, int)
+        or isinstance(max_token_count, bool)
+        or max_token_count <= 0
+    ):
+        raise BadRequest("max_token_count must be a positive integer")
+    deadline_ms = payload.get("deadline_ms")
+    if deadline_ms is not None and (
+        not isinstance(deadline_ms, (int, float))
+        or isinstance(deadline_ms, bool)
+        or deadline_ms <= 0
+    ):
+        raise BadRequest("deadline_ms must be a positive number")
+    strategy = payload.get("strategy", "balanced")
+    if not isinstance(strategy, str):
+        raise BadRequest("strategy must be a string")
+    try:
+        get_strategy(strategy)
+    except ValueError as e:
+        raise BadRequest(str(e)) from e
+    return payload
+
+
+def request_key(payload: Dict) -> str:
+    """
+    Key of an optimize request. Requests with the same key have the same
+    result and can share one computation.
+
+    Args:
+        payload: The decoded request body.
+
+    Returns:
+        Hex digest of the messages, with all their fields (e.g.
+        tool_call_id and tool_calls), the goal and the options.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    key = [
+        payload["messages"],
+        payload["goal"],
+        payload.get("max_token_count", 500),
+        payload.get("strategy", "balanced"),
+        payload.get("deadline_ms"),
+    ]
+    digest.update(json.dumps(key, sort_keys=True, default=repr).encode())
+    return digest.hexdigest()
+
+
+class OptimizationServer:
+    def __init__(
+        self,
+        flow: Optional[ContextFlow] = None,
+        max_concurrency: int = 32,
+    ):
+        """
+        Initialize the OptimizationServer.
+
+        One ContextFlow, and with it one set of score and summary caches
+        and provider clients, is shared by every request. Identical
+        requests that arrive while one is being computed wait for that
+        computation instead of starting their own.
+
+        Args:
+            flow: The shared optimizer. Defaults to ContextFlow() with its
+                  default providers.
+            max_concurrency: Maximum number of optimizations running at
+                             once; further requests queue.
+        """
+        self.flow = flow if flow is not None else ContextFlow()
+        self.max_concurrency = max_concurrency
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.stats = {"requests": 0, "coalesced": 0, "errors": 0}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        method = scope["method"]
+        if method == "GET" and path == "/healthz":
+            await self._respond(send, 200, {"status": "ok"})
+        elif method == "GET" and path == "/stats":
+            await self._respond(
+                send, 200, {**self.stats, "in_flight": len(self._in_flight)}
+            )
+        elif method == "POST" and path == "/optimize":
+            await self._optimize(scope, receive, send)
+        else:
+            await self._respond(send, 404, {"error": "not found"})
+
+    async def optimize(self, payload: Dict) -> Dict:
+        """
+        Optimize one request, sharing the computation with any identical
+        request already in flight.
+
+        Args:
+            payload: Dictionary with "messages" and "goal", and optionally
+                     "max_token_count", "strategy" and "deadline_ms".
+
+        Returns:
+            The result of ContextFlow.optimize.
+        """
+        self.stats["requests"] += 1
+        key = request_key(payload)
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(self._compute(payload))
+        self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _compute(self, payload: Dict) -> Dict:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            return await asyncio.to_thread(
+                self.flow.optimize,
+                messages=payload["messages"],
+                goal=payload["goal"],
+                max_token_count=payload.get("max_token_count", 500),
+                strategy=payload.get("strategy", "balanced"),
+                deadline_ms=payload.get("deadline_ms"),
+            )
+
+    async def _optimize(self, scope, receive, send):
+        headers = dict(scope.get("headers") or [])
+        content_type = _media_type(headers.get(b"content-type", b""))
+        content_type = content_type or JSON
+        accept = _media_type(headers.get(b"accept", b"")) or content_type
+        reply_type = MSGPACK if accept == MSGPACK else JSON
+
+        if MSGPACK in (content_type, reply_type) and msgpack is None:
+            await self._respond(
+                send, 415, {"error": "msgpack is not installed"}
+            )
+            return
+
+        try:
+            try:
+                payload = loads(await _read_body(receive), content_type)
+            except Exception as e:
+                raise BadRequest(f"undecodable body: {e}") from e
+            validate_payload(payload)
+        except BadRequest as e:
+            await self._respond(
+                send, 400, {"error": f"bad request: {e}"}, reply_type
+            )
+            return
+
+        try:
+            result = await self.optimize(payload)
+        except Exception:
+            # Exception messages can carry provider or internal details
+            logger.exception("Optimizing a request failed")
+            self.stats["errors"] += 1
+            await self._respond(
+                send, 500, {"error": "internal server error"}, reply_type
+            )
+            return
+
+        result = {
+            "messages": [dict(message) for message in result["messages"]],
+            "analytics": result["analytics"],
+        }
+        await self._respond(send, 200, result, reply_type)
+
+    async def _respond(self, send, status: int, body, content_type: str = JSON):
+        data = dumps(body, content_type)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", content_type.encode()),
+                    (b"content-length", str(len(data)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": data})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_app(
+    scoring_model="gemini",
+    summarizing_model="gemini",
+    max_concurrency: int = 32,
+    **options,
+) -> OptimizationServer:
+    """
+    Build the ASGI app, e.g. for
+    `uvicorn --factory contextflow.server.app:create_app`.
+
+    Args:
+        scoring_model: Scoring provider, as for ContextFlow.
+        summarizing_model: Summarizing provider, as for ContextFlow.
+        max_concurrency: Maximum number of optimizations running at once.
+        **options: Other ContextFlow options.
+
+    Returns:
+        The ASGI application.
+    """
+    flow = ContextFlow(
+        scoring_model=scoring_model,
+        summarizing_model=summarizing_model,
+        **options,
+    )
+    return OptimizationServer(flow, max_concurrency=max_concurrency)
+
+
+async def call(
+    app: Callable[..., Awaitable],
+    method: str,
+    path: str,
+    body: bytes = b"",
+    headers: Optional[List[Tuple[bytes, bytes]]] = None,
+) -> Tuple[int, Dict[bytes, bytes], bytes]:
+    """
+    Call an ASGI app in-process, without a network server.
+
+    Args:
+        app: The ASGI application.
+        method: HTTP method.
+        path: Request path.
+        body: Request body.
+        headers: Request headers.
+
+    Returns:
+        (status, response headers, response body)
+    """
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": headers or [],
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    response = {"status": 500, "headers": {}, "body": b""}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = dict(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], response["body"]
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _media_type(value: bytes) -> str:
+    return value.decode("latin-1").split(";")[0].strip().lower()
@@ -0,0 +1,142 @@
+"""
+Load generator for the optimization service
+"""
+
+from typing import Dict, List, Optional
+from contextflow.server.app import JSON, call, dumps, loads
+import asyncio
+import random
+import statistics
+import time
+import urllib.error
+import urllib.request
+
+_TOPICS = ["order", "refund", "invoice", "shipment", "login", "deploy"]
+_FILLER = ["Thanks!", "Ok.", "Got it.", "Sure, one moment."]
+
+
+def make_conversation(
+    length: int, seed: Optional[int] = None
+) -> List[Dict[str, str]]:
+    """
+    Synthetic support conversation with a mix of facts and filler.
+
+    Args:
+        length: Number of messages.
+        seed: Seed for reproducible conversations.
+
+    Returns:
+        List of message dictionaries.
+    """
+    rng = random.Random(seed)
+    messages = []
+    for i in range(length):
+        role = "user" if i % 2 == 0 else "assistant"
+        if rng.random() < 0.3:
+            content = rng.choice(_FILLER)
+        else:
+            topic = rng.choice(_TOPICS)
+            content = (
+                f"The {topic} #{rng.randint(1000, 9999)} is "
+                f"{rng.choice(['pending', 'failed', 'approved', 'delayed'])} "
+                f"since {rng.randint(1, 28)} March. " * rng.randint(1, 4)
+            )
+        messages.append({"role": role, "content": content})
+    return messages
+
+
+async def run_load(
+    target,
+    requests: int = 200,
+    concurrency: int = 20,
+    conversations: int = 10,
+    length: int = 60,
+    max_token_count: int = 300,
+    seed: int = 0,
+) -> Dict:
+    """
+    Send optimize requests and measure latency and throughput.
+
+    Requests are drawn from a small pool of conversations, so concurrent
+    duplicates exercise request coalescing and repeats hit the caches.
+
+    Args:
+        target: An ASGI app to call in-process, or the base URL of a
+                running server (e.g. "http://127.0.0.1:8000").
+        requests: Total number of requests.
+        concurrency: Requests in flight at once.
+        conversations: Number of distinct conversations to draw from.
+        length: Messages per conversation.
+        max_token_count: Budget of each request.
+        seed: Seed for the conversations and the request order.
+
+    Returns:
+        Dictionary with "requests", "errors", "seconds", "rps" and the
+        "p50_ms", "p95_ms" and "p99_ms" latencies.
+    """
+    rng = random.Random(seed)
+    pool = [
+        dumps(
+            {
+                "messages": make_conversation(length, seed=seed + i),
+                "goal": f"Resolve the customer's {rng.choice(_TOPICS)} issue",
+                "max_token_count": max_token_count,
+            }
+        )
+        for i in range(conversations)
+    ]
+    bodies = [rng.choice(pool) for _ in range(requests)]
+
+    latencies = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for body in bodies:
+        queue.put_nowait(body)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            body = queue.get_nowait()
+            started = time.perf_counter()
+            status = await _post(target, body)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100) if latencies else []
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": seconds,
+        "rps": len(latencies) / seconds if seconds else 0.0,
+        "p50_ms": quantiles[49] if quantiles else 0.0,
+        "p95_ms": quantiles[94] if quantiles else 0.0,
+        "p99_ms": quantiles[98] if quantiles else 0.0,
+    }
+
+
+async def _post(target, body: bytes) -> int:
+    headers = [(b"content-type", JSON.encode())]
+    if not isinstance(target, str):
+        status, _, _ = await call(target, "POST", "/optimize", body, headers)
+        return status
+
+    def blocking_post():
+        request = urllib.request.Request(
+            target.rstrip("/") + "/optimize",
+            data=body,
+            headers={"Content-Type": JSON},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                loads(response.read())
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    return await asyncio.to_thread(blocking_post)
@@ -0,0 +1,166 @@
+"""
+Provider batch APIs behind one small interface
+"""
+
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+class BatchBackend(ABC):
+    """
+    A provider's asynchronous batch endpoint.
+
+    Requests are dictionaries with a "custom_id", an optional "system"
+    prefix, a "prompt" and "max_tokens". Results map each custom_id to
+    {"text": ...} or {"error": ...}.
+    """
+
+    @abstractmethod
+    def submit(self, requests: List[Dict]) -> str:
+        """
+        Submit requests as one batch.
+
+        Returns:
+            The provider's batch id.
+        """
+
+    @abstractmethod
+    def status(self, batch_id: str) -> str:
+        """
+        Returns:
+            PENDING, DONE or FAILED.
+        """
+
+    @abstractmethod
+    def results(self, batch_id: str, custom_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Collect the results of a finished batch.
+
+        Args:
+            batch_id: The provider's batch id.
+            custom_ids: The custom_ids of the batch, in submission order.
+
+        Returns:
+            Dictionary mapping custom_id to {"text": ...} or {"error": ...}.
+        """
+
+
+class AnthropicBatchBackend(BatchBackend):
+    def __init__(self, client, model: str = None):
+        """
+        Message Batches API backend.
+
+        Args:
+            client: An anthropic.Anthropic client.
+            model: Model name. Defaults to the scoring model of the claude
+                   provider.
+        """
+        from contextflow.utils.providers import claude
+
+        self.client = client
+        self.model = model or claude.MODEL_NAME
+
+    def submit(self, requests: List[Dict]) -> str:
+        batch = self.client.messages.batches.create(
+            requests=[
+                {
+                    "custom_id": request["custom_id"],
+                    "params": self._params(request),
+                }
+                for request in requests
+            ]
+        )
+        return batch.id
+
+    def _params(self, request: Dict) -> Dict:
+        from contextflow.utils.providers.claude import system_block
+
+        params = {
+            "model": self.model,
+            "max_tokens": request["max_tokens"],
+            "temperature": 0,
+            "messages": [{"role": "user", "content": request["prompt"]}],
+        }
+        if request.get("system"):
+            params["system"] = [system_block(request["system"])]
+        return params
+
+    def status(self, batch_id: str) -> str:
+        batch = self.client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != "ended":
+            return PENDING
+        return DONE
+
+    def results(self, batch_id: str, custom_ids: List[str]) -> Dict[str, Dict]:
+        results = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                text = entry.result.message.content[0].text
+                results[entry.custom_id] = {"text": text}
+            else:
+                results[entry.custom_id] = {"error": entry.result.type}
+        return results
+
+
+class GeminiBatchBackend(BatchBackend):
+    def __init__(self, client, model: str = None):
+        """
+        Gemini Batch API backend using inline requests.
+
+        Args:
+            client: A google.genai.Client.
+            model: Model name. Defaults to the model of the gemini provider.
+        """
+        from contextflow.utils.providers import gemini
+
+        self.client = client
+        self.model = model or gemini.MODEL_NAME
+
+    def submit(self, requests: List[Dict]) -> str:
+        inline = []
+        for request in requests:
+            config = {
+                "temperature": 0,
+                "max_output_tokens": request["max_tokens"],
+            }
+            if request.get("system"):
+                config["system_instruction"] = {
+                    "parts": [{"text": request["system"]}]
+                }
+            inline.append(
+                {
+                    "contents": [
+                        {"role": "user", "parts": [{"text": request["prompt"]}]}
+                    ],
+                    "config": config,
+                }
+            )
+        job = self.client.batches.create(model=self.model, src=inline)
+        return job.name
+
+    def status(self, batch_id: str) -> str:
+        state = self.client.batches.get(name=batch_id).state.name
+        if state == "JOB_STATE_SUCCEEDED":
+            return DONE
+        if state in (
+            "JOB_STATE_FAILED",
+            "JOB_STATE_CANCELLED",
+            "JOB_STATE_EXPIRED",
+        ):
+            return FAILED
+        return PENDING
+
+    def results(self, batch_id: str, custom_ids: List[str]) -> Dict[str, Dict]:
+        job = self.client.batches.get(name=batch_id)
+        # Inline responses come back in request order
+        results = {}
+        for custom_id, item in zip(custom_ids, job.dest.inlined_responses):
+            if item.error is not None or item.response is None:
+                results[custom_id] = {"error": str(item.error)}
+            else:
+                results[custom_id] = {"text": item.response.text or ""}
+        return results
@@ -0,0 +1,46 @@
+"""
+Helpers shared by the scorer, the compactors and bulk jobs
+"""
+
+from typing import Dict, List, Optional
+
+# Weight of the newest observation in latency moving averages
+LATENCY_SMOOTHING = 0.3
+
+
+def moving_average(
+    average: Optional[float],
+    observed: float,
+    smoothing: float = LATENCY_SMOOTHING,
+) -> float:
+    """
+    Fold one observation into an exponential moving average.
+
+    Args:
+        average: The current average, or None before any observation.
+        observed: The new observation.
+        smoothing: Weight of the new observation.
+
+    Returns:
+        The updated average; the observation itself if there was none.
+    """
+    if average is None:
+        return observed
+    return (1 - smoothing) * average + smoothing * observed
+
+
+def format_messages(messages: List[Dict[str, str]]) -> str:
+    """
+    Format messages into a readable conversation string.
+
+    Args:
+        messages: List of message dictionaries with "role" and "content" keys.
+
+    Returns:
+        Formatted string with each message on a new line in "Role: content"
+        format.
+    """
+    return "\n".join(
+        f"{m.get('role', 'unknown').capitalize()}: {m.get('content', '')}"
+        for m in messages
+    )
@@ -0,0 +1,346 @@
+"""
+Hedged and failover requests across several LLM providers
+"""
+
+from collections import deque
+from typing import Awaitable, Callable, Iterator, List, Dict, Optional
+import asyncio
+import threading
+import time
+import numpy as np
+
+
+class LatencyTracker:
+    def __init__(
+        self,
+        window: int = 200,
+        percentile: float = 95.0,
+        min_samples: int = 10,
+        default: float = 2.0,
+    ):
+        """
+        Rolling latency statistics of one provider.
+
+        Args:
+            window: Number of recent latencies kept.
+            percentile: Percentile used as the hedging threshold.
+            min_samples: Samples needed before the percentile is trusted.
+            default: Threshold in seconds used until then.
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default = default
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        """Add one observed latency."""
+        self._samples.append(seconds)
+
+    def threshold(self) -> float:
+        """
+        Latency after which a request counts as slow.
+
+        Returns:
+            The configured percentile of recent latencies in seconds, or the
+            default while there are too few samples.
+        """
+        if len(self._samples) < self.min_samples:
+            return self.default
+        return float(np.percentile(self._samples, self.percentile))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0):
+        """
+        Stops routing to a provider that keeps failing.
+
+        After failure_threshold consecutive failures the breaker opens and
+        the provider is skipped for cooldown seconds. Then it is half-open:
+        a single probe request is let through, and the others are still
+        skipped. A successful probe closes the breaker, a failed one opens
+        it for another cooldown.
+
+        Args:
+            failure_threshold: Consecutive failures that open the breaker.
+            cooldown: Seconds the breaker stays open.
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started: Optional[float] = None
+        # Summaries report from caller threads, scoring from the event loop
+        self._lock = threading.Lock()
+
+    def allows(self) -> bool:
+        """
+        Whether a request may be sent to the provider.
+
+        When half-open, the first call takes the probe and returns True.
+        Later calls return False until the probe's outcome is recorded, or
+        until it has been outstanding for another cooldown, e.g. because it
+        was never sent or was cancelled as a hedge.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.cooldown:
+                return False
+            if (
+                self.probe_started is not None
+                and now - self.probe_started < self.cooldown
+            ):
+                return False
+            self.probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.probe_started = None
+
+
+class HedgedLLMClient:
+    def __init__(
+        self,
+        providers: List,
+        percentile: float = 95.0,
+        min_samples: int = 10,
+        default_hedge_after: float = 2.0,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+    ):
+        """
+        Initialize the hedged client.
+
+        Requests go to the first healthy provider. If it has not answered
+        once its latency passes the percentile threshold, the same request
+        is sent to the next healthy provider as a hedge; the first answer
+        wins and the other request is cancelled. Failures fail over to the
+        next provider immediately, and providers that keep failing are
+        skipped by a circuit breaker.
+
+        Args:
+            providers: Objects with the LLMClient interface, in order of
+                       preference.
+            percentile: Latency percentile after which a hedge is sent.
+            min_samples: Latencies needed before the percentile is trusted.
+            default_hedge_after: Seconds after which to hedge until then.
+            failure_threshold: Consecutive failures that open a breaker.
+            cooldown: Seconds an open breaker skips its provider.
+
+        Raises:
+            ValueError: If no providers are given.
+        """
+        if not providers:
+            raise ValueError("HedgedLLMClient needs at least one provider")
+
+        self.providers = list(providers)
+        self.trackers = [
+            LatencyTracker(
+                percentile=percentile,
+                min_samples=min_samples,
+                default=default_hedge_after,
+            )
+            for _ in self.providers
+        ]
+        self.breakers = [
+            CircuitBreaker(failure_threshold, cooldown) for _ in self.providers
+        ]
+        self.hedges = 0
+
+    def _available(self) -> List[int]:
+        """
+        Indices of providers to try, healthy ones first. If every breaker is
+        open, all providers are tried anyway.
+        """
+        healthy = [i for i, b in enumerate(self.breakers) if b.allows()]
+        return healthy or list(range(len(self.providers)))
+
+    async def _race(self, call: Callable[[object], Awaitable]):
+        """
+        Run a request with hedging and failover.
+
+        Args:
+            call: Function taking a provider and returning the awaitable
+                  request to it.
+
+        Returns:
+            The first successful result.
+
+        Raises:
+            Exception: The last provider error if every provider failed.
+        """
+        queue = self._available()
+        running: Dict[asyncio.Task, tuple] = {}
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            index = queue.pop(0)
+            task = asyncio.ensure_future(call(self.providers[index]))
+            running[task] = (index, time.monotonic())
+
+        launch()
+        try:
+            while running:
+                timeout = None
+                if queue:
+                    index, started = list(running.values())[-1]
+                    timeout = max(
+                        0.0,
+                        started
+                        + self.trackers[index].threshold()
+                        - time.monotonic(),
+                    )
+
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                if not done:
+                    # The newest request is slow: hedge with the next provider
+                    self.hedges += 1
+                    launch()
+                    continue
+
+                for task in done:
+                    index, started = running.pop(task)
+                    if task.exception() is None:
+                        self.trackers[index].record(time.monotonic() - started)
+                        self.breakers[index].record_success()
+                        return task.result()
+
+                    last_error = task.exception()
+                    self.breakers[index].record_failure()
+                    if queue:
+                        launch()
+        finally:
+            for task, (index, started) in running.items():
+                task.cancel()
+                # A cancelled loser took at least this long; recording it
+                # keeps the percentile from only seeing the fast answers
+                self.trackers[index].record(time.monotonic() - started)
+
+        raise last_error
+
+    async def score_batch_async(
+        self, goal: str, batch: List[Dict[str, str]], max_tokens: int, **options
+    ) -> List[float]:
+        # options (output_format, use_logprobs) are forwarded as given
+        return await self._race(
+            lambda provider: provider.score_batch_async(
+                goal=goal, batch=batch, max_tokens=max_tokens, **options
+            )
+        )
+
+    async def score_batch_multi_async(
+        self, goals: List[str], batch: List[Dict[str, str]], max_tokens: int
+    ) -> List[List[float]]:
+        return await self._race(
+            lambda provider: provider.score_batch_multi_async(
+                goals=goals, batch=batch, max_tokens=max_tokens
+            )
+        )
+
+    def summarize_text(self, source: str, max_tokens: int) -> str:
+        """
+        Summarize with the first healthy provider, failing over on errors.
+
+        Summarization is synchronous, so it is not hedged.
+
+        Args:
+            source: The text to summarize.
+            max_tokens: Maximum tokens in the response.
+
+        Returns:
+            Generated text
+        """
+        last_error = None
+        for index in self._available():
+            try:
+                summary = self.providers[index].summarize_text(
+                    source=source, max_tokens=max_tokens
+                )
+            except Exception as e:
+                last_error = e
+                self.breakers[index].record_failure()
+                continue
+            self.breakers[index].record_success()
+            return summary
+
+        raise last_error
+
+    def summarize_stream(self, source: str, max_tokens: int) -> Iterator[str]:
+        """
+        Stream a summary from the first healthy provider. A provider that
+        fails before its first chunk is failed over; once chunks have been
+        yielded, errors are raised.
+
+        Args:
+            source: The text to summarize.
+            max_tokens: Maximum tokens in the response.
+
+        Yields:
+            Chunks of the summary.
+        """
+        last_error = None
+        for index in self._available():
+            stream = self.providers[index].summarize_stream(
+                source=source, max_tokens=max_tokens
+            )
+            try:
+                first = next(stream)
+            except StopIteration:
+                self.breakers[index].record_success()
+                return
+            except Exception as e:
+                last_error = e
+                self.breakers[index].record_failure()
+                continue
+            self.breakers[index].record_success()
+            try:
+                yield first
+                yield from stream
+            finally:
+                stream.close()
+            return
+
+        raise last_error
+
+    def extract_facts(self, source: str, max_tokens: int) -> List[Dict]:
+        """
+        Extract facts with the first healthy provider, failing over on
+        errors.
+
+        Args:
+            source: The messages, formatted as "Role: content" lines.
+            max_tokens: Maximum tokens in the response.
+
+        Returns:
+            List of {"category", "key", "value"} dictionaries.
+        """
+        last_error = None
+        for index in self._available():
+            try:
+                facts = self.providers[index].extract_facts(
+                    source=source, max_tokens=max_tokens
+                )
+            except Exception as e:
+                last_error = e
+                self.breakers[index].record_failure()
+                continue
+            self.breakers[index].record_success()
+            return facts
+
+        raise last_error
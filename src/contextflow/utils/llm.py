@@ -7,9 +7,11 @@ from groq import Groq
 import os
 from anthropic import Anthropic
 from openai import OpenAI
-from typing import List, Dict
+from typing import Iterator, List, Dict
 
-from contextflow.utils.providers import gemini, groq, claude
+from contextflow.utils.hedging import HedgedLLMClient
+from contextflow.utils.prompt_cache import PromptCache
+from contextflow.utils.providers import gemini, claude, fake
 
 
 class LLMClient:
@@ -20,13 +22,16 @@ class LLMClient:
         Initialize the LLM client with the specified provider.
 
         Args:
-            provider: The LLM provider to use. Options: "gemini" or "groq".
-                     Defaults to "gemini".
+            provider: The LLM provider to use. Options: "gemini", "groq",
+                     "anthropic" or "fake" (local, for tests and load
+                     generation). Defaults to "gemini".
 
         Raises:
             ValueError: If an unknown provider is specified.
         """
         self.provider = provider
+        # Cached scoring prefixes, shared by every call through this client
+        self.prompt_cache = PromptCache()
 
         if provider == "gemini":
             self.google_client = genai.Client(
@@ -38,6 +43,8 @@ class LLMClient:
             self.anthropic_client = Anthropic(
                 api_key=os.getenv("ANTHROPIC_KEY")
             )
+        elif provider == "fake":
+            self.fake_llm = fake.LLM()
         else:
             raise ValueError(f"Unknown provider: {provider}")
 
@@ -55,7 +62,9 @@ class LLMClient:
         """
         match self.provider:
             case "gemini":
-                return gemini.LLM(self.google_client).summarize_text(
+                return gemini.LLM(
+                    self.google_client, self.prompt_cache
+                ).summarize_text(
                     source=source,
                     max_tokens=max_tokens,
                 )
@@ -64,16 +73,104 @@ class LLMClient:
                     source=source,
                     max_tokens=max_tokens,
                 )
+            case "fake":
+                return self.fake_llm.summarize_text(
+                    source=source,
+                    max_tokens=max_tokens,
+                )
+
+    def summarize_stream(self, source: str, max_tokens: int) -> Iterator[str]:
+        """
+        Summarize, yielding the summary in chunks as it is generated.
+        Closing the iterator early stops the generation.
+
+        Args:
+            source: The text to summarize.
+            max_tokens: Maximum tokens in the response.
+
+        Yields:
+            Chunks of the summary.
+        """
+        match self.provider:
+            case "gemini":
+                yield from gemini.LLM(
+                    self.google_client, self.prompt_cache
+                ).summarize_stream(source=source, max_tokens=max_tokens)
+            case "anthropic":
+                yield from claude.LLM(self.anthropic_client).summarize_stream(
+                    source=source, max_tokens=max_tokens
+                )
+            case "fake":
+                yield from self.fake_llm.summarize_stream(
+                    source=source, max_tokens=max_tokens
+                )
+            case _:
+                yield self.summarize_text(source=source, max_tokens=max_tokens)
+
+    def extract_facts(self, source: str, max_tokens: int) -> List[Dict]:
+        """
+        Extract structured facts (entities, IDs, decisions, open issues)
+        from a few messages.
+
+        Args:
+            source: The messages, formatted as "Role: content" lines.
+            max_tokens: Maximum tokens in the response.
+
+        Returns:
+            List of {"category", "key", "value"} dictionaries.
+        """
+        match self.provider:
+            case "gemini":
+                return gemini.LLM(
+                    self.google_client, self.prompt_cache
+                ).extract_facts(source=source, max_tokens=max_tokens)
+            case "anthropic":
+                return claude.LLM(self.anthropic_client).extract_facts(
+                    source=source, max_tokens=max_tokens
+                )
+            case "fake":
+                return self.fake_llm.extract_facts(
+                    source=source, max_tokens=max_tokens
+                )
+
+        raise NotImplementedError(
+            f"Fact extraction is not supported by {self.provider}"
+        )
 
     async def score_batch_async(
-        self, goal: str, batch: List[Dict[str, str]], max_tokens: int
+        self,
+        goal: str,
+        batch: List[Dict[str, str]],
+        max_tokens: int,
+        output_format: str = "json",
+        use_logprobs: bool = False,
     ):
+        """
+        Score a batch of messages against a goal.
+
+        Args:
+            goal: The goal to score against.
+            batch: The messages to score.
+            max_tokens: Maximum tokens in the response.
+            output_format: "json" for a JSON array of scores, or "digits" for
+                           one 0-9 digit per message, which needs far fewer
+                           completion tokens.
+            use_logprobs: With "digits", weight each digit by its token
+                          probability where the provider exposes logprobs.
+
+        Returns:
+            One score per message in the batch.
+        """
         match self.provider:
             case "gemini":
-                return await gemini.LLM(self.google_client).score_batch_async(
+                return await gemini.LLM(
+                    self.google_client, self.prompt_cache
+                ).score_batch_async(
                     goal=goal,
                     batch=batch,
                     max_tokens=max_tokens,
+                    output_format=output_format,
+                    use_logprobs=use_logprobs,
                 )
             case "anthropic":
                 return await claude.LLM(
@@ -82,7 +179,77 @@ class LLMClient:
                     goal=goal,
                     batch=batch,
                     max_tokens=max_tokens,
+                    output_format=output_format,
+                    use_logprobs=use_logprobs,
+                )
+            case "fake":
+                return await self.fake_llm.score_batch_async(
+                    goal=goal,
+                    batch=batch,
+                    max_tokens=max_tokens,
+                    output_format=output_format,
+                    use_logprobs=use_logprobs,
                 )
 
         # Fallback
         return [5.0] * len(batch)
+
+    async def score_batch_multi_async(
+        self, goals: List[str], batch: List[Dict[str, str]], max_tokens: int
+    ) -> List[List[float]]:
+        """
+        Score a batch of messages against several goals in one request.
+
+        Args:
+            goals: The goals to score against.
+            batch: The messages to score.
+            max_tokens: Maximum tokens in the response.
+
+        Returns:
+            A list such that result[i][j] is the score of batch[i] for goals[j].
+        """
+        match self.provider:
+            case "gemini":
+                return await gemini.LLM(
+                    self.google_client, self.prompt_cache
+                ).score_batch_multi_async(
+                    goals=goals,
+                    batch=batch,
+                    max_tokens=max_tokens,
+                )
+            case "anthropic":
+                return await claude.LLM(
+                    self.anthropic_client
+                ).score_batch_multi_async(
+                    goals=goals,
+                    batch=batch,
+                    max_tokens=max_tokens,
+                )
+            case "fake":
+                return await self.fake_llm.score_batch_multi_async(
+                    goals=goals,
+                    batch=batch,
+                    max_tokens=max_tokens,
+                )
+
+        # Fallback
+        return [[5.0] * len(goals) for _ in batch]
+
+
+def resolve_client(model):
+    """
+    Build the client for a model argument.
+
+    Args:
+        model: A provider name (e.g. "gemini"), a list of provider names or
+               clients to hedge and fail over between, or an object with
+               the LLMClient interface.
+
+    Returns:
+        An object with the LLMClient interface.
+    """
+    if isinstance(model, str):
+        return LLMClient(model)
+    if isinstance(model, (list, tuple)):
+        return HedgedLLMClient([resolve_client(m) for m in model])
+    return model
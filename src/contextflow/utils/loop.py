@@ -0,0 +1,99 @@
+"""
+One long-lived event loop, on a background thread, for the sync API
+"""
+
+from concurrent.futures import TimeoutError
+from typing import Awaitable, Optional, TypeVar
+import asyncio
+import os
+import threading
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_pid: Optional[int] = None
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """
+    The process-wide event loop the sync API runs coroutines on, started on
+    first use.
+
+    The loop runs forever on a daemon thread, so async provider clients
+    and their connection pools live as long as the process instead of
+    being rebuilt on every call. A forked worker (e.g. under Gunicorn)
+    starts its own loop, since threads do not survive a fork.
+
+    Returns:
+        The running background loop.
+    """
+    global _loop, _thread, _pid
+
+    with _lock:
+        if (
+            _loop is not None
+            and _pid == os.getpid()
+            and _thread.is_alive()
+            and not _loop.is_closed()
+        ):
+            return _loop
+
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+
+        thread = threading.Thread(
+            target=serve, name="contextflow-loop", daemon=True
+        )
+        thread.start()
+        started.wait()
+
+        _loop, _thread, _pid = loop, thread, os.getpid()
+        return loop
+
+
+def run_sync(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """
+    Run a coroutine on the background loop and wait for its result.
+
+    Safe to call from any number of threads at once, and from code that is
+    itself running inside an event loop. Context variables of the calling
+    thread (e.g. usage tracking) are visible to the coroutine.
+
+    Args:
+        coro: The coroutine to run.
+        timeout: Seconds to wait before cancelling it, or None to wait as
+                 long as it takes.
+
+    Returns:
+        The coroutine's result.
+
+    Raises:
+        RuntimeError: If called from the background loop itself, where
+                      waiting would deadlock. Await the coroutine instead.
+        TimeoutError: If the timeout passes first.
+    """
+    loop = background_loop()
+    if threading.current_thread() is _thread:
+        coro.close()
+        raise RuntimeError(
+            "run_sync() called from the background loop; await instead"
+        )
+
+    # call_soon_threadsafe copies the caller's context into the new task
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+    except BaseException:
+        # e.g. KeyboardInterrupt: do not leave the coroutine running
+        future.cancel()
+        raise
@@ -0,0 +1,162 @@
+"""
+Bookkeeping for provider-side cached prompt prefixes
+"""
+
+from typing import Dict, Optional, Set, Tuple
+import hashlib
+import threading
+import time
+
+
+class PromptCache:
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        refresh_margin: float = 30.0,
+        min_tokens: int = 1024,
+    ):
+        """
+        Initialize the PromptCache.
+
+        Tracks handles of prompt prefixes cached on the provider side (e.g.
+        Gemini cached contents) together with their expiry, so a handle is
+        reused while it is valid and recreated shortly before it expires.
+
+        Args:
+            ttl: Lifetime in seconds requested for each cached prefix.
+            refresh_margin: A handle this close to expiring is not reused,
+                            so a request never races its expiry.
+            min_tokens: Prefixes shorter than this are not cached; providers
+                        reject or ignore caches below a minimum size.
+        """
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.min_tokens = min_tokens
+        self._handles: Dict[str, Tuple[str, float]] = {}
+        self._failed: Dict[str, float] = {}
+        self._creating: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, prefix: str) -> str:
+        """
+        Key of a prefix for a model.
+
+        Args:
+            model: The model the prefix is cached for.
+            prefix: The prefix text.
+
+        Returns:
+            Hex digest.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(model.encode())
+        digest.update(b"\0")
+        digest.update(prefix.encode())
+        return digest.hexdigest()
+
+    def cacheable(self, key: str, prefix: str) -> bool:
+        """
+        Whether a cache should be created for a prefix.
+
+        Args:
+            key: The prefix's key.
+            prefix: The prefix text.
+
+        Returns:
+            False if the prefix is too short or creating it failed recently.
+        """
+        if len(prefix) // 4 < self.min_tokens:
+            return False
+        with self._lock:
+            failed_at = self._failed.get(key)
+        return failed_at is None or time.monotonic() - failed_at >= self.ttl
+
+    def claim(self, key: str) -> bool:
+        """
+        Reserve the creation of a prefix's cache, so concurrent requests
+        don't each create one. Release it with release() once done.
+
+        Args:
+            key: The prefix's key.
+
+        Returns:
+            False if the prefix is already cached or being cached.
+        """
+        with self._lock:
+            if key in self._handles or key in self._creating:
+                return False
+            self._creating.add(key)
+            return True
+
+    def release(self, key: str):
+        """
+        End a creation reserved with claim().
+
+        Args:
+            key: The prefix's key.
+        """
+        with self._lock:
+            self._creating.discard(key)
+
+    def lookup(self, key: str) -> Optional[str]:
+        """
+        Handle of a cached prefix that is valid for a while longer.
+
+        Args:
+            key: The prefix's key.
+
+        Returns:
+            The provider's handle (e.g. a cached content name), or None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._handles.get(key)
+            if entry is None:
+                return None
+            handle, expires_at = entry
+            if expires_at - now <= self.refresh_margin:
+                del self._handles[key]
+                return None
+            return handle
+
+    def store(self, key: str, handle: str):
+        """
+        Remember a freshly created cached prefix.
+
+        Args:
+            key: The prefix's key.
+            handle: The provider's handle for it.
+        """
+        with self._lock:
+            self._handles[key] = (handle, time.monotonic() + self.ttl)
+            self._failed.pop(key, None)
+            self._evict_expired()
+
+    def fail(self, key: str):
+        """
+        Remember that caching a prefix failed, so it is not retried for ttl.
+
+        Args:
+            key: The prefix's key.
+        """
+        with self._lock:
+            self._failed[key] = time.monotonic()
+
+    def invalidate(self, key: str):
+        """
+        Forget a handle the provider no longer accepts.
+
+        Args:
+            key: The prefix's key.
+        """
+        with self._lock:
+            self._handles.pop(key, None)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [k for k, (_, t) in self._handles.items() if t <= now]:
+            del self._handles[key]
+
+    def __len__(self) -> int:
+        return len(self._handles)
@@ -1,6 +1,207 @@
-from typing import List, Dict
+from typing import Iterator, List, Dict
 
 from abc import ABC, abstractmethod
+import re
+
+
+def normalize_score_vector(
+    scores: List[float], expected_count: int
+) -> List[float]:
+    """
+    Clamp a score vector to 0-10 and pad or cut it to expected_count entries.
+
+    Args:
+        scores: Scores returned by the model.
+        expected_count: Number of scores that were asked for.
+
+    Returns:
+        List of expected_count scores, padded with 5.0 if any are missing.
+    """
+    vector = [max(0.0, min(10.0, float(s))) for s in scores[:expected_count]]
+    return vector + [5.0] * (expected_count - len(vector))
+
+
+def format_batch(batch: List[Dict[str, str]]) -> str:
+    """
+    Format a batch of messages as a numbered list for scoring prompts.
+
+    Args:
+        batch: The messages to format.
+
+    Returns:
+        One "i. [Role] content" line per message.
+    """
+    formatted_messages = ""
+    for i, msg in enumerate(batch, 1):
+        role = msg.get("role", "unknown").capitalize()
+        content = msg.get("content", "")
+        formatted_messages += f"{i}. [{role}] {content}\n"
+    return formatted_messages
+
+
+def digit_to_score(digit: float) -> float:
+    """
+    Map a 0-9 digit rating onto the 0-10 score scale.
+    """
+    return digit * 10 / 9
+
+
+def decode_digit_scores(text: str, expected_count: int) -> List[float]:
+    """
+    Decode the compact digit-string score format, one 0-9 digit per message.
+
+    Args:
+        text: The raw model output, e.g. "7192".
+        expected_count: Number of messages that were scored.
+
+    Returns:
+        List of scores on the 0-10 scale.
+
+    Raises:
+        ValueError: If the output is not exactly expected_count digits.
+    """
+    digits = re.sub(r"[\s`]", "", text)
+    if len(digits) != expected_count or not digits.isdigit():
+        raise ValueError(
+            f"Expected {expected_count} digits, got {text.strip()!r}"
+        )
+    return [digit_to_score(int(d)) for d in digits]
+
+
+def digit_scoring_prefix(goal: str) -> str:
+    """
+    Stable, cacheable part of the digit scoring prompt: rubric and goal.
+
+    Args:
+        goal: The goal to score against.
+
+    Returns:
+        The prefix text.
+    """
+    return f"""Rate message relevance to goal (0-9 scale):
+
+        Goal: {goal}
+
+        Scoring guide (err on the LOW side):
+        8-9: ONLY critical facts/errors with specific details ("NullPointerException line 42" = 9)
+        5-7: Important context, questions, partial info ("Can you check?" = 6)
+        2-4: Minor details, acknowledgments ("I see" = 3)
+        0-1: Pure filler, greetings, "ok", "thanks" (= 1)
+
+        """
+
+
+def digit_scoring_suffix(batch: List[Dict[str, str]]) -> str:
+    """
+    Per-batch part of the digit scoring prompt: messages and reply format.
+
+    Args:
+        batch: The messages to score.
+
+    Returns:
+        The suffix text.
+    """
+    return f"""MESSAGES TO RATE:
+        {format_batch(batch)}
+
+        Reply with exactly {len(batch)} digits and nothing else: one digit per
+        message, in order, no spaces. Example for 4 messages: 7192
+        """
+
+
+def digit_scoring_prompt(goal: str, batch: List[Dict[str, str]]) -> str:
+    """
+    Scoring prompt asking for one digit per message and nothing else.
+
+    Args:
+        goal: The goal to score against.
+        batch: The messages to score.
+
+    Returns:
+        The prompt text.
+    """
+    return digit_scoring_prefix(goal) + digit_scoring_suffix(batch)
+
+
+def summary_prompt(source: str, max_tokens: int) -> str:
+    """
+    Summarization prompt asking for about max_tokens tokens.
+
+    Args:
+        source: The conversation text to summarize.
+        max_tokens: Target length of the summary.
+
+    Returns:
+        The prompt text.
+    """
+    return f"""You are summarizing a conversation to preserve key information while reducing length.
+
+        Conversation:
+        {source}
+
+        Instructions:
+        - Create a dense, information-rich summary
+        - Preserve all critical facts, names, numbers, and decisions
+        - Remove pleasantries and redundant information
+        - Target length: approximately {max_tokens} tokens
+        - Write in third person (e.g., "User reported X. Agent confirmed Y.")
+        - Be extremely concise. Proper English is not necessary. Convey the utmost with the least.
+
+        Summary:"""
+
+
+FACT_CATEGORIES = ("entity", "id", "decision", "issue")
+
+
+def fact_extraction_prompt(source: str) -> str:
+    """
+    Prompt asking for the facts in a few messages, one per line.
+
+    Args:
+        source: The messages, formatted as "Role: content" lines.
+
+    Returns:
+        The prompt text.
+    """
+    return f"""Extract the facts worth remembering from these messages.
+
+        Messages:
+        {source}
+
+        One fact per line, formatted exactly as: category | key | value
+        Categories:
+        - entity: people, products, systems (key: the name)
+        - id: order numbers, ticket IDs, versions, amounts (key: the ID)
+        - decision: what was decided or done (key: short topic)
+        - issue: open questions or unresolved problems (key: short topic)
+        Reuse the same key for the same thing. Values are terse, no filler.
+        Reply with nothing but the fact lines; reply "none" if there are no
+        facts.
+        """
+
+
+def decode_facts(text: str) -> List[Dict[str, str]]:
+    """
+    Decode the "category | key | value" fact lines of an extraction reply.
+
+    Lines in another shape or with an unknown category are skipped.
+
+    Args:
+        text: The raw model output.
+
+    Returns:
+        List of {"category", "key", "value"} dictionaries.
+    """
+    facts = []
+    for line in text.splitlines():
+        parts = [part.strip() for part in line.strip("-* \t").split("|")]
+        if len(parts) != 3 or not all(parts):
+            continue
+        category = parts[0].lower()
+        if category not in FACT_CATEGORIES:
+            continue
+        facts.append({"category": category, "key": parts[1], "value": parts[2]})
+    return facts
 
 
 class LLMProvider(ABC):
@@ -19,5 +220,49 @@ class LLMProvider(ABC):
         goal: str,
         batch: List[Dict[str, str]],
         max_tokens: int,
+        output_format: str = "json",
+        use_logprobs: bool = False,
     ) -> List[float]:
         pass
+
+    @abstractmethod
+    async def score_batch_multi_async(
+        self,
+        goals: List[str],
+        batch: List[Dict[str, str]],
+        max_tokens: int,
+    ) -> List[List[float]]:
+        pass
+
+    def summarize_stream(self, source: str, max_tokens: int) -> Iterator[str]:
+        """
+        Summarize, yielding the summary in chunks as it is generated.
+
+        Closing the iterator early stops the generation. Providers without
+        streaming yield the whole summary as one chunk.
+
+        Args:
+            source: The text to summarize.
+            max_tokens: Maximum tokens in the response.
+
+        Yields:
+            Chunks of the summary.
+        """
+        yield self.summarize_text(source=source, max_tokens=max_tokens)
+
+    def extract_facts(
+        self, source: str, max_tokens: int
+    ) -> List[Dict[str, str]]:
+        """
+        Extract structured facts from a few messages.
+
+        Args:
+            source: The messages, formatted as "Role: content" lines.
+            max_tokens: Maximum tokens in the response.
+
+        Returns:
+            List of {"category", "key", "value"} dictionaries.
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support fact extraction"
+        )
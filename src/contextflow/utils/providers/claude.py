@@ -1,33 +1,34 @@
 from anthropic import Anthropic
 import asyncio
-from contextflow.utils.providers.base import LLMProvider
-from typing import List, Dict
+from contextflow.utils.providers.base import (
+    LLMProvider,
+    decode_digit_scores,
+    decode_facts,
+    digit_scoring_prefix,
+    digit_scoring_suffix,
+    fact_extraction_prompt,
+    format_batch,
+    normalize_score_vector,
+    summary_prompt,
+)
+from contextflow.utils.usage import record_usage
+from typing import Iterator, List, Dict
 import json
 import re
 
 
 MODEL_NAME = "claude-haiku-4-5-20251001"
 
+# Shorter prompt prefixes are not cached by MODEL_NAME
+CACHE_MIN_TOKENS = 4096
+
 
 class LLM(LLMProvider):
     def __init__(self, client: Anthropic):
         self.client = client
 
     def summarize_text(self, source: str, max_tokens: int) -> str:
-        prompt = f"""You are summarizing a conversation to preserve key information while reducing length.
-
-        Conversation:
-        {source}
-
-        Instructions:
-        - Create a dense, information-rich summary
-        - Preserve all critical facts, names, numbers, and decisions
-        - Remove pleasantries and redundant information
-        - Target length: approximately {max_tokens} tokens
-        - Write in third person (e.g., "User reported X. Agent confirmed Y.")
-        - Be extremely concise. Proper English is not necessary. Convey the utmost and the least amount of characters.
-
-        Summary:"""
+        prompt = summary_prompt(source, max_tokens)
 
         # print(max_tokens)
 
@@ -37,9 +38,44 @@ class LLM(LLMProvider):
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2,
         )
+        _record(response, "summarize")
 
         return response.content[0].text
 
+    def summarize_stream(self, source: str, max_tokens: int) -> Iterator[str]:
+        with self.client.messages.stream(
+            model=MODEL_NAME,
+            max_tokens=max_tokens,
+            messages=[
+                {"role": "user", "content": summary_prompt(source, max_tokens)}
+            ],
+            temperature=0.2,
+        ) as stream:
+            try:
+                yield from stream.text_stream
+            finally:
+                # Leaving the block closes the connection, which stops the
+                # generation when the caller stops early
+                try:
+                    snapshot = stream.current_message_snapshot
+                except AssertionError:  # failed before the message started
+                    snapshot = None
+                if snapshot is not None:
+                    _record(snapshot, "summarize", streamed=True)
+
+    def extract_facts(self, source: str, max_tokens: int) -> List[Dict]:
+        response = self.client.messages.create(
+            model=MODEL_NAME,
+            max_tokens=max_tokens,
+            messages=[
+                {"role": "user", "content": fact_extraction_prompt(source)}
+            ],
+            temperature=0,
+        )
+        _record(response, "extract")
+
+        return decode_facts(response.content[0].text)
+
     def score_message(self, goal: str, message: str) -> Dict:
         prompt = f"""Rate message relevance to goal (0-10 scale):
 
@@ -99,17 +135,24 @@ class LLM(LLMProvider):
         return final_scores
 
     async def score_batch_async(
-        self, goal: str, batch: List[Dict[str, str]], max_tokens: int
+        self,
+        goal: str,
+        batch: List[Dict[str, str]],
+        max_tokens: int,
+        output_format: str = "json",
+        use_logprobs: bool = False,
     ):
-        characters = 0
-        formatted_messages = ""
-        for i, msg in enumerate(batch, 1):
-            role = msg.get("role", "unknown").capitalize()
-            content = msg.get("content", "")
-            formatted_messages += f"{i}. [{role}] {content}\n"
-            characters += len(content)
-
-        prompt = f"""Rate message relevance to goal (0-10 scale):
+        # The Messages API has no logprobs, so use_logprobs is ignored
+        if output_format == "digits":
+            try:
+                return await self._score_batch_digits_async(goal, batch)
+            except ValueError:
+                # Malformed digit string: score this batch the verbose way
+                pass
+
+        # Rubric and goal go in a cached system block: identical for every
+        # batch of a conversation, so later batches read them from cache
+        prefix = f"""Rate message relevance to goal (0-10 scale):
 
         Goal: {goal}
 
@@ -121,37 +164,171 @@ class LLM(LLMProvider):
 
         Most messages should score between 3-6. Be HARSH but FAIR.
 
-        MESSAGES TO RATE:
-        {formatted_messages}
-
         DO NOT RETURN ANYTHING OTHER THAN A JSON ARRAY.
-        
+        """
+
+        suffix = f"""MESSAGES TO RATE:
+        {format_batch(batch)}
+
         Return ONLY a JSON array with one score per message in order:
         """
 
         def blocking_call():
-            return self.client.messages.create(
-                model=MODEL_NAME,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                temperature=0,
-                max_tokens=max_tokens,
-            )
+            return self._create(prefix, suffix, max_tokens)
 
         response = await asyncio.to_thread(blocking_call)
+        _record(response, "score", format="json")
+
+        scores = _parse_json_response(response.content[0].text)
+
+        return scores
+
+    async def _score_batch_digits_async(
+        self, goal: str, batch: List[Dict[str, str]]
+    ) -> List[float]:
+        """
+        Score a batch with the compact format: one digit per message.
 
-        raw_text = response.content[0].text.strip()
+        Args:
+            goal: The goal to score against.
+            batch: The messages to score.
 
-        cleaned = re.sub(
-            r"^```json\\?\n?|```$", "", raw_text, flags=re.IGNORECASE
+        Returns:
+            List of scores on the 0-10 scale.
+
+        Raises:
+            ValueError: If the model's output can't be decoded.
+        """
+        prefix = digit_scoring_prefix(goal)
+        suffix = digit_scoring_suffix(batch)
+
+        def blocking_call():
+            return self._create(prefix, suffix, len(batch) + 8)
+
+        response = await asyncio.to_thread(blocking_call)
+        _record(response, "score", format="digits")
+
+        return decode_digit_scores(response.content[0].text, len(batch))
+
+    async def score_batch_multi_async(
+        self, goals: List[str], batch: List[Dict[str, str]], max_tokens: int
+    ) -> List[List[float]]:
+        formatted_goals = "\n".join(
+            f"{i}. {goal}" for i, goal in enumerate(goals, 1)
         )
-        cleaned = cleaned.replace("\\n", "\n")  # unescape newlines
 
-        # print(raw_text, cleaned)
-        scores = json.loads(cleaned)
+        prefix = f"""Rate message relevance to EACH goal (0-10 scale):
 
-        return scores
+        Goals:
+        {formatted_goals}
+
+        Scoring guide (err on the LOW side):
+        9-10: ONLY critical facts/errors with specific details ("NullPointerException line 42" = 10)
+        6-8: Important context, questions, partial info ("Can you check?" = 7)
+        3-5: Minor details, acknowledgments ("I see" = 4)
+        0-2: Pure filler, greetings, "ok", "thanks" (= 1)
+
+        Most messages should score between 3-6. Be HARSH but FAIR.
+
+        DO NOT RETURN ANYTHING OTHER THAN A JSON ARRAY.
+        """
+
+        suffix = f"""MESSAGES TO RATE:
+        {format_batch(batch)}
+
+        Return ONLY a JSON array with one inner array per message in order.
+        Each inner array has one score per goal, in the order the goals are listed:
+        """
+
+        def blocking_call():
+            return self._create(prefix, suffix, max_tokens)
+
+        response = await asyncio.to_thread(blocking_call)
+        _record(response, "score_multi")
+
+        vectors = _parse_json_response(response.content[0].text)
+        vectors = vectors + [[]] * (len(batch) - len(vectors))
+
+        return [
+            normalize_score_vector(vector, len(goals))
+            for vector in vectors[: len(batch)]
+        ]
+
+    def _create(self, prefix: str, suffix: str, max_tokens: int):
+        """
+        Send a scoring request with prefix as a system block, marked for
+        caching if it is long enough to be cached.
+
+        Anthropic keeps the cached block for about five minutes after its
+        last use. A rubric with a short goal is well below
+        CACHE_MIN_TOKENS, and is sent without cache_control.
+
+        Args:
+            prefix: Instructions shared by many calls (rubric and goal).
+            suffix: The per-call part (the messages).
+            max_tokens: Maximum tokens in the response.
+
+        Returns:
+            The Messages API response.
+        """
+        return self.client.messages.create(
+            model=MODEL_NAME,
+            system=[system_block(prefix)],
+            messages=[{"role": "user", "content": suffix}],
+            temperature=0,
+            max_tokens=max_tokens,
+        )
+
+
+def system_block(text: str, min_tokens: int = CACHE_MIN_TOKENS) -> Dict:
+    """
+    A system prompt block, with cache_control if it is long enough to be
+    cached; shorter blocks would only be marked in vain.
+
+    Args:
+        text: The block's text.
+        min_tokens: Minimum cacheable length of the model.
+
+    Returns:
+        The content block.
+    """
+    block = {"type": "text", "text": text}
+    if len(text) // 4 >= min_tokens:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+
+def _record(response, operation: str, **extra):
+    """
+    Record the token usage reported on an Anthropic response.
+    """
+    usage = getattr(response, "usage", None)
+    # input_tokens only counts the tokens after the last cache breakpoint
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    record_usage(
+        "anthropic",
+        operation,
+        (getattr(usage, "input_tokens", None) or 0) + cache_read + cache_write,
+        getattr(usage, "output_tokens", None),
+        cached_input_tokens=cache_read,
+        **extra,
+    )
+
+
+def _parse_json_response(raw_text: str):
+    """
+    Parse a JSON response that may be wrapped in a markdown code fence.
+
+    Args:
+        raw_text: The raw text returned by the model.
+
+    Returns:
+        The decoded JSON value.
+    """
+    cleaned = re.sub(
+        r"^```json\\?\n?|```$", "", raw_text.strip(), flags=re.IGNORECASE
+    )
+    cleaned = cleaned.replace("\\n", "\n")  # unescape newlines
+
+    return json.loads(cleaned)
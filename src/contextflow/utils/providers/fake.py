@@ -0,0 +1,227 @@
+"""
+Deterministic local provider for tests, benchmarks and load generation
+"""
+
+from contextflow.utils.providers.base import (
+    LLMProvider,
+    digit_to_score,
+    format_batch,
+)
+from contextflow.utils.batch import DONE, FAILED, PENDING, BatchBackend
+from contextflow.utils.usage import record_usage
+from typing import Callable, Iterator, List, Dict, Optional
+import asyncio
+import itertools
+import random
+import re
+import time
+
+_RATED = re.compile(r"^\s*\d+\. \[(\w+)\] ", re.MULTILINE)
+_DIGIT_COUNT = re.compile(r"Reply with exactly (\d+) digits")
+_IDENTIFIER = re.compile(r"#?\b[A-Za-z]*\d[\w-]*")
+_DECISION = re.compile(r"\b(decided|agreed|confirmed|will)\b", re.IGNORECASE)
+_CONVERSATION = re.compile(r"Conversation:\n(.*?)\n\s*Instructions:", re.DOTALL)
+
+
+def fixed_latency(seconds: float) -> Callable[[], float]:
+    """
+    Latency sampler that always returns the same value.
+
+    Args:
+        seconds: The latency.
+
+    Returns:
+        A function returning the latency in seconds.
+    """
+    return lambda: seconds
+
+
+def lognormal_latency(
+    median: float, sigma: float = 0.5, seed: Optional[int] = None
+) -> Callable[[], float]:
+    """
+    Latency sampler with a long right tail, like real provider latencies.
+
+    Args:
+        median: Median latency in seconds.
+        sigma: Spread of the underlying normal distribution. Larger values
+               give heavier tails.
+        seed: Seed for reproducible samples.
+
+    Returns:
+        A function returning a sampled latency in seconds.
+    """
+    rng = random.Random(seed)
+    return lambda: median * rng.lognormvariate(0.0, sigma)
+
+
+class LLM(LLMProvider):
+    def __init__(
+        self,
+        latency: Optional[Callable[[], float]] = None,
+        failure_rate: float = 0.0,
+        score: Optional[Callable[[Dict[str, str]], float]] = None,
+        seed: Optional[int] = None,
+    ):
+        """
+        A fake provider that answers locally.
+
+        Args:
+            latency: Sampler returning the latency of each call in seconds.
+                     Defaults to no latency.
+            failure_rate: Probability that a call raises RuntimeError.
+            score: Function scoring a message. Defaults to 5.0 for every
+                   message.
+            seed: Seed for the failure draws.
+        """
+        self.latency = latency or fixed_latency(0.0)
+        self.failure_rate = failure_rate
+        self.score = score or (lambda message: 5.0)
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    def _maybe_fail(self):
+        self.calls += 1
+        if self._rng.random() < self.failure_rate:
+            raise RuntimeError("fake provider failure")
+
+    def summarize_text(self, source: str, max_tokens: int) -> str:
+        time.sleep(self.latency())
+        self._maybe_fail()
+        summary = source[: max_tokens * 4]
+        record_usage("fake", "summarize", len(source) // 4, len(summary) // 4)
+        return summary
+
+    def summarize_stream(self, source: str, max_tokens: int) -> Iterator[str]:
+        # Latency spread over the chunks, like tokens arriving over time
+        summary = source[: max_tokens * 4]
+        chunks = [summary[i : i + 16] for i in range(0, len(summary), 16)]
+        latency = self.latency()
+        self._maybe_fail()
+        sent = 0
+        try:
+            for chunk in chunks:
+                time.sleep(latency / max(len(chunks), 1))
+                yield chunk
+                sent += len(chunk)
+        finally:
+            record_usage("fake", "summarize", len(source) // 4, sent // 4)
+
+    def extract_facts(self, source: str, max_tokens: int) -> List[Dict]:
+        time.sleep(self.latency())
+        self._maybe_fail()
+
+        # IDs, decisions and questions, one line (message) at a time
+        facts = []
+        for line in source.splitlines():
+            _, _, content = line.partition(": ")
+            content = content.strip()
+            value = content[:120]
+            topic = " ".join(content.split()[:4])
+            found = [("id", key) for key in _IDENTIFIER.findall(content)]
+            if _DECISION.search(content):
+                found.append(("decision", topic))
+            elif content.endswith("?"):
+                found.append(("issue", topic))
+            for category, key in found:
+                facts.append({"category": category, "key": key, "value": value})
+
+        output = sum(len(str(fact)) for fact in facts) // 4
+        record_usage("fake", "extract", len(source) // 4, output)
+        return facts
+
+    async def score_batch_async(
+        self,
+        goal: str,
+        batch: List[Dict[str, str]],
+        max_tokens: int,
+        output_format: str = "json",
+        use_logprobs: bool = False,
+    ) -> List[float]:
+        await asyncio.sleep(self.latency())
+        self._maybe_fail()
+        record_usage("fake", "score", len(format_batch(batch)) // 4, len(batch))
+        scores = [self.score(message) for message in batch]
+        if output_format == "digits":
+            # Same precision loss as a real provider answering in digits
+            scores = [digit_to_score(round(s * 9 / 10)) for s in scores]
+        return scores
+
+    async def score_batch_multi_async(
+        self, goals: List[str], batch: List[Dict[str, str]], max_tokens: int
+    ) -> List[List[float]]:
+        await asyncio.sleep(self.latency())
+        self._maybe_fail()
+        return [[self.score(message)] * len(goals) for message in batch]
+
+
+class BatchServer(BatchBackend):
+    def __init__(
+        self,
+        score: Optional[Callable[[Dict[str, str]], float]] = None,
+        polls: int = 1,
+        failures: int = 0,
+    ):
+        """
+        A local stand-in for a provider batch endpoint.
+
+        Batches finish after a number of polls. Scoring requests are
+        answered in the digit format from a score function and summary
+        requests with the start of the conversation.
+
+        Args:
+            score: Function scoring a message. Defaults to 5.0 for every
+                   message.
+            polls: Number of status polls a batch stays pending for.
+            failures: Number of batches, starting with the first, that fail
+                      instead of finishing.
+        """
+        self.score = score or (lambda message: 5.0)
+        self.polls = polls
+        self.failures = failures
+        self.batches: Dict[str, Dict] = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, requests: List[Dict]) -> str:
+        batch_id = f"batch_{next(self._ids)}"
+        self.batches[batch_id] = {
+            "requests": list(requests),
+            "polls": 0,
+            "failed": len(self.batches) < self.failures,
+        }
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        batch = self.batches[batch_id]
+        batch["polls"] += 1
+        if batch["polls"] <= self.polls:
+            return PENDING
+        return FAILED if batch["failed"] else DONE
+
+    def results(self, batch_id: str, custom_ids: List[str]) -> Dict[str, Dict]:
+        return {
+            request["custom_id"]: {"text": self._answer(request)}
+            for request in self.batches[batch_id]["requests"]
+        }
+
+    def _answer(self, request: Dict) -> str:
+        prompt = request["prompt"]
+        count = _DIGIT_COUNT.search(prompt)
+        if count is None:
+            match = _CONVERSATION.search(prompt)
+            source = match.group(1).strip() if match else prompt
+            return source[: request["max_tokens"] * 4]
+
+        # Recover the rated messages from the numbered list
+        section = prompt[: count.start()]
+        found = list(_RATED.finditer(section))
+        digits = []
+        for i, match in enumerate(found):
+            end = found[i + 1].start() if i + 1 < len(found) else len(section)
+            message = {
+                "role": match.group(1).lower(),
+                "content": section[match.end() : end].strip(),
+            }
+            score = max(0.0, min(10.0, self.score(message)))
+            digits.append(str(round(score * 9 / 10)))
+        return "".join(digits)
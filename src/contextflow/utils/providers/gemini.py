@@ -1,42 +1,94 @@
-from contextflow.utils.providers.base import LLMProvider
-from google.genai import Client, types
-from typing import List, Dict
+from contextflow.utils.prompt_cache import PromptCache
+from contextflow.utils.providers.base import (
+    LLMProvider,
+    decode_digit_scores,
+    decode_facts,
+    digit_scoring_prefix,
+    digit_scoring_suffix,
+    digit_to_score,
+    fact_extraction_prompt,
+    format_batch,
+    normalize_score_vector,
+    summary_prompt,
+)
+from contextflow.utils.usage import record_usage
+from google.genai import Client, errors, types
+from typing import Iterator, List, Dict, Optional
 import json
+import math
 
 
 MODEL_NAME = "gemini-2.5-flash-lite"
 
 
 class LLM(LLMProvider):
-    def __init__(self, client: Client):
+    def __init__(
+        self, client: Client, prompt_cache: Optional[PromptCache] = None
+    ):
+        """
+        Gemini provider.
+
+        Args:
+            client: The google-genai client.
+            prompt_cache: Handles of scoring prefixes (rubric and goal)
+                          cached as Gemini cached contents. Without one,
+                          prompts still put the prefix first so Gemini's
+                          implicit caching can reuse it.
+        """
         self.client = client
+        self.prompt_cache = prompt_cache
 
     def summarize_text(self, source: str, max_tokens: int):
-        prompt = f"""You are summarizing a conversation to preserve key information while reducing length.
-
-        Conversation:
-        {source}
-
-        Instructions:
-        - Create a dense, information-rich summary
-        - Preserve all critical facts, names, numbers, and decisions
-        - Remove pleasantries and redundant information
-        - Target length: approximately {max_tokens} tokens
-        - Write in third person (e.g., "User reported X. Agent confirmed Y.")
-        - Be extremely concise. Proper English is not necessary. Convey the utmost with the least.
-
-        Summary:"""
+        prompt = summary_prompt(source, max_tokens)
 
         response = self.client.models.generate_content(
             model=MODEL_NAME,
             contents=prompt,
             config=types.GenerateContentConfig(
                 temperature=0,
+                max_output_tokens=max_tokens,
             ),
         )
+        _record(response, "summarize")
 
         return response.text
 
+    def summarize_stream(self, source: str, max_tokens: int) -> Iterator[str]:
+        stream = self.client.models.generate_content_stream(
+            model=MODEL_NAME,
+            contents=summary_prompt(source, max_tokens),
+            config=types.GenerateContentConfig(
+                temperature=0,
+                max_output_tokens=max_tokens,
+            ),
+        )
+        last = None
+        try:
+            for chunk in stream:
+                last = chunk
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            # Closing stops the generation when the caller stops early
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            if last is not None:
+                _record(last, "summarize", streamed=True)
+
+    def extract_facts(self, source: str, max_tokens: int) -> List[Dict]:
+        response = self.client.models.generate_content(
+            model=MODEL_NAME,
+            contents=fact_extraction_prompt(source),
+            config=types.GenerateContentConfig(
+                temperature=0,
+                max_output_tokens=max_tokens,
+            ),
+        )
+        _record(response, "extract")
+
+        return decode_facts(response.text or "")
+
     def score_message(self, goal: str, message: str):
         prompt = f"""Rate message relevance to goal (0-10 scale):
 
@@ -107,14 +159,21 @@ class LLM(LLMProvider):
         goal: str,
         batch: List[Dict[str, str]],
         max_tokens: int,
+        output_format: str = "json",
+        use_logprobs: bool = False,
     ):
-        formatted_messages = ""
-        for i, msg in enumerate(batch, 1):
-            role = msg.get("role", "unknown").capitalize()
-            content = msg.get("content", "")
-            formatted_messages += f"{i}. [{role}] {content}\n"
-
-        prompt = f"""Rate message relevance to goal (0-10 scale):
+        if output_format == "digits":
+            try:
+                return await self._score_batch_digits_async(
+                    goal, batch, use_logprobs
+                )
+            except ValueError:
+                # Malformed digit string: score this batch the verbose way
+                pass
+
+        # Rubric and goal first: identical for every batch of a
+        # conversation, so the provider can serve them from its cache
+        prefix = f"""Rate message relevance to goal (0-10 scale):
 
         Goal: {goal}
 
@@ -125,8 +184,10 @@ class LLM(LLMProvider):
         0-2: Pure filler, greetings, "ok", "thanks" (= 1)
 
 
-        MESSAGES TO RATE:
-        {formatted_messages}
+        """
+
+        suffix = f"""MESSAGES TO RATE:
+        {format_batch(batch)}
 
         Return a JSON array with one score per message in order
         """
@@ -151,18 +212,255 @@ class LLM(LLMProvider):
             },
         }
 
-        response = await self.client.aio.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0,
-                response_mime_type="application/json",
-                response_schema=response_schema,
-                max_output_tokens=max_tokens,
-            ),
+        response = await self._generate(
+            prefix,
+            suffix,
+            temperature=0,
+            response_mime_type="application/json",
+            response_schema=response_schema,
+            max_output_tokens=max_tokens,
         )
 
+        _record(response, "score", format="json")
+
         scores_data = json.loads(response.text)
         scores = self._extract_scores_from_json(scores_data, len(batch))
 
         return scores
+
+    async def _score_batch_digits_async(
+        self, goal: str, batch: List[Dict[str, str]], use_logprobs: bool
+    ) -> List[float]:
+        """
+        Score a batch with the compact format: one digit per message.
+
+        Args:
+            goal: The goal to score against.
+            batch: The messages to score.
+            use_logprobs: Use the probability-weighted expected digit of each
+                          position instead of the sampled digit.
+
+        Returns:
+            List of scores on the 0-10 scale.
+
+        Raises:
+            ValueError: If the model's output can't be decoded.
+        """
+        response = await self._generate(
+            digit_scoring_prefix(goal),
+            digit_scoring_suffix(batch),
+            temperature=0,
+            max_output_tokens=len(batch) + 8,
+            response_logprobs=use_logprobs or None,
+            logprobs=5 if use_logprobs else None,
+        )
+        _record(response, "score", format="digits")
+
+        if use_logprobs:
+            scores = _expected_digit_scores(response, len(batch))
+            if scores is not None:
+                return scores
+
+        return decode_digit_scores(response.text or "", len(batch))
+
+    async def score_batch_multi_async(
+        self,
+        goals: List[str],
+        batch: List[Dict[str, str]],
+        max_tokens: int,
+    ) -> List[List[float]]:
+        formatted_goals = "\n".join(
+            f"{i}. {goal}" for i, goal in enumerate(goals, 1)
+        )
+
+        prefix = f"""Rate message relevance to EACH goal (0-10 scale):
+
+        Goals:
+        {formatted_goals}
+
+        Scoring guide (err on the LOW side):
+        9-10: ONLY critical facts/errors with specific details ("NullPointerException line 42" = 10)
+        6-8: Important context, questions, partial info ("Can you check?" = 7)
+        3-5: Minor details, acknowledgments ("I see" = 4)
+        0-2: Pure filler, greetings, "ok", "thanks" (= 1)
+
+
+        """
+
+        suffix = f"""MESSAGES TO RATE:
+        {format_batch(batch)}
+
+        Return a JSON array with one entry per message in order. Each entry
+        has one score per goal, in the order the goals are listed.
+        """
+
+        response_schema = {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "message_index": {
+                        "type": "integer",
+                        "description": "The message number (1-indexed)",
+                    },
+                    "scores": {
+                        "type": "array",
+                        "description": "Utility score from 0-10 per goal",
+                        "items": {
+                            "type": "number",
+                            "minimum": 0,
+                            "maximum": 10,
+                        },
+                    },
+                },
+                "required": ["message_index", "scores"],
+            },
+        }
+
+        response = await self._generate(
+            prefix,
+            suffix,
+            temperature=0,
+            response_mime_type="application/json",
+            response_schema=response_schema,
+            max_output_tokens=max_tokens,
+        )
+
+        _record(response, "score_multi")
+
+        vectors = {}
+        for item in json.loads(response.text):
+            idx = item.get("message_index")
+            if idx is not None:
+                vectors[idx] = item.get("scores", [])
+
+        return [
+            normalize_score_vector(vectors.get(i, []), len(goals))
+            for i in range(1, len(batch) + 1)
+        ]
+
+    async def _generate(self, prefix: str, suffix: str, **config):
+        """
+        Generate with a stable prefix and a per-call suffix.
+
+        The prefix is served from a Gemini cached content when the prompt
+        cache has (or can create) one for it. Otherwise the prompt is sent
+        whole, prefix first.
+
+        Args:
+            prefix: Instructions shared by many calls (rubric and goal).
+            suffix: The per-call part (the messages).
+            **config: GenerateContentConfig fields.
+
+        Returns:
+            The generate_content response.
+        """
+        cached = await self._cached_prefix(prefix)
+        if cached is not None:
+            name, key = cached
+            try:
+                return await self.client.aio.models.generate_content(
+                    model=MODEL_NAME,
+                    contents=suffix,
+                    config=types.GenerateContentConfig(
+                        cached_content=name, **config
+                    ),
+                )
+            except errors.ClientError as e:
+                if e.code not in (400, 403, 404):
+                    raise
+                # Expired or deleted early: forget it and send the prompt whole
+                self.prompt_cache.invalidate(key)
+
+        return await self.client.aio.models.generate_content(
+            model=MODEL_NAME,
+            contents=prefix + suffix,
+            config=types.GenerateContentConfig(**config),
+        )
+
+    async def _cached_prefix(self, prefix: str):
+        """
+        Name of a valid cached content holding prefix, creating it if needed.
+
+        Returns:
+            (name, key), or None if the prefix is not cached.
+        """
+        if self.prompt_cache is None:
+            return None
+
+        key = self.prompt_cache.key(MODEL_NAME, prefix)
+        name = self.prompt_cache.lookup(key)
+        if name is not None:
+            return name, key
+        if not self.prompt_cache.cacheable(key, prefix):
+            return None
+        # Concurrent batches send the prompt whole while one creates it
+        if not self.prompt_cache.claim(key):
+            return None
+
+        try:
+            cache = await self.client.aio.caches.create(
+                model=MODEL_NAME,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=prefix,
+                    ttl=f"{int(self.prompt_cache.ttl)}s",
+                ),
+            )
+            self.prompt_cache.store(key, cache.name)
+        except errors.APIError:
+            self.prompt_cache.fail(key)
+            return None
+        finally:
+            self.prompt_cache.release(key)
+        return cache.name, key
+
+
+def _record(response, operation: str, **extra):
+    """
+    Record the token usage reported on a Gemini response.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    record_usage(
+        "gemini",
+        operation,
+        getattr(usage, "prompt_token_count", None),
+        getattr(usage, "candidates_token_count", None),
+        cached_input_tokens=getattr(usage, "cached_content_token_count", None),
+        **extra,
+    )
+
+
+def _expected_digit_scores(
+    response, expected_count: int
+) -> Optional[List[float]]:
+    """
+    Expected score of each digit position from the top token logprobs.
+
+    Args:
+        response: Response of a digit scoring call made with logprobs.
+        expected_count: Number of messages that were scored.
+
+    Returns:
+        List of scores on the 0-10 scale, or None if the logprobs don't line
+        up with one digit token per message.
+    """
+    try:
+        positions = response.candidates[0].logprobs_result.top_candidates
+    except (AttributeError, IndexError, TypeError):
+        return None
+
+    scores = []
+    for position in positions or []:
+        digits = [
+            (int(c.token), math.exp(c.log_probability))
+            for c in position.candidates or []
+            if c.token
+            and len(c.token.strip()) == 1
+            and c.token.strip().isdigit()
+        ]
+        if not digits:
+            continue
+        total = sum(p for _, p in digits)
+        scores.append(digit_to_score(sum(d * p for d, p in digits) / total))
+
+    return scores if len(scores) == expected_count else None
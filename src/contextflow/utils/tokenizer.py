@@ -5,6 +5,23 @@ Token counting utilities
 from typing import List, Dict
 
 
+def content_length(message: Dict[str, str]) -> int:
+    """
+    Length of a message's content in characters.
+
+    Args:
+        message: Message dict {"role": "user", "content": "..."}
+
+    Returns:
+        Content length
+    """
+    # Stored messages know their length without paging in the content
+    length = getattr(message, "content_length", None)
+    if length is None:
+        length = len(message["content"])
+    return length
+
+
 def count_tokens(messages: List[Dict[str, str]]) -> int:
     """
     Count tokens in a list of messages
@@ -21,6 +38,6 @@ def count_tokens(messages: List[Dict[str, str]]) -> int:
     total = 0
 
     for message in messages:
-        total += len(message["content"])
+        total += content_length(message)
 
     return total // 4
@@ -0,0 +1,89 @@
+"""
+Per-call token usage recording
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Every list currently collecting usage, innermost last
+_calls: ContextVar[Tuple[List[Dict], ...]] = ContextVar(
+    "contextflow_usage", default=()
+)
+
+
+@contextmanager
+def track_usage() -> Iterator[List[Dict]]:
+    """
+    Collect the usage of every provider call made inside the block,
+    including calls made from tasks and threads started inside it.
+    Blocks can be nested; a call is recorded in every enclosing block.
+
+    Yields:
+        The list that usage records are appended to.
+    """
+    calls = []
+    token = _calls.set(_calls.get() + (calls,))
+    try:
+        yield calls
+    finally:
+        _calls.reset(token)
+
+
+def record_usage(
+    provider: str,
+    operation: str,
+    input_tokens: Optional[int],
+    output_tokens: Optional[int],
+    cached_input_tokens: Optional[int] = None,
+    **extra,
+):
+    """
+    Record the token usage of one provider call, if usage is being tracked.
+
+    Args:
+        provider: Name of the provider (e.g. "gemini").
+        operation: What the call did (e.g. "score", "summarize").
+        input_tokens: Prompt tokens reported by the provider, including
+                      cached ones.
+        output_tokens: Completion tokens reported by the provider.
+        cached_input_tokens: Prompt tokens served from the provider's
+                             prompt cache.
+        **extra: Additional fields to store with the record.
+    """
+    active = _calls.get()
+    if not active:
+        return
+    record = {
+        "provider": provider,
+        "operation": operation,
+        "input_tokens": input_tokens or 0,
+        "cached_input_tokens": cached_input_tokens or 0,
+        "output_tokens": output_tokens or 0,
+        **extra,
+    }
+    for calls in active:
+        calls.append(record)
+
+
+def usage_totals(calls: List[Dict]) -> Dict[str, int]:
+    """
+    Sum usage records.
+
+    Args:
+        calls: Records collected by track_usage.
+
+    Returns:
+        Dictionary with the number of "calls" and the total
+        "input_tokens", "cached_input_tokens", "uncached_input_tokens" and
+        "output_tokens".
+    """
+    input_tokens = sum(call["input_tokens"] for call in calls)
+    cached = sum(call["cached_input_tokens"] for call in calls)
+    return {
+        "calls": len(calls),
+        "input_tokens": input_tokens,
+        "cached_input_tokens": cached,
+        "uncached_input_tokens": input_tokens - cached,
+        "output_tokens": sum(call["output_tokens"] for call in calls),
+    }
@@ -0,0 +1,113 @@
+"""
+Compares the JSON and digit score formats on live providers.
+
+Needs GEMINI_API_KEY and/or ANTHROPIC_KEY. Run with:
+    python tests/score_format_benchmark.py gemini anthropic
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+from dotenv import load_dotenv
+from contextflow.utils.llm import LLMClient
+from contextflow.utils.usage import track_usage
+
+load_dotenv()
+
+ROUNDS = 5
+
+messages = [
+    {"role": "user", "content": "Hi there!"},
+    {"role": "assistant", "content": "Hello! How can I assist you today?"},
+    {
+        "role": "user",
+        "content": "I ordered a laptop last week but haven't received it yet.",
+    },
+    {
+        "role": "assistant",
+        "content": "I'm sorry for the delay. Can you share your order number?",
+    },
+    {"role": "user", "content": "Sure, it's #9988123."},
+    {
+        "role": "assistant",
+        "content": "Thank you. Let me check the order details.",
+    },
+    {
+        "role": "assistant",
+        "content": "The order shows shipped on November 5th via UPS.",
+    },
+    {
+        "role": "user",
+        "content": "But the tracking info hasn't updated since the 7th.",
+    },
+    {
+        "role": "assistant",
+        "content": "Can you confirm your shipping address to ensure there's no error?",
+    },
+    {"role": "user", "content": "It's 777 Market St, San Francisco, CA."},
+    {"role": "assistant", "content": "Thanks! That matches what we have."},
+    {"role": "assistant", "content": "I'm contacting UPS to get an update."},
+    {
+        "role": "user",
+        "content": "Yes, please. I need this laptop for work urgently.",
+    },
+    {"role": "assistant", "content": "Understood, I'll prioritize this case."},
+    {
+        "role": "assistant",
+        "content": "UPS says the package is delayed at their facility due to high volume.",
+    },
+    {
+        "role": "assistant",
+        "content": "Estimated delivery is Friday, November 12th.",
+    },
+    {"role": "user", "content": "Will I get a compensation if it's late?"},
+    {
+        "role": "assistant",
+        "content": "If it isn't delivered by the 12th, you'll be eligible for a partial refund.",
+    },
+    {
+        "role": "assistant",
+        "content": "Yes, the ticket number is #20241110-7854.",
+    },
+    {"role": "user", "content": "You too, bye!"},
+]
+
+goal = "Resolve customer shipping inquiry"
+
+
+async def run(client: LLMClient, output_format: str, use_logprobs: bool):
+    latencies = []
+    completion_tokens = []
+    for _ in range(ROUNDS):
+        with track_usage() as calls:
+            start = time.time()
+            await client.score_batch_async(
+                goal=goal,
+                batch=messages,
+                max_tokens=400,
+                output_format=output_format,
+                use_logprobs=use_logprobs,
+            )
+            latencies.append(time.time() - start)
+        completion_tokens.append(sum(c["output_tokens"] for c in calls))
+
+    label = output_format + (" + logprobs" if use_logprobs else "")
+    print(
+        f"{client.provider:>10} {label:<18}"
+        f" median {statistics.median(latencies) * 1000:7.0f} ms"
+        f"   completion tokens {statistics.mean(completion_tokens):6.1f}"
+    )
+
+
+async def benchmark(providers):
+    print(f"=== {len(messages)}-message batch, {ROUNDS} rounds ===")
+    for provider in providers:
+        client = LLMClient(provider)
+        await run(client, "json", False)
+        await run(client, "digits", False)
+        if provider == "gemini":
+            await run(client, "digits", True)
+
+
+asyncio.run(benchmark(sys.argv[1:] or ["gemini"]))
@@ -0,0 +1,135 @@
+from contextflow import ContextFlow
+from contextflow.core.boilerplate import (
+    BoilerplateCompactor,
+    BoilerplateLibrary,
+    fingerprint,
+)
+from contextflow.core.planner import Planner
+from contextflow.core.scorer import MessageScorer
+from contextflow.utils.providers import fake
+
+POLICY = (
+    "You are a support agent for Acme. Never share internal notes. "
+    "Refunds over 100 dollars need a manager. Always confirm the order "
+    "number before answering. Escalate legal threats to the legal team. "
+    "Keep answers short and polite, and sign off with the ticket number."
+)
+
+
+class EchoCompactor:
+    def __init__(self):
+        self.calls = []
+
+    def summarize(self, messages_to_summarize, max_token_count=500):
+        self.calls.append(messages_to_summarize)
+        return "summary"
+
+
+def test_rolling_fingerprint_matches_near_copies():
+    edited = POLICY.replace("Acme", "ACME Corp")
+    a, b = fingerprint(POLICY), fingerprint(edited)
+    assert len(a & b) / max(len(a), len(b)) > 0.6
+    assert not fingerprint(POLICY) & fingerprint("unrelated words " * 20)
+
+
+def test_registered_block_matches_exact_and_near_copies():
+    library = BoilerplateLibrary(threshold=0.6)
+    block = library.register(POLICY, score=2.0, replacement="Acme policy.")
+
+    assert library.match({"role": "system", "content": POLICY}) is block
+    spaced = {"role": "system", "content": POLICY.upper() + "  "}
+    assert library.match(spaced) is block
+    edited = {"role": "system", "content": POLICY.replace("short", "brief")}
+    assert library.match(edited) is block
+    assert library.match({"role": "user", "content": "Where is it?"}) is None
+
+
+def test_blocks_are_learned_across_conversations_not_turns():
+    library = BoilerplateLibrary(min_count=3)
+    system = {"role": "system", "content": POLICY}
+
+    # Many turns of one conversation count once
+    history = [system]
+    for turn in range(5):
+        history.append({"role": "user", "content": f"question {turn}"})
+        library.observe(history)
+    assert len(library) == 0
+
+    library.observe([system, {"role": "user", "content": "hello"}])
+    assert len(library) == 0
+    learned = library.observe([system, {"role": "user", "content": "hi"}])
+    assert len(learned) == 1
+    assert learned[0].score == library.learned_score
+    assert library.match(system) is learned[0]
+
+
+def test_scorer_skips_llm_for_boilerplate():
+    library = BoilerplateLibrary()
+    library.register(POLICY, score=1.0)
+    llm = fake.LLM(score=lambda m: 8.0)
+    scorer = MessageScorer(llm, boilerplate=library)
+
+    messages = [
+        {"role": "system", "content": POLICY},
+        {"role": "user", "content": "My order #12 is late."},
+    ]
+    scores = scorer.score_messages(messages, "order status")
+    assert scores[0] == 1.0 + 1.0  # recency bonus
+    assert llm.calls == 1
+
+
+def test_compactor_uses_replacements():
+    library = BoilerplateLibrary()
+    library.register(POLICY, score=5.0, replacement="Acme support policy.")
+    inner = EchoCompactor()
+    compactor = BoilerplateCompactor(inner, library)
+
+    user = {"role": "user", "content": "My order #12 is late."}
+    summary = compactor.summarize([{"role": "system", "content": POLICY}, user])
+    assert summary == "Acme support policy. summary"
+    assert inner.calls == [[user]]
+
+
+def test_replacements_are_fit_into_the_budget():
+    library = BoilerplateLibrary()
+    other = POLICY.replace("Acme", "Globex").replace("legal", "security")
+    for block in (POLICY, other):
+        library.register(block, score=5.0, replacement=block)
+    inner = EchoCompactor()
+    compactor = BoilerplateCompactor(inner, library)
+
+    messages = [
+        {"role": "system", "content": POLICY},
+        {"role": "system", "content": other},
+        {"role": "user", "content": "My order #12 is late."},
+    ]
+    summary = compactor.summarize(messages, 50)
+    assert len(summary) // 4 <= 50
+    assert summary.endswith(" summary")
+
+    # Too small a budget to share leaves everything to the wrapped compactor
+    assert compactor.summarize(messages, 2) == "summary"
+    assert inner.calls[-1] == messages
+
+
+def test_library_round_trips_and_plugs_into_contextflow(tmp_path):
+    library = BoilerplateLibrary()
+    library.register(POLICY, score=0.0, replacement="Acme policy.")
+    path = str(tmp_path / "library.json")
+    library.save(path)
+    loaded = BoilerplateLibrary.load(path)
+    assert len(loaded) == 1
+
+    llm = fake.LLM(score=lambda m: 6.0)
+    flow = ContextFlow(
+        scoring_model=llm,
+        summarizing_model=llm,
+        boilerplate=loaded,
+        planner=Planner(local_max_messages=0, trim_ratio=0.0),
+    )
+    messages = [{"role": "system", "content": POLICY}] + [
+        {"role": "user", "content": f"Order #{i} status update please."}
+        for i in range(40)
+    ]
+    result = flow.optimize(messages, "order status", max_token_count=200)
+    assert {"role": "system", "content": POLICY} not in result["messages"]
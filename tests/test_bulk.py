@@ -0,0 +1,165 @@
+import pytest
+import sqlite3
+
+from contextflow.core.bulk import BulkJobRunner
+from contextflow.utils.providers.fake import BatchServer
+from contextflow.utils.tokenizer import count_tokens
+
+
+def score(message):
+    content = message["content"]
+    if "order" in content:
+        return 9.0
+    if "thanks" in content.lower():
+        return 1.0
+    return 6.0
+
+
+def conversation(n):
+    messages = []
+    for i in range(n):
+        messages.append(
+            {"role": "user", "content": f"My order #{i} has not arrived yet."}
+        )
+        messages.append(
+            {"role": "assistant", "content": f"Checking shipment {i}. " * 20}
+        )
+        messages.append({"role": "user", "content": "Thanks!"})
+    return messages
+
+
+conversations = {
+    "a": conversation(12),
+    "b": conversation(8),
+    "c": conversation(3),
+}
+
+
+def test_job_batches_requests_across_conversations(tmp_path):
+    server = BatchServer(score=score, polls=1)
+    path = str(tmp_path / "jobs.db")
+    with BulkJobRunner(server, path, batch_size=10) as runner:
+        job = runner.create_job(conversations, "Find the order", 1000)
+        results = runner.run(job, poll_interval=0)
+
+    assert list(results) == ["a", "b", "c"]
+    for conv_id, optimized in results.items():
+        assert count_tokens(optimized) <= 1000
+        assert optimized[-1] == conversations[conv_id][-1]
+
+    # One scoring submission covering every conversation, then one for the
+    # summaries
+    assert len(server.batches) == 2
+    scoring = server.batches["batch_1"]["requests"]
+    assert len(scoring) == 4 + 3 + 1
+    summaries = [m for m in results["a"] if m["role"] == "system"]
+    assert summaries[0]["content"].startswith("Summary of earlier context:")
+
+
+def test_job_survives_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    server = BatchServer(score=score, polls=2)
+
+    runner = BulkJobRunner(server, path)
+    job = runner.create_job(conversations, "Find the order", 300)
+    assert runner.step(job) == "scoring"
+    runner.close()
+
+    # A new runner resumes polling the batch that was already submitted
+    runner = BulkJobRunner(server, path)
+    assert runner.progress(job)["batches"] == {"pending": 1}
+    results = runner.run(job, poll_interval=0)
+    runner.close()
+
+    assert set(results) == {"a", "b", "c"}
+    assert len(server.batches) == 2
+
+    with BulkJobRunner(server, path) as runner:
+        assert runner.results(job) == results
+
+
+def test_failed_batches_are_resubmitted(tmp_path):
+    server = BatchServer(score=score, polls=0, failures=1)
+    with BulkJobRunner(server, str(tmp_path / "jobs.db")) as runner:
+        job = runner.create_job({"a": conversation(4)}, "Find the order", 200)
+        runner.run(job, poll_interval=0)
+        assert runner.progress(job)["batches"]["failed"] == 1
+
+    retried = server.batches["batch_2"]["requests"]
+    assert [r["custom_id"] for r in retried] == [
+        r["custom_id"] for r in server.batches["batch_1"]["requests"]
+    ]
+
+
+def test_exhausted_requests_fall_back_to_heuristics(tmp_path):
+    server = BatchServer(score=score, polls=0, failures=100)
+    with BulkJobRunner(
+        server, str(tmp_path / "jobs.db"), max_attempts=2
+    ) as runner:
+        job = runner.create_job({"a": conversation(4)}, "Find the order", 200)
+        results = runner.run(job, poll_interval=0)
+
+    assert count_tokens(results["a"]) <= 200
+
+
+def test_results_before_done_and_unknown_strategy(tmp_path):
+    server = BatchServer(polls=5)
+    with BulkJobRunner(server, str(tmp_path / "jobs.db")) as runner:
+        job = runner.create_job({"a": conversation(2)}, "goal")
+        runner.step(job)
+        with pytest.raises(ValueError):
+            runner.results(job)
+        with pytest.raises(TimeoutError):
+            runner.run(job, poll_interval=0, timeout=0)
+        with pytest.raises(ValueError):
+            runner.create_job({"a": conversation(2)}, "goal", strategy="nope")
+
+
+class CrashingServer(BatchServer):
+    """Dies in the middle of its first submission."""
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+        self.recorded = None
+
+    def submit(self, requests):
+        with sqlite3.connect(self.path) as db:
+            self.recorded = db.execute("SELECT status FROM batches").fetchall()
+        if self.recorded == [("submitting",)]:
+            raise SystemExit("crash")
+        return super().submit(requests)
+
+
+def test_batch_is_recorded_before_it_is_submitted(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    server = CrashingServer(path, score=score, polls=0)
+    runner = BulkJobRunner(server, path)
+    job = runner.create_job({"a": conversation(4)}, "Find the order", 200)
+    with pytest.raises(SystemExit):
+        runner.step(job)
+    runner.close()
+
+    # A new runner gives up on the interrupted submission and resubmits
+    with BulkJobRunner(server, path) as runner:
+        runner.run(job, poll_interval=0)
+        progress = runner.progress(job)
+    assert progress["batches"] == {"abandoned": 1, "done": 2}
+    assert progress["errors"] == []
+
+
+class GarbledServer(BatchServer):
+    def _answer(self, request):
+        return "no digits here"
+
+
+def test_unusable_scores_are_reported_as_job_errors(tmp_path):
+    with BulkJobRunner(
+        GarbledServer(polls=0), str(tmp_path / "j.db")
+    ) as runner:
+        job = runner.create_job({"a": conversation(4)}, "Find the order", 200)
+        runner.run(job, poll_interval=0)
+        errors = runner.progress(job)["errors"]
+
+    assert [error["kind"] for error in errors] == ["score"]
+    assert errors[0]["error"].startswith("unusable output")
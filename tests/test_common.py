@@ -0,0 +1,11 @@
+from contextflow.utils.common import format_messages, moving_average
+
+
+def test_moving_average_starts_at_the_first_observation():
+    assert moving_average(None, 2.0) == 2.0
+    assert moving_average(1.0, 2.0) == 0.7 * 1.0 + 0.3 * 2.0
+
+
+def test_format_messages_labels_roles():
+    messages = [{"role": "user", "content": "hi"}, {"content": "?"}]
+    assert format_messages(messages) == "User: hi\nUnknown: ?"
@@ -0,0 +1,133 @@
+import asyncio
+import random
+import time
+
+from contextflow import ContextFlow
+from contextflow.core.deadline import Deadline, DeadlineCompactor
+from contextflow.core.scorer import MessageScorer
+from contextflow.utils.providers import fake
+
+
+class SlowLLM:
+    def __init__(self, delays):
+        self.delays = list(delays)
+
+    async def score_batch_async(self, goal, batch, max_tokens):
+        await asyncio.sleep(self.delays.pop(0))
+        return [9.0] * len(batch)
+
+
+class SlowCompactor:
+    def __init__(self, delay, expected_latency=None):
+        self.delay = delay
+        self.expected_latency = expected_latency
+
+    def summarize(self, messages_to_summarize, max_token_count=500):
+        time.sleep(self.delay)
+        return "llm summary"
+
+
+messages = [
+    {"role": "user", "content": f"Order #{i} shipping error"} for i in range(30)
+]
+
+
+def test_late_batches_fall_back_to_heuristics():
+    scorer = MessageScorer(model=SlowLLM([0.0, 1.0]))
+    degradations = []
+
+    started = time.monotonic()
+    scores = scorer.score_messages(
+        messages, "shipping", Deadline(100), degradations
+    )
+
+    assert time.monotonic() - started < 0.5
+    assert scores[0] == 9.0  # first batch made it
+    assert scores[20] != 9.0  # second batch is heuristic
+    assert degradations == [
+        {
+            "stage": "scoring",
+            "fallback": "heuristic",
+            "reason": "timed out",
+            "messages": 10,
+        }
+    ]
+    # Heuristic scores are not cached as if they came from the LLM
+    assert scorer.cache.get("shipping", messages[20:21]) == [None]
+
+
+def test_slow_summary_is_replaced_by_extraction():
+    degradations = []
+    compactor = DeadlineCompactor(
+        SlowCompactor(delay=1.0), Deadline(50), degradations
+    )
+
+    started = time.monotonic()
+    summary = compactor.summarize(messages[:5], 50)
+
+    assert time.monotonic() - started < 0.5
+    assert summary != "llm summary" and "#0" in summary
+    assert degradations[0]["fallback"] == "extractive"
+
+
+def test_predicted_miss_and_expired_deadline():
+    degradations = []
+    predicted = DeadlineCompactor(
+        SlowCompactor(delay=0, expected_latency=5.0),
+        Deadline(1000),
+        degradations,
+    )
+    assert predicted.summarize(messages[:5], 50) != "llm summary"
+
+    expired = DeadlineCompactor(
+        SlowCompactor(delay=0), Deadline(0), degradations
+    )
+    assert len(expired.summarize(messages[:5], 5)) <= 20
+
+    assert [d["fallback"] for d in degradations] == ["extractive", "truncated"]
+
+
+def test_slow_fallback_is_replaced_by_truncation():
+    degradations = []
+    compactor = DeadlineCompactor(
+        SlowCompactor(delay=1.0),
+        Deadline(100),
+        degradations,
+        fallback=SlowCompactor(delay=1.0, expected_latency=0.05),
+    )
+
+    started = time.monotonic()
+    summary = compactor.summarize(messages[:5], 5)
+
+    assert time.monotonic() - started < 0.15
+    assert summary == "Order #0 shipping er"
+    assert degradations[0]["fallback"] == "truncated"
+
+
+def long_conversation(count, seed=0):
+    rng = random.Random(seed)
+    words = "refund order shipping invoice card error payment ticket".split()
+    return [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": " ".join(
+                " ".join(rng.choice(words) for _ in range(8))
+                + f" {rng.randint(0, 9999)}."
+                for _ in range(20)
+            ),
+        }
+        for i in range(count)
+    ]
+
+
+def test_optimize_returns_within_the_deadline():
+    llm = fake.LLM(latency=fake.fixed_latency(0.05))
+    flow = ContextFlow(scoring_model=llm, summarizing_model=llm)
+    conversation = long_conversation(200)
+
+    for _ in range(3):
+        started = time.monotonic()
+        flow.optimize(
+            conversation, "refund status", max_token_count=300, deadline_ms=100
+        )
+        assert (time.monotonic() - started) * 1000 <= 100 + 50
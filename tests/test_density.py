@@ -0,0 +1,78 @@
+from contextflow import ContextFlow
+from contextflow.core.density import DensityAnnotator
+from contextflow.core.heuristic import (
+    goal_terms,
+    heuristic_score,
+    heuristic_scores,
+)
+from contextflow.core.index import Prefilter
+from contextflow.core.scorer import MessageScorer
+
+MESSAGES = [
+    {"role": "user", "content": "Thanks!"},
+    {"role": "user", "content": "We decided to refund order #4411 today."},
+    {"role": "assistant", "content": "Error: timeout talking to Stripe."},
+    {"role": "user", "content": "How is the weather over there?"},
+]
+
+
+def test_annotation_score_matches_heuristic():
+    annotator = DensityAnnotator()
+    terms = goal_terms("refund the order")
+
+    for message in MESSAGES:
+        assert annotator.annotation(message).score(terms) == heuristic_score(
+            message["content"], terms
+        )
+
+
+def test_density_ranks_information_over_filler():
+    densities = DensityAnnotator().densities(MESSAGES)
+
+    assert densities[0] == 1.0
+    assert densities[1] > densities[3]
+    assert densities[2] > densities[3]
+
+
+def test_observe_annotates_in_background_once():
+    annotator = DensityAnnotator()
+    annotator.observe(MESSAGES).result(timeout=5)
+    annotator.observe(MESSAGES + MESSAGES).result(timeout=5)
+
+    assert len(annotator) == len(MESSAGES)
+    assert annotator.get(MESSAGES[1]).features["decisions"] == 1
+
+
+def test_heuristic_scores_use_annotations():
+    annotator = DensityAnnotator()
+    goal = "refund status"
+
+    assert heuristic_scores(MESSAGES, goal, annotator) == heuristic_scores(
+        MESSAGES, goal
+    )
+    assert len(annotator) == len(MESSAGES)
+
+
+class FlatLLM:
+    async def score_batch_async(self, goal, batch, max_tokens):
+        return [5.0] * len(batch)
+
+
+def test_prefilter_skipped_messages_get_density_scores():
+    annotator = DensityAnnotator()
+    scorer = MessageScorer(
+        model=FlatLLM(),
+        prefilter=Prefilter(top_k=0, recent=1),
+        annotator=annotator,
+    )
+
+    scores = scorer.score_messages(MESSAGES, "unrelated goal")
+
+    assert scores[0] < scores[2]
+
+
+def test_context_flow_observe_fills_annotator():
+    cf = ContextFlow(scoring_model=FlatLLM(), summarizing_model=FlatLLM())
+    cf.observe(MESSAGES).result(timeout=5)
+
+    assert len(cf.annotator) == len(MESSAGES)
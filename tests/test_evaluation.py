@@ -0,0 +1,97 @@
+from contextflow.evaluation.harness import (
+    EvaluationHarness,
+    build_report,
+    compare_reports,
+    contains_answer,
+    default_scorers,
+    load_report,
+    pareto_frontier,
+    save_report,
+)
+from contextflow.evaluation.needles import make_needle_case, make_needle_cases
+from contextflow.utils.tokenizer import count_tokens
+
+
+def row(retention, saved, calls, latency=0.0, tokenizer="heuristic"):
+    return {
+        "strategy": "balanced",
+        "scorer": f"{retention}-{saved}-{calls}",
+        "max_token_count": 200,
+        "tokenizer": tokenizer,
+        "retention": retention,
+        "tokens_saved": saved,
+        "llm_calls": calls,
+        "latency_ms": latency,
+    }
+
+
+def test_needle_cases_are_reproducible_and_answerable():
+    case = make_needle_case(40, needles=3, seed=7)
+    assert case == make_needle_case(40, needles=3, seed=7)
+    assert len(case["facts"]) == 3
+    for fact in case["facts"]:
+        assert fact["question"] in case["goal"]
+        assert contains_answer(
+            fact["question"], fact["answer"], [case["messages"][fact["index"]]]
+        )
+
+
+def words(messages):
+    return sum(len(m["content"].split()) for m in messages)
+
+
+def test_harness_reports_retention_and_cost_per_configuration():
+    cases = make_needle_cases(3, length=40)
+    harness = EvaluationHarness(
+        cases,
+        strategies=["balanced"],
+        budgets=[150],
+        tokenizers={"heuristic": count_tokens, "words": words},
+    )
+
+    rows = {(r["scorer"], r["tokenizer"]): r for r in harness.run()}
+
+    assert len(rows) == 6
+    assert rows[("oracle", "heuristic")]["retention"] == 1.0
+    assert rows[("heuristic", "heuristic")]["llm_calls"] == 0
+    assert rows[("fake-llm", "heuristic")]["llm_calls"] > 0
+    assert rows[("oracle", "words")]["tokens_saved"] > 0
+
+
+def test_pluggable_judge_decides_retention():
+    harness = EvaluationHarness(
+        make_needle_cases(2, length=30),
+        strategies=["conservative"],
+        scorers={"oracle": default_scorers()["oracle"]},
+        judge=lambda question, answer, messages: False,
+    )
+    (result,) = harness.run()
+    assert result["retention"] == 0.0
+
+
+def test_pareto_frontier_drops_dominated_rows():
+    best = row(1.0, 300, 2)
+    cheap = row(0.5, 300, 0)
+    dominated = row(0.5, 200, 2)
+    # Within the latency tolerance, timing noise dominates nothing
+    noisy = row(1.0, 300, 2, latency=0.5)
+    other_tokenizer = row(0.1, 10, 9, tokenizer="words")
+
+    frontier = pareto_frontier([best, cheap, dominated, noisy, other_tokenizer])
+    assert frontier == [best, cheap, noisy, other_tokenizer]
+
+
+def test_reports_round_trip_and_compare(tmp_path):
+    report = build_report([row(0.5, 300, 0), row(1.0, 100, 2)], label="v1")
+    assert [r["retention"] for r in report["rows"]] == [1.0, 0.5]
+    assert len(report["frontier"]) == 2
+
+    path = str(tmp_path / "report.json")
+    save_report(report, path)
+    baseline = load_report(path)
+
+    current = build_report([row(0.5, 300, 0)], label="v2")
+    current["rows"][0]["retention"] = 0.25
+    (change,) = compare_reports(baseline, current)
+    assert change["retention"] == -0.25
+    assert change["llm_calls"] == 0
@@ -0,0 +1,72 @@
+from contextflow.core.excerpt import SEPARATOR, ExcerptPolicy
+from contextflow.core.scorer import MessageScorer
+
+
+def make_log(lines: int, needle: str = "") -> str:
+    body = [f"INFO worker {i} heartbeat ok" for i in range(lines)]
+    if needle:
+        body[lines // 2] = needle
+    return "\n".join(body)
+
+
+def test_short_messages_are_untouched():
+    policy = ExcerptPolicy(max_tokens=50)
+    messages = [{"role": "user", "content": "short"}]
+
+    assert policy.apply(messages, "goal")[0] is messages[0]
+
+
+def test_excerpt_respects_cap_and_keeps_head_and_tail():
+    policy = ExcerptPolicy(max_tokens=100, head_tokens=20, tail_tokens=20)
+    content = make_log(500)
+
+    excerpt = policy.excerpt(content, set())
+
+    assert len(excerpt) <= 100 * 4
+    assert excerpt.startswith(content[:40])
+    assert excerpt.endswith(content[-40:])
+    assert SEPARATOR in excerpt
+
+
+def test_excerpt_includes_snippet_around_goal_term():
+    policy = ExcerptPolicy(max_tokens=100, head_tokens=20, tail_tokens=20)
+    content = make_log(500, needle="ERROR payment gateway refused card")
+
+    excerpt = policy.excerpt(content, {"payment", "gateway"})
+
+    assert "payment gateway" in excerpt
+    assert len(excerpt) <= 100 * 4
+
+
+def test_disabled_policy_returns_content():
+    policy = ExcerptPolicy(max_tokens=None)
+    content = make_log(500)
+
+    assert policy.excerpt(content, {"worker"}) == content
+
+
+class RecordingLLM:
+    def __init__(self):
+        self.batches = []
+
+    async def score_batch_async(self, goal, batch, max_tokens):
+        self.batches.append(batch)
+        return [5.0] * len(batch)
+
+
+def test_scorer_sends_excerpts_but_caches_full_messages():
+    llm = RecordingLLM()
+    scorer = MessageScorer(model=llm, excerpt=ExcerptPolicy(max_tokens=64))
+    messages = [
+        {"role": "user", "content": make_log(1000)},
+        {"role": "assistant", "content": "done"},
+    ]
+
+    scorer.score_messages(messages, "worker heartbeat")
+
+    sent = llm.batches[0]
+    assert len(sent[0]["content"]) <= 64 * 4
+    assert sent[1] is messages[1]
+    # The cache is keyed by the full content, so a second pass is free
+    scorer.score_messages(messages, "worker heartbeat")
+    assert len(llm.batches) == 1
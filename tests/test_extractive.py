@@ -0,0 +1,56 @@
+from contextflow.core.extractive import ExtractiveCompactor
+
+messages = [
+    {"role": "user", "content": "Hi there! I ordered a laptop last week."},
+    {"role": "assistant", "content": "Sure. Can you share your order number?"},
+    {"role": "user", "content": "Okay. It's #9988123, placed on Nov 1."},
+    {
+        "role": "assistant",
+        "content": "Thanks! Error: carrier API timeout at line 42. "
+        "I will retry shortly. Nothing else to report.",
+    },
+    {"role": "user", "content": "Thank you!"},
+]
+
+
+def test_keeps_ids_and_errors_within_budget():
+    summary = ExtractiveCompactor().summarize(messages, max_token_count=25)
+
+    assert len(summary) <= 25 * 4
+    assert "#9988123" in summary
+    assert "Error: carrier API timeout at line 42." in summary
+    assert "Thank you" not in summary
+
+
+def test_preserves_original_order():
+    summary = ExtractiveCompactor().summarize(messages, max_token_count=500)
+    assert summary.index("laptop") < summary.index("#9988123")
+    assert summary.index("#9988123") < summary.index("Error")
+
+
+def test_empty_inputs():
+    assert ExtractiveCompactor().summarize([], 100) == ""
+    assert ExtractiveCompactor().summarize(messages, 0) == ""
+
+
+def test_ranks_at_most_max_sentences_and_measures_latency():
+    compactor = ExtractiveCompactor(max_sentences=50)
+    ranked = []
+    rank = compactor._rank
+
+    def counting_rank(sentences, boosts):
+        ranked.append(len(sentences))
+        return rank(sentences, boosts)
+
+    compactor._rank = counting_rank
+    many = [
+        {"role": "user", "content": f"Order {i} shipped to Oslo. Thanks!"}
+        for i in range(500)
+    ]
+
+    summary = compactor.summarize(many, max_token_count=50)
+
+    assert ranked == [50]
+    assert "Thanks" not in summary
+    assert len(summary) <= 50 * 4
+    assert compactor.expected_latency is not None
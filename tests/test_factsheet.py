@@ -0,0 +1,137 @@
+from contextflow import ContextFlow
+from contextflow.core.factsheet import FactSheet, FactSheetCompactor
+from contextflow.core.planner import Planner
+from contextflow.utils.providers import fake
+from contextflow.utils.providers.base import decode_facts
+from contextflow.utils.usage import track_usage, usage_totals
+
+
+def history(start, end):
+    messages = []
+    for i in range(start, end):
+        messages.append(
+            {"role": "user", "content": f"Where is order #{1000 + i}?"}
+        )
+        messages.append(
+            {
+                "role": "assistant",
+                "content": f"We confirmed order #{1000 + i} ships Monday.",
+            }
+        )
+    return messages
+
+
+def test_decode_facts_skips_malformed_lines():
+    text = """id | #123 | refunded $40
+    - decision | refund | approved by Bob
+    note | x | y
+    issue | missing field
+    none"""
+    assert decode_facts(text) == [
+        {"category": "id", "key": "#123", "value": "refunded $40"},
+        {"category": "decision", "key": "refund", "value": "approved by Bob"},
+    ]
+
+
+def test_only_new_messages_are_extracted():
+    llm = fake.LLM()
+    compactor = FactSheetCompactor(llm, batch_size=4)
+
+    first = history(0, 4)
+    with track_usage() as calls:
+        compactor.summarize(first, 200)
+    assert llm.calls == 2
+    first_input = usage_totals(calls)["input_tokens"]
+
+    # The next turn repeats the history and adds two messages
+    with track_usage() as calls:
+        summary = compactor.summarize(first + history(4, 5), 200)
+    assert llm.calls == 3
+    assert usage_totals(calls)["input_tokens"] < first_input
+    assert "#1004" in summary
+
+
+def test_facts_are_deduplicated_by_key():
+    sheet = FactSheet()
+    sheet.merge([{"category": "id", "key": "#7", "value": "pending"}], ["a"])
+    sheet.merge([{"category": "id", "key": "#7 ", "value": "shipped"}], ["b"])
+
+    assert len(sheet) == 1
+    assert sheet.render(100) == "IDs: #7 : shipped"
+    assert sheet.render(100, sources={"a"}) == "IDs: #7 : shipped"
+    assert sheet.render(100, sources={"c"}) == ""
+
+
+def test_render_keeps_decisions_first_within_budget():
+    sheet = FactSheet()
+    sheet.merge(
+        [
+            {"category": "entity", "key": "Alice", "value": "customer " * 10},
+            {"category": "decision", "key": "refund", "value": "approved"},
+        ],
+        ["a"],
+    )
+    text = sheet.render(10)
+    assert text == "Decisions: refund: approved"
+    assert len(text) // 4 <= 10
+    assert "Entities" in sheet.render(100)
+
+
+def test_failed_extraction_falls_back_and_is_retried():
+    llm = fake.LLM(failure_rate=1.0)
+    compactor = FactSheetCompactor(llm)
+    messages = history(0, 2)
+
+    summary = compactor.summarize(messages, 200)
+    assert summary
+    assert len(compactor.sheet) == 0
+
+    llm.failure_rate = 0.0
+    compactor.summarize(messages, 200)
+    assert len(compactor.sheet) > 0
+
+
+def test_contextflow_factsheet_compaction():
+    llm = fake.LLM(score=lambda m: 6.0)
+    flow = ContextFlow(
+        scoring_model=llm,
+        summarizing_model=llm,
+        compaction="factsheet",
+        planner=Planner(local_max_messages=0, trim_ratio=0.0),
+    )
+    result = flow.optimize(history(0, 40), "order status", 300)
+
+    summary = result["messages"][0]["content"]
+    assert summary.startswith("Summary of earlier context: Decisions:")
+    assert result["analytics"]["tokens_after"] <= 300
+
+
+def test_messages_without_facts_are_summarized_extractively():
+    compactor = FactSheetCompactor(fake.LLM())
+    messages = [
+        {"role": "assistant", "content": "We confirmed order #1000 ships."},
+        {"role": "user", "content": "I refunded you fifty dollars yesterday."},
+    ]
+
+    summary = compactor.summarize(messages, 200)
+
+    assert "#1000" in summary
+    assert "refunded you fifty dollars" in summary
+
+
+def test_facts_are_attributed_to_the_messages_that_state_them():
+    compactor = FactSheetCompactor(fake.LLM(), batch_size=10)
+    first, second = history(0, 1), history(1, 2)
+    compactor.summarize(first + second, 200)
+
+    summary = compactor.summarize(second, 200)
+
+    assert "#1001" in summary
+    assert "#1000" not in summary
+
+
+def test_single_message_fits_the_budget():
+    compactor = FactSheetCompactor(fake.LLM())
+    message = {"role": "user", "content": "A long sentence here. " * 100}
+
+    assert len(compactor.summarize([message], 10)) <= 10 * 4
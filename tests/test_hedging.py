@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import pytest
+
+from contextflow.utils.hedging import CircuitBreaker, HedgedLLMClient
+from contextflow.utils.llm import resolve_client
+from contextflow.utils.providers import fake
+from contextflow.utils.providers.fake import fixed_latency, lognormal_latency
+
+batch = [{"role": "user", "content": "order #1"}]
+
+
+def score(client):
+    return asyncio.run(client.score_batch_async("goal", batch, 100))
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    slow = fake.LLM(latency=fixed_latency(1.0), score=lambda m: 1.0)
+    fast = fake.LLM(latency=fixed_latency(0.01), score=lambda m: 9.0)
+    client = HedgedLLMClient([slow, fast], default_hedge_after=0.05)
+
+    started = time.monotonic()
+    assert score(client) == [9.0]
+    assert time.monotonic() - started < 0.5
+    assert client.hedges == 1
+
+
+def test_hedge_threshold_follows_p95():
+    primary = fake.LLM(latency=lognormal_latency(0.01, sigma=0.3, seed=1))
+    backup = fake.LLM()
+    client = HedgedLLMClient([primary, backup], min_samples=20)
+
+    for _ in range(40):
+        score(client)
+
+    # Only the slowest few percent of requests get a hedge
+    assert client.hedges <= 5
+    threshold = client.trackers[0].threshold()
+    assert 0.005 < threshold < 0.1
+
+
+def test_failover_and_circuit_breaker():
+    broken = fake.LLM(failure_rate=1.0)
+    healthy = fake.LLM(score=lambda m: 7.0)
+    client = HedgedLLMClient([broken, healthy], failure_threshold=2)
+
+    for _ in range(5):
+        assert score(client) == [7.0]
+
+    assert broken.calls == 2  # skipped once the breaker opened
+    assert not client.breakers[0].allows()
+    assert client.summarize_text("some text", 10) == "some text"
+
+
+def test_all_providers_failing_raises():
+    client = HedgedLLMClient([fake.LLM(failure_rate=1.0)])
+    with pytest.raises(RuntimeError):
+        score(client)
+
+
+def test_breaker_half_opens_after_cooldown():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.0)
+    breaker.record_failure()
+    assert breaker.allows()
+    breaker.record_success()
+    assert breaker.failures == 0
+
+
+def test_half_open_breaker_allows_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    assert not breaker.allows()
+
+    time.sleep(0.06)
+    assert breaker.allows()
+    assert not breaker.allows()
+
+    # A failed probe opens the breaker for another cooldown
+    breaker.record_failure()
+    assert not breaker.allows()
+    time.sleep(0.06)
+    assert breaker.allows()
+    breaker.record_success()
+    assert breaker.allows() and breaker.allows()
+
+
+def test_resolve_client_builds_hedged_client():
+    client = resolve_client(["fake", "fake"])
+    assert isinstance(client, HedgedLLMClient)
+    assert score(client) == [5.0]
@@ -0,0 +1,132 @@
+from contextflow.core.heuristic import tokenize
+from contextflow.core.index import MessageIndex, Prefilter
+from contextflow.core.scorer import MessageScorer
+
+
+def chat(count):
+    return [
+        {"role": "user", "content": f"small talk about the weather {i}"}
+        for i in range(count)
+    ]
+
+
+def test_search_ranks_matching_messages():
+    index = MessageIndex()
+    index.extend(
+        [
+            {"role": "user", "content": "refund for order 7781 is pending"},
+            {"role": "user", "content": "the weather is nice"},
+            {"role": "user", "content": "refund refund refund approved"},
+        ]
+    )
+
+    scores = index.search("refund status")
+
+    assert len(scores) == 2
+    assert index.search("nothing matches") == {}
+
+
+def test_messages_are_indexed_once_across_turns():
+    index = MessageIndex()
+    messages = chat(5)
+    index.extend(messages)
+    index.extend(messages + chat(6)[5:])
+
+    assert len(index) == 6
+
+
+def test_shortlist_is_top_matches_plus_recent():
+    messages = chat(50)
+    messages[3] = {"role": "user", "content": "invoice INV-9 was charged twice"}
+    prefilter = Prefilter(top_k=1, recent=5)
+
+    shortlist = prefilter.shortlist(messages, "duplicate invoice charge")
+
+    assert shortlist == {3, 45, 46, 47, 48, 49}
+
+
+class CountingLLM:
+    def __init__(self):
+        self.scored = 0
+
+    async def score_batch_async(self, goal, batch, max_tokens):
+        self.scored += len(batch)
+        return [9.0] * len(batch)
+
+
+def test_scorer_only_sends_shortlist_to_llm():
+    llm = CountingLLM()
+    prefilter = Prefilter(top_k=2, recent=3, default_score=3.0)
+    scorer = MessageScorer(model=llm, prefilter=prefilter)
+    messages = chat(30)
+    messages[0] = {"role": "user", "content": "the invoice total is wrong"}
+
+    scores = scorer.score_messages(messages, "invoice")
+
+    assert llm.scored == 4
+    assert scores[0] == 9.0
+    assert scores[10] == 3.0
+
+
+def test_shortlist_only_indexes_new_messages(monkeypatch):
+    import contextflow.core.index as index_module
+
+    indexed = []
+
+    def counting_tokenize(text):
+        indexed.append(text)
+        return tokenize(text)
+
+    monkeypatch.setattr(index_module, "tokenize", counting_tokenize)
+    prefilter = Prefilter(top_k=1, recent=1)
+    messages = chat(40)
+    prefilter.shortlist(messages, "weather")
+    indexed.clear()
+
+    prefilter.shortlist(messages + chat(42)[40:], "weather")
+
+    # The two new messages and the goal
+    assert len(indexed) == 2 + 1
+
+
+def test_conversations_have_their_own_bounded_indices():
+    prefilter = Prefilter(top_k=1, recent=1, max_conversations=2)
+    first = [{"role": "user", "content": "refund for order 7781"}] + chat(5)
+    second = [{"role": "user", "content": "shipping to Oslo"}] + chat(5)
+
+    assert len(prefilter.index(first)) == 6
+    assert len(prefilter.index(second)) == 6
+    assert prefilter.index(second).search("refund") == {}
+
+    # Edited history is indexed again
+    edited = second[:4] + [{"role": "user", "content": "cancelled"}]
+    index = prefilter.index(edited)
+    assert len(index) == 5
+    assert index.search("cancelled")
+    assert len(prefilter) == 2
+
+    third = [{"role": "user", "content": "password reset"}] + chat(5)
+    prefilter.index(third)
+    assert len(prefilter) == 2
+
+
+def test_shared_openings_and_earlier_edits_get_their_own_index():
+    prefilter = Prefilter(top_k=1, recent=1)
+    opening = [
+        {"role": "system", "content": "You are a support agent."},
+        {"role": "assistant", "content": "Hi! How can I help?"},
+        {"role": "user", "content": "I have a question."},
+    ]
+    refund = opening + [{"role": "user", "content": "refund order 7781"}]
+    oslo = opening + [{"role": "user", "content": "shipping to Oslo"}]
+
+    prefilter.index(refund)
+    assert prefilter.index(oslo).search("refund") == {}
+    assert len(prefilter) == 2
+    assert len(prefilter.index(refund + chat(1))) == 5
+
+    # An edit before the last indexed message is not missed
+    edited = refund[:3] + [{"role": "user", "content": "cancel order 7781"}]
+    index = prefilter.index(edited + chat(1))
+    assert index.search("cancel")
+    assert not index.search("refund")
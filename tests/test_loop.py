@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import pytest
+
+from contextflow import ContextFlow
+from contextflow.core.planner import Planner
+from contextflow.server.loadgen import make_conversation
+from contextflow.utils.loop import background_loop, run_sync
+from contextflow.utils.providers import fake
+
+
+def make_flow():
+    llm = fake.LLM(latency=fake.fixed_latency(0.01))
+    return ContextFlow(
+        scoring_model=llm,
+        summarizing_model=llm,
+        planner=Planner(local_max_messages=0, trim_ratio=0.0),
+    )
+
+
+def loop_threads():
+    return [t for t in threading.enumerate() if t.name == "contextflow-loop"]
+
+
+def test_one_shared_instance_serves_many_threads():
+    flow = make_flow()
+    conversations = [make_conversation(40, seed=i) for i in range(16)]
+
+    def optimize(messages):
+        return flow.optimize(messages, "refund status", max_token_count=150)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(optimize, conversations))
+
+    for result in results:
+        assert result["analytics"]["plan"] == "full"
+        assert result["analytics"]["tokens_after"] <= 150
+        # Usage is tracked per call, even though scoring ran on the loop
+        assert result["analytics"]["llm_usage"]["calls"] >= 2
+    assert len(loop_threads()) == 1
+
+
+def test_sync_api_works_inside_a_running_loop():
+    flow = make_flow()
+    messages = make_conversation(30, seed=3)
+
+    async def handler():
+        return flow.optimize(messages, "refund status", max_token_count=100)
+
+    result = asyncio.run(handler())
+    assert result["analytics"]["tokens_after"] <= 100
+
+
+def test_run_sync_reuses_the_loop_and_times_out():
+    async def which_loop():
+        return asyncio.get_running_loop()
+
+    assert run_sync(which_loop()) is background_loop()
+    assert run_sync(which_loop()) is background_loop()
+
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(TimeoutError):
+        run_sync(slow(), timeout=0.05)
+    assert cancelled.wait(1)
+
+
+def test_run_sync_on_the_loop_thread_raises():
+    async def nested():
+        return 1
+
+    async def outer():
+        with pytest.raises(RuntimeError):
+            run_sync(nested())
+        return "ok"
+
+    assert run_sync(outer()) == "ok"
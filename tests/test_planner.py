@@ -0,0 +1,116 @@
+from contextflow import ContextFlow
+from contextflow.core.planner import Planner
+from contextflow.utils.tokenizer import count_tokens
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def score_batch_async(self, goal, batch, max_tokens):
+        self.calls += 1
+        return [5.0] * len(batch)
+
+    def summarize_text(self, source, max_tokens):
+        self.calls += 1
+        return "summary"
+
+
+def chat(count, size=40):
+    return [
+        {"role": "user", "content": f"message {i} " + "x" * size}
+        for i in range(count)
+    ]
+
+
+def make_flow():
+    llm = CountingLLM()
+    return ContextFlow(scoring_model=llm, summarizing_model=llm), llm
+
+
+def test_passthrough_when_input_fits():
+    cf, llm = make_flow()
+    result = cf.optimize(chat(3), "goal", max_token_count=500)
+
+    assert result["analytics"]["plan"] == "passthrough"
+    assert result["analytics"]["reduction_pct"] == 0.0
+    assert llm.calls == 0
+
+
+def test_empty_input_has_no_division_by_zero():
+    cf, _ = make_flow()
+    result = cf.optimize([], "goal", max_token_count=500)
+    assert result["analytics"]["reduction_pct"] == 0.0
+
+
+def test_recency_trim_for_small_overflow():
+    cf, llm = make_flow()
+    messages = chat(30)
+    budget = sum(len(m["content"]) for m in messages[1:]) // 4
+
+    result = cf.optimize(messages, "goal", max_token_count=budget)
+
+    assert result["analytics"]["plan"] == "recency_trim"
+    assert result["messages"] == messages[-len(result["messages"]) :]
+    assert llm.calls == 0
+
+
+def test_short_conversations_are_scored_locally_only_if_asked():
+    cf, llm = make_flow()
+    result = cf.optimize(chat(6, size=200), "goal", max_token_count=120)
+    assert result["analytics"]["plan"] == "full"
+
+    llm = CountingLLM()
+    cf = ContextFlow(
+        scoring_model=llm,
+        summarizing_model=llm,
+        planner=Planner(local_max_messages=8, local_max_tokens=1000),
+    )
+    result = cf.optimize(chat(6, size=200), "goal", max_token_count=120)
+    assert result["analytics"]["plan"] == "local_scoring"
+    assert result["analytics"]["tokens_after"] <= 120
+    assert llm.calls == 0
+
+    # Too many tokens to be worth skipping the LLM for
+    result = cf.optimize(chat(6, size=2000), "goal", max_token_count=120)
+    assert result["analytics"]["plan"] == "full"
+
+
+def test_recency_trim_pins_the_system_prompt():
+    cf, _ = make_flow()
+    messages = [{"role": "system", "content": "You are helpful. " * 5}]
+    messages += chat(30)
+    budget = count_tokens(messages) * 95 // 100
+
+    result = cf.optimize(messages, "goal", max_token_count=budget)
+
+    assert result["analytics"]["plan"] == "recency_trim"
+    assert result["messages"][0] == messages[0]
+    assert result["analytics"]["tokens_after"] <= budget
+
+
+def test_plan_falls_back_locally_when_the_deadline_cannot_be_met():
+    planner = Planner()
+    assert planner.plan(chat(45), 10, deadline_ms=50)["plan"] == "full"
+
+    plan = planner.plan(chat(45), 10, scoring_latency=0.3, deadline_ms=50)
+    assert plan["plan"] == "local_scoring"
+    assert plan["reason"] == "predicted to miss deadline"
+
+    plan = planner.plan(chat(45), 10, scoring_latency=0.3, deadline_ms=5000)
+    assert plan["plan"] == "full"
+
+
+def test_full_plan_uses_llm():
+    cf, llm = make_flow()
+    result = cf.optimize(chat(30), "goal", max_token_count=100)
+
+    assert result["analytics"]["plan"] == "full"
+    assert llm.calls >= 2
+
+
+def test_plan_estimates():
+    plan = Planner().plan(chat(45), 10, scoring_latency=0.5)
+    assert plan["plan"] == "full"
+    assert plan["estimated_llm_calls"] == 4
+    assert plan["estimated_ms"] == 500.0 + 2000.0
@@ -0,0 +1,197 @@
+import asyncio
+import threading
+import time
+from contextflow import ContextFlow
+from contextflow.core.compactor import MessageCompactor
+from contextflow.core.planner import Planner
+
+
+class CountingLLM:
+    def __init__(self, gate=None):
+        self.scored = 0
+        self.summaries = 0
+        self.gate = gate
+
+    async def score_batch_async(self, goal, batch, max_tokens):
+        if self.gate is not None:
+            self.gate.wait(timeout=5)
+        self.scored += len(batch)
+        return [5.0] * len(batch)
+
+    def summarize_text(self, source, max_tokens):
+        self.summaries += 1
+        return "summary"
+
+
+def chat(count):
+    return [
+        {"role": "user", "content": f"message {i} " + "x" * 80}
+        for i in range(count)
+    ]
+
+
+def make_flow(llm):
+    return ContextFlow(
+        scoring_model=llm,
+        summarizing_model=llm,
+        planner=Planner(local_max_messages=0, trim_ratio=0.0),
+    )
+
+
+def test_next_optimize_reuses_prefetched_scores():
+    llm = CountingLLM()
+    cf = make_flow(llm)
+    history = chat(30)
+
+    cf.prefetch(history, "goal", max_token_count=200)
+    result = cf.optimize(history + chat(31)[30:], "goal", max_token_count=200)
+
+    assert result["analytics"]["prefetch"] == "used"
+    # Only the new message needed scoring on the critical path
+    assert llm.scored == 31
+
+
+def test_edited_history_cancels_prefetch():
+    gate = threading.Event()
+    llm = CountingLLM(gate)
+    cf = make_flow(llm)
+    history = chat(30)
+
+    prefetch = cf.prefetch(history, "goal", max_token_count=200)
+    edited = [{"role": "user", "content": "edited"}] + history[1:]
+    gate.set()
+    result = cf.optimize(edited, "goal", max_token_count=200)
+
+    assert result["analytics"]["prefetch"] == "cancelled"
+    assert prefetch.cancelled.is_set()
+
+
+def test_matches_only_prefix_extensions_with_same_goal_and_budget():
+    cf = make_flow(CountingLLM())
+    history = chat(5)
+    prefetch = cf.prefetch(history, "goal", max_token_count=200)
+    prefetch.wait(timeout=5)
+
+    assert prefetch.matches(history + chat(6)[5:], "goal", 200)
+    assert not prefetch.matches(history[:4], "goal", 200)
+    assert not prefetch.matches(list(reversed(history)), "goal", 200)
+    assert not prefetch.matches(history, "other goal", 200)
+    assert not prefetch.matches(history, "goal", 300)
+
+
+class FirstCallHangsLLM(CountingLLM):
+    """The first scoring call hangs until the gate opens."""
+
+    def __init__(self, gate):
+        super().__init__(gate)
+        self.entered = threading.Event()
+
+    async def score_batch_async(self, goal, batch, max_tokens):
+        if not self.entered.is_set():
+            self.entered.set()
+            # Without blocking the event loop the real call shares
+            for _ in range(500):
+                if self.gate.is_set():
+                    break
+                await asyncio.sleep(0.01)
+        self.scored += len(batch)
+        return [5.0] * len(batch)
+
+
+def test_slow_prefetch_is_cancelled_within_the_deadline():
+    gate = threading.Event()
+    llm = FirstCallHangsLLM(gate)
+    cf = make_flow(llm)
+    history = chat(30)
+
+    prefetch = cf.prefetch(history, "goal", max_token_count=200)
+    llm.entered.wait(timeout=5)
+    started = time.monotonic()
+    result = cf.optimize(history, "goal", max_token_count=200, deadline_ms=50)
+    elapsed_ms = (time.monotonic() - started) * 1000
+    gate.set()
+
+    assert result["analytics"]["prefetch"] == "cancelled"
+    assert prefetch.cancelled.is_set()
+    assert elapsed_ms < 1000
+
+
+def test_grown_bucket_reuses_the_prefetched_summary():
+    llm = CountingLLM()
+    cf = make_flow(llm)
+    history = chat(30)
+
+    cf.prefetch(history, "goal", max_token_count=200)
+    result = cf.optimize(history + chat(31)[30:], "goal", max_token_count=200)
+
+    assert result["analytics"]["prefetch"] == "used"
+    # The prefetch's summary call only; the bucket grew by one message
+    assert llm.summaries == 1
+
+
+def test_summary_cache_skips_repeat_summaries():
+    llm = CountingLLM()
+    compactor = MessageCompactor(model=llm)
+    messages = chat(3)
+
+    first = compactor.summarize(messages, 50)
+    second = compactor.summarize(list(reversed(messages)), 50)
+
+    assert first == second == "summary"
+    assert llm.summaries == 1
+
+
+class SourceLLM:
+    def __init__(self):
+        self.sources = []
+
+    def summarize_text(self, source, max_tokens):
+        self.sources.append(source)
+        return f"summary of {source.count(chr(10)) + 1} messages."
+
+
+def test_only_new_messages_are_summarized():
+    llm = SourceLLM()
+    compactor = MessageCompactor(model=llm)
+
+    first = compactor.summarize(chat(5), 100)
+    extended = compactor.summarize(chat(8), 100)
+
+    assert len(llm.sources) == 2
+    assert "message 4 " not in llm.sources[1]
+    assert "message 5 " in llm.sources[1]
+    assert extended.startswith(first)
+    assert len(extended) // 4 <= 100
+
+
+class SleepingLLM(CountingLLM):
+    async def score_batch_async(self, goal, batch, max_tokens):
+        await asyncio.sleep(0.2)
+        self.scored += len(batch)
+        return [5.0] * len(batch)
+
+
+def test_cancelled_prefetch_stops_its_llm_calls():
+    llm = SleepingLLM()
+    cf = make_flow(llm)
+
+    prefetch = cf.prefetch(chat(100), "goal", max_token_count=200)
+    time.sleep(0.02)
+    started = time.monotonic()
+    prefetch.cancel()
+    prefetch.future.exception(timeout=5)
+
+    assert time.monotonic() - started < 0.15
+    assert llm.scored == 0
+    assert llm.summaries == 0
+
+
+def test_timed_out_wait_is_not_a_failure(capsys):
+    llm = SleepingLLM()
+    cf = make_flow(llm)
+
+    prefetch = cf.prefetch(chat(30), "goal", max_token_count=200)
+
+    assert prefetch.wait(timeout=0.01) is False
+    assert "failed" not in capsys.readouterr().out
+    prefetch.cancel()
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from contextflow import ContextFlow
+from contextflow.core.planner import Planner
+from contextflow.utils.prompt_cache import PromptCache
+from contextflow.utils.providers import claude, fake, gemini
+from contextflow.utils.usage import record_usage, track_usage, usage_totals
+
+
+def test_handles_are_reused_until_refresh_margin():
+    cache = PromptCache(ttl=10.0, refresh_margin=2.0)
+    key = cache.key("model", "prefix")
+    cache.store(key, "cachedContents/1")
+
+    assert cache.lookup(key) == "cachedContents/1"
+
+    cache._handles[key] = ("cachedContents/1", time.monotonic() + 1.0)
+    assert cache.lookup(key) is None
+    assert len(cache) == 0
+
+
+def test_short_or_failed_prefixes_are_not_cached():
+    cache = PromptCache(min_tokens=10)
+    key = cache.key("model", "x" * 100)
+
+    assert not cache.cacheable(key, "short")
+    assert cache.cacheable(key, "x" * 100)
+    cache.fail(key)
+    assert not cache.cacheable(key, "x" * 100)
+
+
+class GeminiClient:
+    """Records requests in the shape of google-genai's async client."""
+
+    def __init__(self):
+        self.created = []
+        self.requests = []
+        self.aio = SimpleNamespace(
+            caches=SimpleNamespace(create=self.create),
+            models=SimpleNamespace(generate_content=self.generate_content),
+        )
+
+    async def create(self, model, config):
+        self.created.append(config.system_instruction)
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+    async def generate_content(self, model, contents, config):
+        self.requests.append((contents, config.cached_content))
+        return SimpleNamespace(
+            text="55",
+            candidates=[],
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=300,
+                candidates_token_count=2,
+                cached_content_token_count=250,
+            ),
+        )
+
+
+def test_gemini_scoring_prefix_is_cached_once_per_goal():
+    client = GeminiClient()
+    llm = gemini.LLM(client, PromptCache(min_tokens=0))
+    batch = [{"role": "user", "content": f"message {i}"} for i in range(2)]
+
+    async def score_twice():
+        for _ in range(2):
+            await llm.score_batch_async(
+                "goal", batch, 400, output_format="digits"
+            )
+
+    with track_usage() as calls:
+        asyncio.run(score_twice())
+
+    assert len(client.created) == 1
+    assert "Goal: goal" in client.created[0]
+    assert [cached for _, cached in client.requests] == ["cachedContents/1"] * 2
+    assert all("Goal:" not in contents for contents, _ in client.requests)
+    assert usage_totals(calls)["cached_input_tokens"] == 500
+
+
+def test_concurrent_batches_create_one_gemini_cache():
+    client = GeminiClient()
+    created = client.create
+
+    async def slow_create(model, config):
+        await asyncio.sleep(0.01)
+        return await created(model, config)
+
+    client.aio.caches.create = slow_create
+    llm = gemini.LLM(client, PromptCache(min_tokens=0))
+    batch = [{"role": "user", "content": f"message {i}"} for i in range(2)]
+
+    async def score_concurrently():
+        await asyncio.gather(
+            *(
+                llm.score_batch_async(
+                    "goal", batch, 400, output_format="digits"
+                )
+                for _ in range(3)
+            )
+        )
+
+    asyncio.run(score_concurrently())
+
+    assert len(client.created) == 1
+    assert [cached for _, cached in client.requests].count(None) == 2
+
+
+def test_claude_marks_only_cacheable_prefixes():
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return SimpleNamespace(
+            content=[SimpleNamespace(text="55")],
+            usage=SimpleNamespace(
+                input_tokens=40,
+                output_tokens=2,
+                cache_read_input_tokens=200,
+                cache_creation_input_tokens=0,
+            ),
+        )
+
+    llm = claude.LLM(SimpleNamespace(messages=SimpleNamespace(create=create)))
+    batch = [{"role": "user", "content": "a"}, {"role": "user", "content": "b"}]
+    long_goal = "resolve the ticket " * claude.CACHE_MIN_TOKENS
+
+    with track_usage() as calls:
+        for goal in ("goal", long_goal):
+            asyncio.run(
+                llm.score_batch_async(goal, batch, 400, output_format="digits")
+            )
+
+    short, long = (request["system"][0] for request in requests)
+    assert "Goal: goal" in short["text"]
+    assert "cache_control" not in short
+    assert long["cache_control"] == {"type": "ephemeral"}
+    assert calls[0]["input_tokens"] == 240
+    assert calls[0]["cached_input_tokens"] == 200
+
+
+def test_nested_tracking_records_in_every_block():
+    with track_usage() as outer:
+        record_usage("fake", "score", 10, 1)
+        with track_usage() as inner:
+            record_usage("fake", "score", 20, 2, cached_input_tokens=5)
+
+    assert len(outer) == 2 and len(inner) == 1
+    assert usage_totals(outer)["uncached_input_tokens"] == 25
+
+
+def test_optimize_reports_llm_usage():
+    llm = fake.LLM()
+    cf = ContextFlow(
+        scoring_model=llm,
+        summarizing_model=llm,
+        planner=Planner(local_max_messages=0, trim_ratio=0.0),
+    )
+    messages = [
+        {"role": "user", "content": f"message {i} " + "x" * 80}
+        for i in range(30)
+    ]
+
+    usage = cf.optimize(messages, "goal", max_token_count=200)["analytics"][
+        "llm_usage"
+    ]
+
+    assert usage["calls"] >= 2
+    assert usage["input_tokens"] > 0
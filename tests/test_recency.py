@@ -0,0 +1,60 @@
+import pytest
+
+from contextflow.core.recency import (
+    ExponentialRecency,
+    RecencyModel,
+    TurnRecency,
+    WindowRecency,
+    recency_from_config,
+)
+
+messages = [
+    {"role": "user", "content": "a"},
+    {"role": "assistant", "content": "b"},
+    {"role": "user", "content": "c"},
+    {"role": "tool", "content": "d"},
+    {"role": "assistant", "content": "e"},
+    {"role": "user", "content": "f"},
+    {"role": "assistant", "content": "g"},
+]
+
+
+def test_window_matches_flat_bonus():
+    scores = WindowRecency().apply(messages, [0.0] * 7)
+    assert scores == [0.0, 0.0, 1.0, 1.0, 1.0, 1.0, 1.0]
+
+
+def test_exponential_decay_and_role_weights():
+    model = ExponentialRecency(half_life=1.0, role_weights={"tool": 0.0})
+    scores = model.apply(messages, [0.0] * 7)
+    assert scores[-1] == 1.0
+    assert scores[-2] == 0.5
+    assert scores[3] == 0.0  # tool output gets no bonus
+
+
+def test_turn_window():
+    scores = TurnRecency(turns=2).apply(messages, [0.0] * 7)
+    assert scores == [0.0, 0.0, 1.0, 1.0, 1.0, 1.0, 1.0]
+    scores = TurnRecency(turns=1).apply(messages, [0.0] * 7)
+    assert scores == [0.0] * 5 + [1.0, 1.0]
+
+
+def test_preserve_tiers():
+    model = recency_from_config(
+        {"type": "window", "preserve_tiers": [[8.0, 6]], "min_preserve": 1}
+    )
+    assert model.preserve_count([9.0] * 12) == 6
+    assert model.preserve_count([5.0] * 12) == 1
+    assert WindowRecency().preserve_count([5.0] * 12) == 3
+
+
+def test_unknown_model():
+    with pytest.raises(ValueError):
+        recency_from_config({"type": "linear"})
+
+
+def test_base_model_only_preserves():
+    model = RecencyModel(preserve_tiers=[(5.0, 4)])
+    messages = [{"role": "user", "content": "hi"}] * 3
+    assert model.apply(messages, [6.0, 6.0, 6.0]) == [6.0, 6.0, 6.0]
+    assert model.preserve_count([6.0, 6.0, 6.0]) == 4
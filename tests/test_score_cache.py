@@ -0,0 +1,81 @@
+from contextflow.core.score_cache import ScoreCache
+from contextflow.core.scorer import MessageScorer
+
+
+class CountingLLM:
+    def __init__(self):
+        self.single_calls = 0
+        self.multi_calls = 0
+
+    async def score_batch_async(self, goal, batch, max_tokens):
+        self.single_calls += 1
+        return [3.0] * len(batch)
+
+    async def score_batch_multi_async(self, goals, batch, max_tokens):
+        self.multi_calls += 1
+        return [[float(j + 1) for j in range(len(goals))] for _ in batch]
+
+
+messages = [
+    {"role": "user", "content": f"Message number {i}"} for i in range(25)
+]
+
+
+def test_multi_goal_scoring_fills_cache():
+    llm = CountingLLM()
+    scorer = MessageScorer(model=llm)
+
+    goals = ["triage ticket", "billing refund", "shipping delay"]
+    scores = scorer.score_goals(messages, goals)
+
+    assert llm.multi_calls == 2  # one request per batch of 20
+    assert scores["billing refund"][0] == 2.0
+    assert scores["shipping delay"][-1] == 3.0 + 1.0  # recency bonus
+
+    again = scorer.score_messages(messages, "billing refund")
+    assert again == scores["billing refund"]
+    assert llm.single_calls == 0
+
+
+def test_close_goal_reuses_and_far_goal_rescores():
+    llm = CountingLLM()
+    scorer = MessageScorer(model=llm)
+    scorer.score_goals(messages, ["resolve shipping delay for customer"])
+
+    scorer.score_messages(messages, "resolve shipping delay for the customer")
+    assert llm.single_calls == 0
+
+    scorer.score_messages(messages, "write a poem")
+    assert llm.single_calls == 2
+
+
+def test_interpolates_between_close_goals():
+    cache = ScoreCache(reuse_threshold=0.95, interpolate_threshold=0.3)
+    message = {"role": "user", "content": "order #1"}
+    cache.put("shipping order status", [message], [8.0])
+    cache.put("billing order refund", [message], [2.0])
+
+    (score,) = cache.get("order status refund", [message])
+    assert 2.0 < score < 8.0
+
+
+def test_goals_differing_in_a_content_word_are_not_reused():
+    cache = ScoreCache()
+    message = {"role": "user", "content": "My invoice is wrong."}
+    goal = "Help the customer resolve their billing issue"
+    cache.put(goal, [message], [9.0])
+
+    shipping = goal.replace("billing", "shipping")
+    assert cache.get(shipping, [message]) == [None]
+    # Case, punctuation and stopwords don't change the content terms
+    assert cache.get(goal.upper() + " for the customer!", [message]) == [9.0]
+
+
+def test_goal_terms_are_bounded():
+    cache = ScoreCache(max_goals=2)
+    message = {"role": "user", "content": "order #1"}
+    for goal in ["refund order", "track parcel", "close account"]:
+        cache.put(goal, [message], [5.0])
+
+    assert len(cache._goal_terms) == 2
+    assert cache.get("refund order", [message]) == [5.0]
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from contextflow.core.scorer import MessageScorer
+from contextflow.utils.providers import fake
+from contextflow.utils.providers.base import (
+    decode_digit_scores,
+    digit_scoring_prompt,
+)
+from contextflow.utils.usage import record_usage, track_usage
+
+
+def test_decode_digit_scores_maps_to_score_scale():
+    assert decode_digit_scores("09", 2) == [0.0, 10.0]
+    assert decode_digit_scores(" `7 1 9` \n", 3) == pytest.approx(
+        [70 / 9, 10 / 9, 10.0]
+    )
+
+
+def test_decode_digit_scores_rejects_wrong_length_and_non_digits():
+    with pytest.raises(ValueError):
+        decode_digit_scores("123", 4)
+    with pytest.raises(ValueError):
+        decode_digit_scores("1a3", 3)
+
+
+def test_digit_prompt_asks_for_one_digit_per_message():
+    batch = [{"role": "user", "content": "hi"}] * 3
+    prompt = digit_scoring_prompt("ship the order", batch)
+    assert "exactly 3 digits" in prompt
+    assert "3. [User] hi" in prompt
+
+
+def test_scorer_passes_format_to_provider():
+    provider = fake.LLM(score=lambda message: 7.0)
+    scorer = MessageScorer(model=provider, score_format="digits")
+    messages = [{"role": "user", "content": f"message {i}"} for i in range(3)]
+
+    raw = asyncio.run(provider.score_batch_async("goal", messages, 400))
+    scores = scorer.score_messages(messages, "goal")
+
+    assert raw == [7.0] * 3
+    # 7.0 is rounded to the digit 6, which decodes to 6.67 before recency
+    assert scores[0] == pytest.approx(60 / 9 + 1.0)
+
+
+def test_unknown_score_format_raises():
+    with pytest.raises(ValueError):
+        MessageScorer(model=fake.LLM(), score_format="xml")
+
+
+def test_usage_is_only_recorded_while_tracking():
+    record_usage("gemini", "score", 10, 2)
+    with track_usage() as calls:
+        record_usage("gemini", "score", 100, 20, format="digits")
+    record_usage("gemini", "score", 10, 2)
+
+    assert calls == [
+        {
+            "provider": "gemini",
+            "operation": "score",
+            "input_tokens": 100,
+            "cached_input_tokens": 0,
+            "output_tokens": 20,
+            "format": "digits",
+        }
+    ]
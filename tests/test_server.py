@@ -0,0 +1,131 @@
+import asyncio
+import json
+from contextflow import ContextFlow
+from contextflow.core.planner import Planner
+from contextflow.server.app import OptimizationServer, call, request_key
+from contextflow.server.loadgen import make_conversation, run_load
+from contextflow.utils.providers import fake
+
+HEADERS = [(b"content-type", b"application/json")]
+
+
+def make_server(latency=0.0):
+    llm = fake.LLM(latency=fake.fixed_latency(latency))
+    flow = ContextFlow(
+        scoring_model=llm,
+        summarizing_model=llm,
+        planner=Planner(local_max_messages=0, trim_ratio=0.0),
+    )
+    return OptimizationServer(flow), llm
+
+
+def body(messages, goal="refund status", budget=100):
+    return json.dumps(
+        {"messages": messages, "goal": goal, "max_token_count": budget}
+    ).encode()
+
+
+def test_optimize_endpoint_returns_messages_and_analytics():
+    server, _ = make_server()
+    messages = make_conversation(30, seed=1)
+
+    status, headers, raw = asyncio.run(
+        call(server, "POST", "/optimize", body(messages), HEADERS)
+    )
+    result = json.loads(raw)
+
+    assert status == 200
+    assert headers[b"content-type"] == b"application/json"
+    assert result["analytics"]["tokens_after"] <= 100
+    assert result["messages"]
+
+
+def test_bad_requests_are_rejected():
+    server, _ = make_server()
+
+    status, _, _ = asyncio.run(
+        call(server, "POST", "/optimize", b"{not json", HEADERS)
+    )
+    assert status == 400
+
+    status, _, _ = asyncio.run(
+        call(server, "POST", "/optimize", b'{"goal": "x"}', HEADERS)
+    )
+    assert status == 400
+
+    status, _, _ = asyncio.run(call(server, "GET", "/nope"))
+    assert status == 404
+
+
+def test_malformed_messages_and_options_are_bad_requests():
+    server, llm = make_server()
+    payloads = [
+        {"messages": ["hi"], "goal": "x"},
+        {"messages": [{"role": "user"}], "goal": "x"},
+        {"messages": [], "goal": "x", "max_token_count": "many"},
+        {"messages": [], "goal": "x", "strategy": "nope"},
+    ]
+    for payload in payloads:
+        status, _, raw = asyncio.run(
+            call(server, "POST", "/optimize", json.dumps(payload).encode())
+        )
+        assert status == 400, payload
+        assert json.loads(raw)["error"].startswith("bad request")
+    assert server.stats["errors"] == 0
+
+
+def test_failures_while_optimizing_are_server_errors(caplog):
+    server, _ = make_server()
+
+    def broken(**kwargs):
+        raise RuntimeError("provider key sk-secret rejected")
+
+    server.flow.optimize = broken
+    status, _, raw = asyncio.run(
+        call(server, "POST", "/optimize", body(make_conversation(5)), HEADERS)
+    )
+    assert status == 500
+    assert json.loads(raw) == {"error": "internal server error"}
+    assert "sk-secret" in caplog.text
+    assert server.stats["errors"] == 1
+
+
+def test_request_key_covers_every_message_field():
+    messages = [
+        {"role": "tool", "content": "42", "tool_call_id": "a"},
+    ]
+    other = [dict(messages[0], tool_call_id="b")]
+    assert request_key({"messages": messages, "goal": "x"}) != request_key(
+        {"messages": other, "goal": "x"}
+    )
+
+
+def test_identical_concurrent_requests_are_coalesced():
+    server, llm = make_server(latency=0.05)
+    payload = body(make_conversation(30, seed=2))
+
+    async def burst():
+        requests = [
+            call(server, "POST", "/optimize", payload, HEADERS)
+            for _ in range(5)
+        ]
+        return await asyncio.gather(*requests)
+
+    responses = asyncio.run(burst())
+
+    assert [status for status, _, _ in responses] == [200] * 5
+    assert len({raw for _, _, raw in responses}) == 1
+    assert server.stats["coalesced"] == 4
+    assert llm.calls <= 3
+
+
+def test_load_generator_reports_latency():
+    server, _ = make_server()
+
+    report = asyncio.run(
+        run_load(server, requests=20, concurrency=4, conversations=3, length=30)
+    )
+
+    assert report["requests"] == 20
+    assert report["errors"] == 0
+    assert report["p95_ms"] >= report["p50_ms"]
@@ -0,0 +1,94 @@
+from contextflow import ContextFlow
+from contextflow.core.planner import Planner
+from contextflow.core.spans import SEPARATOR, SpanSplitter
+
+
+def paragraphs(count, needle_at=None):
+    body = [
+        f"Paragraph {i} restates background detail number {i}. " * 3
+        for i in range(count)
+    ]
+    if needle_at is not None:
+        body[needle_at] = "ERROR: refund RF-2291 failed with code 502."
+    return "\n\n".join(body)
+
+
+def test_short_messages_stay_whole():
+    messages = [{"role": "user", "content": "short"}]
+    split = SpanSplitter().split(messages)
+
+    assert not split.was_split
+    assert split.units[0] is messages[0]
+
+
+def test_spans_cover_paragraphs_within_limit():
+    content = paragraphs(10)
+    splitter = SpanSplitter(min_message_tokens=10, max_span_tokens=60)
+
+    spans = splitter.boundaries(content)
+
+    assert len(spans) > 1
+    assert all(end - start <= 60 * 4 for start, end in spans)
+    assert " ".join(content[a:b] for a, b in spans).split() == content.split()
+
+
+def test_reassemble_all_spans_returns_original_message():
+    message = {"role": "assistant", "content": paragraphs(6)}
+    split = SpanSplitter(min_message_tokens=10, max_span_tokens=40).split(
+        [message]
+    )
+
+    assert split.was_split
+    assert split.reassemble(list(split.units)) == [message]
+    assert split.reassemble(list(split.units))[0] is message
+
+
+def test_reassemble_keeps_span_order_and_marks_gaps():
+    message = {"role": "assistant", "content": paragraphs(6)}
+    other = {"role": "user", "content": "next"}
+    split = SpanSplitter(min_message_tokens=10, max_span_tokens=40).split(
+        [message, other]
+    )
+    spans = split.units[:-1]
+
+    # Strategies may return kept units out of order
+    result = split.reassemble([spans[-1], other, spans[0]])
+
+    assert len(result) == 2
+    assert result[1] is other
+    assert result[0]["role"] == "assistant"
+    first, last = result[0]["content"].split(SEPARATOR)
+    assert first == spans[0]["content"]
+    assert last == spans[-1]["content"]
+
+
+class SpanScoringLLM:
+    async def score_batch_async(self, goal, batch, max_tokens):
+        return [10.0 if "ERROR" in m["content"] else 2.0 for m in batch]
+
+    def summarize_text(self, source, max_tokens):
+        return ""
+
+
+def test_optimize_keeps_critical_span_of_long_message():
+    llm = SpanScoringLLM()
+    cf = ContextFlow(
+        scoring_model=llm,
+        summarizing_model=llm,
+        span_splitting=SpanSplitter(min_message_tokens=50, max_span_tokens=40),
+        planner=Planner(local_max_messages=0),
+    )
+    long_message = {"role": "tool", "content": paragraphs(20, needle_at=7)}
+    messages = [long_message] + [
+        {"role": "user", "content": f"follow-up {i}"} for i in range(3)
+    ]
+
+    result = cf.optimize(
+        messages, "refund status", max_token_count=40, strategy="conservative"
+    )
+
+    kept = result["messages"]
+    assert kept[0]["role"] == "tool"
+    assert "RF-2291" in kept[0]["content"]
+    assert len(kept[0]["content"]) < len(long_message["content"])
+    assert result["analytics"]["tokens_after"] <= 40
@@ -0,0 +1,85 @@
+import pytest
+import struct
+
+from contextflow.core.store import ConversationStore, StoredMessage
+from contextflow.core.strategies import balanced_strategy
+from contextflow.utils.tokenizer import count_tokens
+
+
+class EchoCompactor:
+    def summarize(self, messages_to_summarize, max_token_count=500):
+        return "summary"
+
+
+messages = [
+    {"role": "user", "content": "Hi, my order #12345 hasn't arrived."},
+    {"role": "assistant", "content": "Sorry! Let me check that for you."},
+    {"role": "assistant", "content": "It shipped Nov 5th via USPS. " * 20},
+    {"role": "user", "content": "Thanks!", "name": "alice"},
+]
+
+
+def test_roundtrip_and_reopen(tmp_path):
+    path = str(tmp_path / "conv")
+    with ConversationStore(path) as store:
+        store.extend(messages)
+        assert len(store) == 4
+        assert dict(store[-1]) == messages[-1]
+        assert store[0]["content"] == messages[0]["content"]
+
+    with ConversationStore(path) as store:
+        assert [dict(m) for m in store] == messages
+        store.append({"role": "user", "content": "Any update?"})
+        assert store[4]["content"] == "Any update?"
+
+
+def test_token_count_without_paging(tmp_path):
+    with ConversationStore(str(tmp_path / "conv")) as store:
+        store.extend(messages)
+        assert count_tokens(store) == count_tokens(messages)
+
+
+def test_strategy_returns_span_references(tmp_path):
+    with ConversationStore(str(tmp_path / "conv")) as store:
+        store.extend(messages)
+        scores = [9.0, 2.0, 5.0, 1.0]
+        optimized = balanced_strategy(store, scores, 1000, EchoCompactor())
+
+        stored = [m for m in optimized if isinstance(m, StoredMessage)]
+        assert stored
+        offset, length = stored[-1].span
+        assert length == stored[-1].content_length
+
+
+def test_lengths_are_characters_like_in_memory_messages(tmp_path):
+    accented = [{"role": "user", "content": "Café crème, s'il vous plaît ☕"}]
+    with ConversationStore(str(tmp_path / "conv")) as store:
+        store.extend(accented)
+        assert store[0].content_length == len(accented[0]["content"])
+        assert store[0].span[1] > store[0].content_length
+        assert count_tokens(store) == count_tokens(accented)
+
+
+def test_version_1_index_is_migrated(tmp_path):
+    path = str(tmp_path / "conv")
+    accented = {"role": "user", "content": "Café crème ☕"}
+    with ConversationStore(path) as store:
+        store.extend([messages[0], accented])
+        records = list(store._records)
+    with open(f"{path}.idx", "wb") as f:
+        for record in records:
+            f.write(struct.pack("<QII", *record[:3]))
+
+    with ConversationStore(path) as store:
+        assert [dict(m) for m in store] == [messages[0], accented]
+        assert store[1].content_length == len(accented["content"])
+    with ConversationStore(path) as store:
+        assert store._records == records
+
+
+def test_other_index_versions_are_rejected(tmp_path):
+    path = str(tmp_path / "conv")
+    with open(f"{path}.idx", "wb") as f:
+        f.write(struct.pack("<4sI", b"CFIX", 99))
+    with pytest.raises(ValueError, match="version 99"):
+        ConversationStore(path)
@@ -0,0 +1,53 @@
+import pytest
+
+from contextflow.core.strategies import (
+    STRATEGIES,
+    aggressive_strategy,
+    conservative_strategy,
+    get_strategy,
+)
+from contextflow.utils.tokenizer import count_tokens
+
+
+class RecordingCompactor:
+    def __init__(self):
+        self.calls = []
+
+    def summarize(self, messages_to_summarize, max_token_count=500):
+        self.calls.append(messages_to_summarize)
+        return "short"
+
+
+messages = [
+    {"role": "user", "content": f"message {i} " + "x" * 40} for i in range(20)
+]
+scores = [float(i % 10) for i in range(20)]
+
+
+def test_registry():
+    assert {"balanced", "aggressive", "conservative"} <= set(STRATEGIES)
+    assert get_strategy("conservative") is conservative_strategy
+    with pytest.raises(ValueError):
+        get_strategy("reckless")
+
+
+def test_conservative_never_summarizes_and_keeps_order():
+    compactor = RecordingCompactor()
+    optimized = conservative_strategy(messages, scores, 80, compactor)
+
+    assert compactor.calls == []
+    assert count_tokens(optimized) <= 80
+    positions = [messages.index(m) for m in optimized]
+    assert positions == sorted(positions)
+    assert optimized[-1] is messages[-1]
+
+
+def test_aggressive_summarizes_and_drops_low_percentile():
+    compactor = RecordingCompactor()
+    optimized = aggressive_strategy(messages, scores, 100, compactor)
+
+    assert count_tokens(optimized) <= 100
+    assert optimized[0]["content"].startswith("Summary of earlier context")
+    (summarized,) = compactor.calls
+    lowest = [m for m, s in zip(messages[:-2], scores) if s < 3]
+    assert not any(m in summarized for m in lowest)
@@ -0,0 +1,107 @@
+import pytest
+
+from contextflow import ContextFlow
+from contextflow.core.compactor import MessageCompactor, on_partial_summary
+from contextflow.core.planner import Planner
+from contextflow.utils.hedging import HedgedLLMClient
+from contextflow.utils.providers import fake
+from contextflow.utils.usage import track_usage, usage_totals
+
+
+class RamblingLLM:
+    """Streams sentences forever unless the reader stops."""
+
+    provider = "rambling"
+
+    def __init__(self):
+        self.chunks_sent = 0
+        self.closed = False
+
+    def summarize_stream(self, source, max_tokens):
+        try:
+            while True:
+                self.chunks_sent += 1
+                yield f"Fact {self.chunks_sent} holds. "
+        finally:
+            self.closed = True
+
+
+class FailingLLM:
+    provider = "failing"
+
+    def summarize_stream(self, source, max_tokens):
+        raise RuntimeError("down")
+        yield
+
+
+def conversation(n):
+    return [
+        {"role": "user", "content": f"Order #{i} shipped. It was late."}
+        for i in range(n)
+    ]
+
+
+def test_stream_stops_at_the_budget_on_a_sentence_end():
+    llm = RamblingLLM()
+    compactor = MessageCompactor(llm, streaming=True)
+
+    summary = compactor.summarize(conversation(5), 20)
+
+    assert llm.closed
+    assert llm.chunks_sent <= 20 * 4 // len("Fact 1 holds. ") + 1
+    assert len(summary) // 4 <= 20
+    assert summary.endswith("holds.")
+
+
+def test_partial_summaries_grow_and_end_with_the_final():
+    compactor = MessageCompactor(fake.LLM(), streaming=True)
+    seen = []
+
+    with on_partial_summary(lambda text, final: seen.append((text, final))):
+        summary = compactor.summarize(conversation(10), 30)
+
+    partials = [text for text, final in seen if not final]
+    assert len(partials) > 1
+    assert all(a in b for a, b in zip(partials, partials[1:]))
+    assert all(text.endswith(".") for text in partials)
+    assert seen[-1] == (summary, True)
+
+
+def test_stopped_streams_bill_only_what_was_read():
+    llm = fake.LLM()
+    compactor = MessageCompactor(llm, streaming=True)
+
+    with track_usage() as calls:
+        compactor.summarize(conversation(40), 25)
+
+    assert usage_totals(calls)["output_tokens"] <= 25 + 4
+
+
+def test_hedged_stream_fails_over_before_the_first_chunk():
+    client = HedgedLLMClient([FailingLLM(), fake.LLM()])
+    chunks = list(client.summarize_stream("Some text. More text.", 100))
+    assert "".join(chunks) == "Some text. More text."
+
+    with pytest.raises(RuntimeError):
+        list(HedgedLLMClient([FailingLLM()]).summarize_stream("x", 10))
+
+
+def test_contextflow_streams_summaries_into_the_strategy_budget():
+    llm = fake.LLM(score=lambda m: 5.0)
+    flow = ContextFlow(
+        scoring_model=llm,
+        summarizing_model=llm,
+        streaming_summaries=True,
+        planner=Planner(local_max_messages=0, trim_ratio=0.0),
+    )
+    partials = []
+    result = flow.optimize(
+        conversation(60),
+        "late orders",
+        max_token_count=200,
+        on_partial_summary=lambda text, final: partials.append(final),
+    )
+
+    assert result["analytics"]["tokens_after"] <= 200
+    assert result["messages"][0]["content"].startswith("Summary of earlier")
+    assert partials and partials[-1] is True
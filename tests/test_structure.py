@@ -0,0 +1,84 @@
+import json
+
+from contextflow.core.structure import StructureCompactor
+
+compactor = StructureCompactor()
+
+
+def test_json_is_pruned_hoisted_and_minified():
+    payload = {
+        "orders": [
+            {"id": i, "status": "shipped", "carrier": "UPS", "note": None}
+            for i in range(4)
+        ],
+        "error": None,
+        "meta": {},
+    }
+    content = json.dumps(payload, indent=2)
+    compacted = json.loads(compactor.compact_content(content))
+
+    assert compacted == {
+        "orders": {
+            "_common": {"status": "shipped", "carrier": "UPS"},
+            "_items": [{"id": i} for i in range(4)],
+        }
+    }
+
+
+def test_repeated_log_lines_are_collapsed():
+    content = "\n".join(
+        [f"2024-11-10 12:00:0{i} WARN retrying connection" for i in range(5)]
+        + ["2024-11-10 12:00:09 ERROR gave up"]
+    )
+    assert compactor.compact_content(content) == (
+        "2024-11-10 12:00:00 WARN retrying connection [repeated 5x]\n"
+        "2024-11-10 12:00:09 ERROR gave up"
+    )
+
+
+def test_traceback_keeps_outer_and_inner_frames():
+    frames = []
+    for i in range(10):
+        frames += [f'  File "app.py", line {i}, in f{i}', f"    call_{i}()"]
+    content = "\n".join(
+        ["Traceback (most recent call last):"]
+        + frames
+        + ["ValueError: bad order id"]
+    )
+    compacted = compactor.compact_content(content)
+
+    assert "in f0" in compacted and "in f1" in compacted
+    assert "in f2" not in compacted and "in f6" not in compacted
+    assert "in f7" in compacted and "in f9" in compacted
+    assert "5 frames omitted" in compacted
+    assert compacted.endswith("ValueError: bad order id")
+
+
+def test_tool_pairs_and_plain_messages_are_preserved():
+    call = {
+        "role": "assistant",
+        "content": "",
+        "tool_calls": [{"id": "call_1", "function": {"name": "lookup"}}],
+    }
+    result = {
+        "role": "tool",
+        "tool_call_id": "call_1",
+        "content": json.dumps({"order": 1, "gift": None}, indent=4),
+    }
+    chat = {"role": "user", "content": "Where is my order?"}
+
+    compacted = compactor.compact([call, result, chat])
+
+    assert compacted[0] is call and compacted[2] is chat
+    assert compacted[1]["tool_call_id"] == "call_1"
+    assert compacted[1]["content"] == '{"order":1}'
+
+
+def test_array_nulls_and_prose_are_kept():
+    content = json.dumps({"readings": [1, None, 3], "unit": None})
+    assert json.loads(compactor.compact_content(content)) == {
+        "readings": [1, None, 3]
+    }
+
+    prose = "Sorry to hear that.\nSorry to hear that.\nSorry to hear that."
+    assert compactor.compact_content(prose) == prose
@@ -0,0 +1,100 @@
+from contextflow.core.compactor import (
+    LengthPredictor,
+    MessageCompactor,
+    fit_summary,
+)
+from contextflow.core.strategies import balanced_strategy, summary_budget
+from contextflow.utils.tokenizer import count_tokens
+
+
+class VerboseLLM:
+    """Writes summaries twice as long as requested, ignoring the cap."""
+
+    provider = "verbose"
+
+    def __init__(self):
+        self.requests = []
+
+    def summarize_text(self, source, max_tokens):
+        self.requests.append(max_tokens)
+        return "Fact one is here. " * (max_tokens * 2 * 4 // 18 + 1)
+
+
+class BudgetCompactor:
+    def __init__(self):
+        self.budgets = []
+
+    def summarize(self, messages_to_summarize, max_token_count=500):
+        self.budgets.append(max_token_count)
+        return "s" * (max_token_count * 4)
+
+
+def conversation(n, length=200):
+    return [
+        {"role": "user", "content": f"message {i} " + "x" * length}
+        for i in range(n)
+    ]
+
+
+def test_fit_summary_cuts_at_sentence_end():
+    text = "First point. Second point is longer. Third."
+    assert fit_summary(text, 100) == text
+    assert fit_summary(text, 9) == "First point. Second point is longer."
+    assert fit_summary("no sentence ends in this text at all", 2) == "no"
+
+
+def test_predictor_shrinks_requests_for_verbose_models():
+    predictor = LengthPredictor(smoothing=0.5)
+    assert predictor.request("m", 100) == 100
+    predictor.record("m", 100, 200)
+    assert predictor.request("m", 100) == 50
+    predictor.record("m", 50, 50)
+    assert predictor.ratio("m") == 1.5
+    # A terse model is never asked for more than the budget
+    predictor.record("terse", 100, 50)
+    assert predictor.request("terse", 100) == 100
+
+
+def test_summary_budget_leaves_room_for_the_prefix():
+    assert summary_budget(100, 60) == 60 - 7 - 1
+    assert summary_budget(20, 200) == 20
+    assert summary_budget(100, 20) == 0
+
+
+def test_compactor_summaries_always_fit_and_calibrate():
+    llm = VerboseLLM()
+    compactor = MessageCompactor(llm)
+    messages = conversation(4)
+
+    first = compactor.summarize(messages, 40)
+    assert len(first) // 4 <= 40
+    compactor.summarize(conversation(5, length=100), 40)
+    assert llm.requests[0] == 40
+    assert llm.requests[1] < 40
+
+
+def test_balanced_reserves_the_summary_budget_up_front():
+    compactor = BudgetCompactor()
+    messages = conversation(30)
+    scores = [5.0] * 25 + [8.0] * 5
+
+    optimized = balanced_strategy(messages, scores, 400, compactor)
+
+    # The summary gets what is left, not the 30% the strategy asks for
+    (budget,) = compactor.budgets
+    assert budget < 3 * count_tokens(messages[:25]) // 10
+    assert budget == count_tokens(optimized[:1]) - 7
+    assert optimized[0]["content"].startswith("Summary of earlier context")
+    assert count_tokens(optimized) <= 400
+
+
+def test_balanced_skips_the_call_when_no_useful_summary_fits():
+    compactor = BudgetCompactor()
+    messages = conversation(30)
+    scores = [5.0] * 30
+    budget = count_tokens(messages[-3:]) + 10
+
+    optimized = balanced_strategy(messages, scores, budget, compactor)
+
+    assert compactor.budgets == []
+    assert optimized == messages[-3:]
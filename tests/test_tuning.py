@@ -0,0 +1,130 @@
+import json
+import random
+
+from contextflow import ContextFlow
+from contextflow.core.planner import Planner
+from contextflow.core.strategies import balanced_strategy
+from contextflow.core.tuning import (
+    DEFAULT_PARAMS,
+    StrategyTuner,
+    TraceRecorder,
+    load_profile,
+    load_traces,
+    save_profile,
+)
+from contextflow.utils.providers import fake
+
+
+class CountingCompactor:
+    def __init__(self):
+        self.calls = 0
+
+    def summarize(self, messages_to_summarize, max_token_count=500):
+        self.calls += 1
+        return "summary"
+
+
+def rag_trace(seed):
+    """Retrieved chunks score in the middle band but are rarely needed."""
+    rng = random.Random(seed)
+    scores = [rng.choice([4.5, 5.0, 5.5, 6.0, 6.5]) for _ in range(30)]
+    important = rng.sample(range(25), 2)
+    for i in important:
+        scores[i] = 9.0
+    return {
+        "tokens": [40] * 30,
+        "roles": ["user", "assistant"] * 15,
+        "scores": scores,
+        "max_token_count": 600,
+        "important": important,
+    }
+
+
+def conversation(n):
+    return [
+        {"role": "user", "content": f"Chunk {i} of the retrieved manual. " * 4}
+        for i in range(n)
+    ]
+
+
+def test_balanced_cutoffs_are_parameters():
+    messages = conversation(20)
+    scores = [5.0] * 20
+
+    compactor = CountingCompactor()
+    balanced_strategy(messages, scores, 300, compactor)
+    assert compactor.calls == 1
+
+    compactor = CountingCompactor()
+    balanced_strategy(messages, scores, 300, compactor, summarize_threshold=5.0)
+    assert compactor.calls == 0
+
+
+def test_recorder_writes_scores_and_sizes_without_content(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    llm = fake.LLM(score=lambda m: 6.0)
+    flow = ContextFlow(
+        scoring_model=llm,
+        summarizing_model=llm,
+        planner=Planner(local_max_messages=0, trim_ratio=0.0),
+        trace_recorder=TraceRecorder(path),
+    )
+    flow.optimize(conversation(30), "manual", max_token_count=300)
+
+    (trace,) = load_traces(path)
+    assert len(trace["scores"]) == len(trace["tokens"]) == 30
+    assert trace["max_token_count"] == 300
+    assert "Chunk" not in open(path).read()
+
+
+def test_tuner_cuts_calls_while_keeping_retention():
+    traces = [rag_trace(seed) for seed in range(20)]
+    tuner = StrategyTuner(traces, min_retention=0.9, trials=100)
+
+    assert tuner.replay(DEFAULT_PARAMS)["llm_calls"] == 1.0
+    profile = tuner.tune()
+
+    assert profile["baseline"]["llm_calls"] == 1.0
+    assert profile["metrics"]["llm_calls"] < 1.0
+    assert profile["metrics"]["retention"] >= 0.9
+    assert profile["metrics"]["over_budget"] == 0
+
+
+def test_unreachable_retention_uses_the_most_retentive_setting(capsys):
+    traces = [rag_trace(seed) for seed in range(3)]
+    profile = StrategyTuner(
+        traces, max_token_count=30, min_retention=1.0, trials=20
+    ).tune()
+
+    assert "No setting reaches retention" in capsys.readouterr().out
+    assert profile["metrics"]["retention"] < 1.0
+
+
+def test_contextflow_loads_a_profile(tmp_path):
+    profile = {
+        "strategy": "balanced",
+        "strategy_options": {
+            "keep_threshold": 8.0,
+            "summarize_threshold": 8.0,
+            "summary_ratio": 0.3,
+        },
+        "recency": {"preserve_tiers": [[9.0, 4]], "min_preserve": 1},
+    }
+    path = str(tmp_path / "profile.json")
+    save_profile(profile, path)
+    assert load_profile(path) == json.loads(json.dumps(profile))
+
+    llm = fake.LLM(score=lambda m: 6.0)
+    flow = ContextFlow(
+        scoring_model=llm,
+        summarizing_model=llm,
+        planner=Planner(local_max_messages=0, trim_ratio=0.0),
+        profile=path,
+    )
+    assert flow.recency.min_preserve == 1
+    assert flow.recency.preserve_tiers == [(9.0, 4)]
+
+    result = flow.optimize(conversation(30), "manual", max_token_count=300)
+    # Everything scores in the summarize band of the defaults
+    assert result["analytics"]["llm_usage"]["calls"] == 2
+    assert not result["messages"][0]["content"].startswith("Summary")